@@ -9,6 +9,8 @@ import dmapiclient
 from dmutils import init_app, flask_featureflags
 
 from config import configs
+from .validation import preload_schemas
+from . import query_stats
 
 bootstrap = Bootstrap()
 db = SQLAlchemy(metadata=MetaData(naming_convention={
@@ -35,6 +37,8 @@ def create_app(config_name):
         search_api_client=search_api_client
     )
 
+    query_stats.init_app(application)
+
     if not application.config['DM_API_AUTH_TOKENS']:
         raise Exception("No DM_API_AUTH_TOKENS provided")
 
@@ -42,6 +46,9 @@ def create_app(config_name):
         cf_services = json.loads(application.config['VCAP_SERVICES'])
         application.config['SQLALCHEMY_DATABASE_URI'] = cf_services['postgres'][0]['credentials']['uri']
 
+    if application.config['DM_PRELOAD_SCHEMAS']:
+        preload_schemas(application.config['DM_SCHEMA_BUNDLE_PATH'])
+
     from .main import main as main_blueprint
     application.register_blueprint(main_blueprint)
     from .status import status as status_blueprint
@@ -0,0 +1,43 @@
+"""
+Delta-encoded audit event payloads
+
+Autosaves of drafts, briefs and brief responses each record an audit event with the JSON
+that was saved, so an object edited many times has many near-identical copies of it. For
+those audit types (see `AuditEvent.DELTA_PAYLOAD_KEYS`) the payload is stored as a delta
+against the last event for the same object that has the full payload - a snapshot:
+
+    {"draftId": 1, "updateJsonDelta": {"snapshotId": 123, "sequence": 2,
+                                       "set": {"serviceName": "New name"}, "unset": []}}
+
+Deltas are against the snapshot rather than the previous event, so any event's payload can
+be rebuilt from two rows. A new snapshot is written after `DM_API_AUDIT_SNAPSHOT_INTERVAL`
+deltas, when the delta wouldn't be smaller than the payload, and in each new month, so a
+delta is always in the same audit_events partition as its snapshot and archiving a month
+(see app/audit_partitions.py) can't leave deltas that can't be rebuilt.
+
+Deltas are expanded when events are serialized, so API responses are unchanged.
+"""
+import json
+
+
+def delta_key(payload_key):
+    return '{}Delta'.format(payload_key)
+
+
+def payload_delta(snapshot, payload):
+    """The top-level keys of `payload` that are new or changed since `snapshot`, and those
+    that have been removed"""
+    return {
+        'set': dict((key, value) for key, value in payload.items() if key not in snapshot or snapshot[key] != value),
+        'unset': sorted(key for key in snapshot if key not in payload),
+    }
+
+
+def apply_payload_delta(snapshot, delta):
+    payload = dict((key, value) for key, value in snapshot.items() if key not in delta['unset'])
+    payload.update(delta['set'])
+    return payload
+
+
+def is_smaller(delta, payload):
+    return len(json.dumps(delta)) < len(json.dumps(payload))
@@ -0,0 +1,134 @@
+"""
+audit_events partitions
+
+audit_events is partitioned by month on created_at using table inheritance: each month's
+events are in an `audit_events_YYYY_MM` table that inherits from audit_events, with a CHECK
+constraint on its range, and a trigger on audit_events routes inserted rows to the right one
+(see migration 920). Events for a month that has no partition yet stay in audit_events itself
+until `create_partitions` creates it and moves them in.
+
+Queries on audit_events see the events in every partition. Filtering on created_at with
+constant bounds lets the planner skip the partitions that can't match.
+
+`archive_partitions` exports the partitions older than the retention period to gzipped CSV
+files and drops them.
+"""
+import gzip
+import os
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from . import db
+from .models import AuditEvent
+
+
+PARTITION_NAME_FORMAT = 'audit_events_%Y_%m'
+
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(month, months):
+    years, month_index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return datetime(years, month_index + 1, 1)
+
+
+def partition_name(month):
+    return month.strftime(PARTITION_NAME_FORMAT)
+
+
+def _bounds(month):
+    return "created_at >= '{:%Y-%m-%d}' AND created_at < '{:%Y-%m-%d}'".format(month, add_months(month, 1))
+
+
+def list_partitions():
+    """`(month, table name)` of each partition, oldest first"""
+    names = db.session.execute("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE parent.relname = 'audit_events'
+    """)
+
+    partitions = []
+    for name, in names:
+        try:
+            partitions.append((datetime.strptime(name, PARTITION_NAME_FORMAT), name))
+        except ValueError:
+            pass
+    return sorted(partitions)
+
+
+def _create_partition(month):
+    name = partition_name(month)
+    db.session.execute('CREATE TABLE {} (PRIMARY KEY (id), CHECK ({})) INHERITS (audit_events)'.format(
+        name, _bounds(month)))
+
+    # Partitions don't inherit indexes, so each one gets a copy of the audit_events ones
+    partition = sa.Table(name, sa.MetaData(), *[
+        sa.Column(column.name, column.type) for column in AuditEvent.__table__.columns
+    ])
+    for index in AuditEvent.__table__.indexes:
+        sa.Index(
+            index.name.replace('audit_events', name, 1),
+            *[partition.c[column.name] for column in index.columns]
+        ).create(db.session.connection())
+
+    # Move in any events inserted before the partition existed
+    db.session.execute('INSERT INTO {} SELECT * FROM ONLY audit_events WHERE {}'.format(name, _bounds(month)))
+    db.session.execute('DELETE FROM ONLY audit_events WHERE {}'.format(_bounds(month)))
+
+
+def create_partitions(months_ahead=3, now=None):
+    """Create partitions for this month and the next `months_ahead`, and for the months of
+    any events that are in audit_events itself because their partition didn't exist
+
+    Returns the names of the partitions created.
+    """
+    # Stop events being inserted into audit_events itself while their partition is created
+    db.session.execute('LOCK TABLE audit_events IN SHARE ROW EXCLUSIVE MODE')
+
+    this_month = month_start(now or datetime.utcnow())
+    months = set(add_months(this_month, n) for n in range(months_ahead + 1))
+    months.update(month for month, in db.session.execute(
+        "SELECT DISTINCT date_trunc('month', created_at) FROM ONLY audit_events"
+    ))
+
+    existing = set(month for month, _ in list_partitions())
+    created = []
+    for month in sorted(months - existing):
+        _create_partition(month)
+        created.append(partition_name(month))
+
+    db.session.commit()
+    return created
+
+
+def archive_partitions(archive_dir, retain_months, now=None):
+    """Export the partitions for months more than `retain_months` before this one to
+    `<archive_dir>/<partition name>.csv.gz` and drop them
+
+    Returns the paths of the exported files.
+    """
+    cutoff = add_months(month_start(now or datetime.utcnow()), -retain_months)
+
+    archived = []
+    for month, name in list_partitions():
+        if month >= cutoff:
+            break
+
+        # Events aren't added to past months, so the partition is exported before it's
+        # detached rather than holding a lock on audit_events for the whole export
+        path = os.path.join(archive_dir, '{}.csv.gz'.format(name))
+        with gzip.open(path, 'wb') as archive:
+            cursor = db.session.connection().connection.cursor()
+            cursor.copy_expert('COPY {} TO STDOUT WITH CSV HEADER'.format(name), archive)
+
+        db.session.execute('ALTER TABLE {} NO INHERIT audit_events'.format(name))
+        db.session.execute('DROP TABLE {}'.format(name))
+        db.session.commit()
+        archived.append(path)
+
+    return archived
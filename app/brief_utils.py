@@ -1,8 +1,8 @@
 from flask import abort
 
-from .models import Service
+from . import db
+from .models import Service, ServiceBriefEligibility, Supplier
 from .validation import get_validation_errors
-from .service_utils import filter_services
 
 
 def validate_brief_data(brief, enforce_required=True, required_fields=None):
@@ -25,14 +25,38 @@ def validate_brief_data(brief, enforce_required=True, required_fields=None):
         abort(400, errs)
 
 
-def get_supplier_service_eligible_for_brief(supplier, brief):
-    services = filter_services(
-        framework_slugs=[brief.framework.slug],
-        statuses=["published"],
-        lot_slug=brief.lot.slug,
-        role=brief.data["specialistRole"] if brief.lot.slug == "digital-specialists" else None
+def get_brief_role(brief):
+    """The specialist role a brief is for, or '' for briefs on other lots"""
+    return brief.data["specialistRole"] if brief.lot.slug == "digital-specialists" else ''
+
+
+def filter_brief_eligibility(query, brief):
+    return query.filter(
+        ServiceBriefEligibility.framework_id == brief.framework_id,
+        ServiceBriefEligibility.lot_id == brief.lot_id,
+        ServiceBriefEligibility.role == get_brief_role(brief),
+    )
+
+
+def get_services_eligible_for_brief(brief):
+    return filter_brief_eligibility(
+        Service.query.join(ServiceBriefEligibility, ServiceBriefEligibility.service_id == Service.id),
+        brief
     )
 
-    services = services.filter(Service.supplier_id == supplier.supplier_id)
 
-    return services.first()
+def get_supplier_service_eligible_for_brief(supplier, brief):
+    return get_services_eligible_for_brief(brief).filter(
+        ServiceBriefEligibility.supplier_id == supplier.supplier_id
+    ).first()
+
+
+def get_suppliers_eligible_for_brief(brief):
+    """Id and name of every supplier with a service that lets them respond to the brief"""
+    suppliers = db.session.query(
+        Supplier.supplier_id, Supplier.name
+    ).join(
+        ServiceBriefEligibility, ServiceBriefEligibility.supplier_id == Supplier.supplier_id
+    )
+
+    return filter_brief_eligibility(suppliers, brief).distinct().order_by(Supplier.supplier_id).all()
@@ -1,13 +1,95 @@
+"""
+Password hashing
+
+bcrypt is slow on purpose, and each hash ties up a gunicorn worker for the whole time it
+runs. To stop a burst of logins taking every worker on a host, hashing done while handling
+a request has to hold one of `DM_PASSWORD_HASHING_CONCURRENCY` slots, which are shared by
+all the processes on the host (they're `flock`s on files in `DM_PASSWORD_HASHING_LOCK_DIR`).
+If no slot frees up within `DM_PASSWORD_HASHING_TIMEOUT` seconds `PasswordHashingUnavailable`
+is raised, which is returned as a 503.
+"""
+import errno
+import fcntl
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from flask import current_app
 from flask.ext.bcrypt import generate_password_hash, \
     check_password_hash
 
 
+SLOT_POLL_INTERVAL = 0.01
+
+
+class PasswordHashingUnavailable(Exception):
+    pass
+
+
+def _try_lock(path):
+    slot = open(path, 'a')
+    try:
+        fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError as e:
+        slot.close()
+        if e.errno not in (errno.EAGAIN, errno.EACCES):
+            raise
+        return None
+    return slot
+
+
+@contextmanager
+def hashing_slot():
+    lock_dir = current_app.config['DM_PASSWORD_HASHING_LOCK_DIR'] or tempfile.gettempdir()
+    paths = [
+        os.path.join(lock_dir, 'dm-api-password-hashing-{}.lock'.format(n))
+        for n in range(current_app.config['DM_PASSWORD_HASHING_CONCURRENCY'])
+    ]
+    deadline = time.time() + current_app.config['DM_PASSWORD_HASHING_TIMEOUT']
+
+    # Start from a different slot in each process so they don't all contend for the first one
+    offset = os.getpid() % len(paths)
+    paths = paths[offset:] + paths[:offset]
+
+    while True:
+        for path in paths:
+            slot = _try_lock(path)
+            if slot is not None:
+                try:
+                    yield
+                finally:
+                    slot.close()
+                return
+
+        if time.time() >= deadline:
+            raise PasswordHashingUnavailable("Too many password hashing requests, try again later")
+        time.sleep(SLOT_POLL_INTERVAL)
+
+
 def authenticate_user(password, user):
-    return not user.locked and checkpw(password, user.password)
+    if user.locked:
+        return False
+    with hashing_slot():
+        return checkpw(password, user.password)
+
+
+def hash_user_password(password):
+    with hashing_slot():
+        return hashpw(password, current_app.config['DM_PASSWORD_HASH_ROUNDS'])
+
+
+def needs_rehash(hashed_password):
+    """Whether a bcrypt hash was made with a different cost than the one configured"""
+    try:
+        rounds = int(hashed_password.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return False
+    return rounds != current_app.config['DM_PASSWORD_HASH_ROUNDS']
 
 
-def hashpw(password):
-    return generate_password_hash(password, 10).decode('utf-8')
+def hashpw(password, rounds=10):
+    return generate_password_hash(password, rounds).decode('utf-8')
 
 
 def checkpw(password, hashed_password):
@@ -0,0 +1,170 @@
+"""
+Process-wide cache of frameworks and their lots
+
+There are only a handful of frameworks and they rarely change, but most requests look one
+up by slug. The registry loads all of them (with their lots) in one query and serves
+lookups from memory until either:
+
+* a framework, lot or framework lot is changed through the ORM and committed in this
+  process, which clears the cache and sends a `NOTIFY` on the `dm_framework_registry`
+  channel in the same transaction
+* a listener thread, started on first use when `DM_FRAMEWORK_REGISTRY_LISTEN` is set,
+  receives that notification from another worker or node
+* the cache is older than `DM_FRAMEWORK_REGISTRY_TTL` seconds, in case a notification was
+  missed or a framework was changed outside the ORM (eg by a migration)
+
+Lookups return copies merged into the current session, so they can be used in relationships
+and queries like any other object. The JSON columns are shared with the cached copy and
+must not be changed in place; `update_framework` loads the framework from the database.
+"""
+import os
+import select
+import threading
+import time
+from itertools import chain
+
+from flask import abort, current_app
+from sqlalchemy import event, orm
+
+from . import db
+from .models import Framework, FrameworkLot, Lot
+
+
+CHANNEL = 'dm_framework_registry'
+LISTENER_RETRY_DELAY = 5
+
+
+class FrameworkRegistry(object):
+    def __init__(self):
+        self._frameworks = None
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def clear(self):
+        self._frameworks = None
+
+    def _load(self):
+        session = orm.Session(bind=db.get_engine(current_app))
+        try:
+            frameworks = session.query(Framework).options(orm.joinedload(Framework.lots)).all()
+        finally:
+            session.close()
+
+        return time.time(), {framework.slug: framework for framework in frameworks}
+
+    def frameworks(self):
+        """Return a dict of detached frameworks by slug, reloading them if needed"""
+        self._start_listener()
+
+        cached = self._frameworks
+        if cached is None or time.time() - cached[0] >= current_app.config['DM_FRAMEWORK_REGISTRY_TTL']:
+            cached = self._load()
+            self._frameworks = cached
+
+        return cached[1]
+
+    def _start_listener(self):
+        if not current_app.config['DM_FRAMEWORK_REGISTRY_LISTEN'] or self._listener_pid == os.getpid():
+            return
+
+        with self._lock:
+            # Threads don't survive a fork, so each worker process starts its own listener
+            if self._listener_pid != os.getpid():
+                listener = threading.Thread(
+                    target=self._listen, args=(current_app._get_current_object(),), name='framework-registry'
+                )
+                listener.daemon = True
+                listener.start()
+                self._listener_pid = os.getpid()
+
+    def _listen(self, app):
+        while True:
+            connection = None
+            try:
+                with app.app_context():
+                    connection = db.get_engine(app).raw_connection()
+                connection.detach()
+                connection.connection.autocommit = True
+                connection.cursor().execute('LISTEN {}'.format(CHANNEL))
+
+                # Anything changed while we weren't listening
+                self.clear()
+
+                while True:
+                    if select.select([connection.connection], [], [], 60) == ([], [], []):
+                        continue
+                    connection.connection.poll()
+                    if connection.connection.notifies:
+                        del connection.connection.notifies[:]
+                        self.clear()
+            except Exception:
+                app.logger.exception('Framework registry listener failed, retrying')
+                self.clear()
+                time.sleep(LISTENER_RETRY_DELAY)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+registry = FrameworkRegistry()
+
+
+def _is_framework_change(obj):
+    return isinstance(obj, (Framework, Lot, FrameworkLot))
+
+
+def _framework_changed(session):
+    if not session.info.get('framework_registry_changed'):
+        session.info['framework_registry_changed'] = True
+        session.execute('NOTIFY {}'.format(CHANNEL))
+
+
+@event.listens_for(orm.Session, 'before_flush')
+def _notify_framework_changes(session, flush_context, instances):
+    if any(_is_framework_change(obj) for obj in chain(session.new, session.dirty, session.deleted)):
+        _framework_changed(session)
+
+
+@event.listens_for(orm.Session, 'after_bulk_update')
+@event.listens_for(orm.Session, 'after_bulk_delete')
+def _notify_framework_bulk_changes(context):
+    if context.mapper is not None and issubclass(context.mapper.class_, (Framework, Lot, FrameworkLot)):
+        _framework_changed(context.session)
+
+
+@event.listens_for(orm.Session, 'after_commit')
+def _clear_after_commit(session):
+    if session.info.pop('framework_registry_changed', False):
+        registry.clear()
+
+
+@event.listens_for(orm.Session, 'after_soft_rollback')
+def _forget_rolled_back_changes(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('framework_registry_changed', None)
+
+
+def get_frameworks():
+    return [
+        db.session.merge(framework, load=False)
+        for framework in sorted(registry.frameworks().values(), key=lambda framework: framework.id)
+    ]
+
+
+def get_framework(slug):
+    framework = registry.frameworks().get(slug)
+    if framework is not None:
+        return db.session.merge(framework, load=False)
+
+
+def get_framework_or_404(slug):
+    framework = get_framework(slug)
+    if framework is None:
+        abort(404)
+    return framework
+
+
+def get_framework_by_id(framework_id):
+    for framework in registry.frameworks().values():
+        if framework.id == framework_id:
+            return db.session.merge(framework, load=False)
@@ -0,0 +1,118 @@
+"""
+Framework application stats
+
+`GET /frameworks/<slug>/stats` reads draft service and supplier counts from the
+`framework_draft_stats` and `framework_supplier_stats` tables, which database triggers keep
+up to date as drafts and declarations change (see migration 890).
+
+`reconcile_framework_stats` recomputes the counts from the `draft_services` and
+`supplier_frameworks` tables and replaces the stored ones, reporting any that had drifted
+(eg if the tables were changed with triggers disabled, or rows were inserted concurrently
+with the supplier's declaration being created).
+"""
+from sqlalchemy import and_, func
+
+from . import db
+from .models import DraftService, FrameworkDraftStats, FrameworkSupplierStats, SupplierFramework
+
+
+def _declaration_status():
+    return func.coalesce(SupplierFramework.declaration['status'].astext, '')
+
+
+def _expected_draft_stats(framework_ids):
+    query = db.session.query(
+        DraftService.framework_id, DraftService.lot_id, DraftService.status, _declaration_status(), func.count()
+    ).join(
+        SupplierFramework, and_(
+            SupplierFramework.supplier_id == DraftService.supplier_id,
+            SupplierFramework.framework_id == DraftService.framework_id,
+        )
+    ).filter(
+        SupplierFramework.declaration.isnot(None)
+    ).group_by(
+        DraftService.framework_id, DraftService.lot_id, DraftService.status, _declaration_status()
+    )
+    if framework_ids is not None:
+        query = query.filter(DraftService.framework_id.in_(framework_ids))
+
+    return {tuple(row[:-1]): row[-1] for row in query}
+
+
+def _expected_supplier_stats(framework_ids):
+    completed_drafts = db.session.query(
+        DraftService.supplier_id, DraftService.framework_id
+    ).filter(
+        DraftService.status == 'submitted'
+    ).distinct().subquery('completed_drafts')
+
+    has_completed_services = completed_drafts.c.supplier_id.isnot(None)
+
+    query = db.session.query(
+        SupplierFramework.framework_id, _declaration_status(), has_completed_services, func.count()
+    ).outerjoin(
+        completed_drafts, and_(
+            completed_drafts.c.supplier_id == SupplierFramework.supplier_id,
+            completed_drafts.c.framework_id == SupplierFramework.framework_id,
+        )
+    ).filter(
+        SupplierFramework.declaration.isnot(None)
+    ).group_by(
+        SupplierFramework.framework_id, _declaration_status(), has_completed_services
+    )
+    if framework_ids is not None:
+        query = query.filter(SupplierFramework.framework_id.in_(framework_ids))
+
+    return {tuple(row[:-1]): row[-1] for row in query}
+
+
+def _recorded_stats(model, key_columns, count_column, framework_ids):
+    query = db.session.query(model)
+    if framework_ids is not None:
+        query = query.filter(model.framework_id.in_(framework_ids))
+
+    return {
+        tuple(getattr(stats, column) for column in key_columns): getattr(stats, count_column)
+        for stats in query
+        if getattr(stats, count_column) != 0
+    }
+
+
+def reconcile_framework_stats(framework_ids=None, dry_run=False):
+    """Recompute the stats for the given frameworks (or all of them) and replace the stored ones
+
+    Returns a list of `(table name, key, recorded count, expected count)` for each count
+    that was wrong. With `dry_run` the stored stats are left unchanged.
+    """
+    # Stop the triggers changing the counts until we're done. Waiting for the lock also
+    # waits for transactions that have already changed them, so we see their changes
+    db.session.execute('LOCK TABLE framework_draft_stats, framework_supplier_stats IN SHARE ROW EXCLUSIVE MODE')
+
+    drift = []
+    for model, key_columns, count_column, expected in [
+        (FrameworkDraftStats, ['framework_id', 'lot_id', 'draft_status', 'declaration_status'], 'draft_count',
+         _expected_draft_stats(framework_ids)),
+        (FrameworkSupplierStats, ['framework_id', 'declaration_status', 'has_completed_services'], 'supplier_count',
+         _expected_supplier_stats(framework_ids)),
+    ]:
+        recorded = _recorded_stats(model, key_columns, count_column, framework_ids)
+        for key in sorted(set(recorded) | set(expected)):
+            if recorded.get(key, 0) != expected.get(key, 0):
+                drift.append((model.__tablename__, key, recorded.get(key, 0), expected.get(key, 0)))
+
+        if not dry_run:
+            query = model.query
+            if framework_ids is not None:
+                query = query.filter(model.framework_id.in_(framework_ids))
+            query.delete(synchronize_session=False)
+
+            db.session.bulk_insert_mappings(model, [
+                dict(zip(key_columns, key), **{count_column: count}) for key, count in expected.items()
+            ])
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+    return drift
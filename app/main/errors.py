@@ -1,6 +1,7 @@
 from flask import jsonify
 
 from . import main
+from ..encryption import PasswordHashingUnavailable
 from ..models import ValidationError
 
 
@@ -9,6 +10,11 @@ def validatation_error(e):
     return jsonify(error=e.message), 400
 
 
+@main.app_errorhandler(PasswordHashingUnavailable)
+def password_hashing_unavailable(e):
+    return jsonify(error=str(e)), 503, [('Retry-After', '1')]
+
+
 def generic_error_handler(e):
     # TODO: log the error
     headers = []
@@ -3,8 +3,9 @@ from flask import jsonify, abort
 from .. import main
 from sqlalchemy.exc import IntegrityError
 from dmapiclient.audit import AuditTypes
+from ...framework_registry import get_framework_or_404
 from ...models import (
-    AuditEvent, db, Framework, FrameworkAgreement, SupplierFramework, User
+    AuditEvent, db, FrameworkAgreement, SupplierFramework, User
 )
 
 from ...utils import (
@@ -38,9 +39,7 @@ def create_framework_agreement():
             )
         )
 
-    framework = Framework.query.filter(
-        Framework.slug == update_json['frameworkSlug']
-    ).first_or_404()
+    framework = get_framework_or_404(update_json['frameworkSlug'])
 
     framework_agreement = FrameworkAgreement(
         supplier_id=update_json['supplierId'],
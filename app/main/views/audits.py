@@ -1,10 +1,12 @@
-from flask import jsonify, abort, request, current_app
+from collections import defaultdict
+from flask import json, jsonify, abort, request, current_app
 from datetime import datetime, timedelta
-from ...models import AuditEvent
-from sqlalchemy import asc, desc, Date, cast
+from six import integer_types, string_types, text_type
+from ...models import AuditEvent, load_audit_snapshots
+from sqlalchemy import asc, desc, inspect, Date, cast
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql.expression import true, false
-from ...utils import pagination_links, get_valid_page_or_1
+from ...utils import pagination_links, get_valid_page_or_1, is_keyset_pagination_request, keyset_paginate
 from .. import main
 from ... import db, models
 from dmapiclient.audit import AuditTypes
@@ -31,6 +33,32 @@ AUDIT_OBJECT_ID_FIELDS = {
 }
 
 
+def _identified_by_primary_key(object_type):
+    return AUDIT_OBJECT_ID_FIELDS[object_type].property.columns[0].primary_key
+
+
+def _coerce_object_id(object_type, object_id):
+    """`object_id` as the Python type of the object type's id column, so it can be compared
+    with it in SQL, or a 400 if it can't be converted"""
+    python_type = AUDIT_OBJECT_ID_FIELDS[object_type].property.columns[0].type.python_type
+    try:
+        if issubclass(python_type, integer_types):
+            return int(object_id)
+        return text_type(object_id)
+    except ValueError:
+        abort(400, "invalid object ID supplied: {}".format(object_id))
+
+
+def _get_object_primary_key(object_type, object_id):
+    """Look up the primary key (as stored in `AuditEvent.object_id`) of the object with the
+    given id, or None if there isn't one"""
+    model = AUDIT_OBJECT_TYPES[object_type]
+    primary_key, = inspect(model).primary_key
+    object_id = _coerce_object_id(object_type, object_id)
+
+    return db.session.query(primary_key).filter(AUDIT_OBJECT_ID_FIELDS[object_type] == object_id).scalar()
+
+
 @main.route('/audit-events', methods=['GET'])
 def list_audits():
     page = get_valid_page_or_1()
@@ -38,19 +66,22 @@ def list_audits():
         per_page = int(request.args.get('per_page', current_app.config['DM_API_SERVICES_PAGE_SIZE']))
     except ValueError:
         abort(400, 'invalid page size supplied')
+    if per_page < 1:
+        abort(400, 'invalid page size supplied')
 
+    latest_first = convert_to_boolean(request.args.get('latest_first'))
     audits = AuditEvent.query.order_by(
-        desc(AuditEvent.created_at)
-        if convert_to_boolean(request.args.get('latest_first'))
-        else asc(AuditEvent.created_at)
+        desc(AuditEvent.created_at) if latest_first else asc(AuditEvent.created_at)
     )
 
     audit_date = request.args.get('audit-date', None)
     if audit_date:
         if is_valid_date(audit_date):
             audit_datetime = datetime.strptime(audit_date, DATE_FORMAT)
+            # A half-open range of constants, so only the partition for that month is scanned
             audits = audits.filter(
-                AuditEvent.created_at.between(audit_datetime, audit_datetime + timedelta(days=1))
+                AuditEvent.created_at >= audit_datetime,
+                AuditEvent.created_at < audit_datetime + timedelta(days=1),
             )
         else:
             abort(400, 'invalid audit date supplied')
@@ -86,27 +117,41 @@ def list_audits():
         if not object_id:
             abort(400, 'object-type cannot be provided without object-id')
         model = AUDIT_OBJECT_TYPES[object_type]
-        id_field = AUDIT_OBJECT_ID_FIELDS[object_type]
-
-        ref_object = model.query.filter(
-            id_field == object_id
-        ).first()
-
-        if ref_object is None:
-            abort(404, "Object with given object-type and object-id doesn't exist")
+        if _identified_by_primary_key(object_type):
+            # No need to look the object up, an id that doesn't exist just has no events
+            try:
+                object_pk = int(object_id)
+            except ValueError:
+                abort(400, 'invalid object-id supplied')
+        else:
+            object_pk = _get_object_primary_key(object_type, object_id)
+            if object_pk is None:
+                abort(404, "Object with given object-type and object-id doesn't exist")
 
-        audits = audits.filter(AuditEvent.object == ref_object)
+        # The same condition as `AuditEvent.object == <object>`, without having to load it
+        audits = audits.filter(AuditEvent.object_type == model.__name__, AuditEvent.object_id == object_pk)
 
     elif object_id:
         abort(400, 'object-id cannot be provided without object-type')
 
-    audits = audits.paginate(
-        page=page,
-        per_page=per_page
-    )
+    if is_keyset_pagination_request():
+        audits = keyset_paginate(
+            audits,
+            [AuditEvent.created_at, AuditEvent.id],
+            after=request.args['after'],
+            per_page=per_page,
+            descending=latest_first,
+        )
+    else:
+        audits = audits.paginate(
+            page=page,
+            per_page=per_page
+        )
+
+    snapshots = load_audit_snapshots(audits.items)
 
     return jsonify(
-        auditEvents=[audit.serialize() for audit in audits.items],
+        auditEvents=[audit.serialize(snapshots=snapshots) for audit in audits.items],
         links=pagination_links(
             audits,
             '.list_audits',
@@ -115,40 +160,71 @@ def list_audits():
     )
 
 
-@main.route('/audit-events', methods=['POST'])
-def create_audit_event():
-    json_payload = get_json_from_request()  # TODO test
-    json_has_required_keys(json_payload, ['auditEvents'])  # TODO test
-    audit_event_data = json_payload['auditEvents']
+def _validate_audit_event(audit_event_data):
     json_has_required_keys(audit_event_data, ["type", "data"])
 
     if 'objectType' not in audit_event_data:
         if 'objectId' in audit_event_data:
             abort(400, "object ID cannot be provided without an object type")
-        db_object = None
     else:
         if audit_event_data['objectType'] not in AUDIT_OBJECT_TYPES:
             abort(400, "invalid object type supplied")
         if 'objectId' not in audit_event_data:
             abort(400, "object type cannot be provided without an object ID")
-        model = AUDIT_OBJECT_TYPES[audit_event_data['objectType']]
-        id_field = AUDIT_OBJECT_ID_FIELDS[audit_event_data['objectType']]
-        db_objects = model.query.filter(
-            id_field == audit_event_data['objectId']
-        ).all()
-        if len(db_objects) != 1:
-            abort(400, "referenced object does not exist")
-        else:
-            db_object = db_objects[0]
+        object_id = audit_event_data['objectId']
+        if not isinstance(object_id, string_types + integer_types) or isinstance(object_id, bool):
+            abort(400, "object ID must be a string or an integer")
 
     if not AuditTypes.is_valid_audit_type(audit_event_data['type']):
         abort(400, "invalid audit type supplied")
 
+
+def _get_bulk_audit_events_from_request():
+    """The events in a bulk request body, either a JSON array (optionally as `auditEvents`)
+    or NDJSON with an event on each line"""
+    if request.content_type == 'application/x-ndjson':
+        audit_events = []
+        for line_number, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                audit_events.append(json.loads(line))
+            except ValueError:
+                abort(400, "Invalid JSON on line {}".format(line_number))
+    else:
+        audit_events = get_json_from_request()
+        if isinstance(audit_events, dict):
+            json_has_required_keys(audit_events, ['auditEvents'])
+            audit_events = audit_events['auditEvents']
+
+    if not isinstance(audit_events, list) or not audit_events:
+        abort(400, "auditEvents must be a non-empty list")
+    if not all(isinstance(audit_event_data, dict) for audit_event_data in audit_events):
+        abort(400, "each audit event must be a JSON object")
+
+    return audit_events
+
+
+@main.route('/audit-events', methods=['POST'])
+def create_audit_event():
+    json_payload = get_json_from_request()  # TODO test
+    json_has_required_keys(json_payload, ['auditEvents'])  # TODO test
+    audit_event_data = json_payload['auditEvents']
+    _validate_audit_event(audit_event_data)
+
+    if 'objectType' in audit_event_data:
+        object_pk = _get_object_primary_key(audit_event_data['objectType'], audit_event_data['objectId'])
+        if object_pk is None:
+            abort(400, "referenced object does not exist")
+
     audit_event = AuditEvent(
         audit_type=AuditTypes[audit_event_data['type']],
         user=audit_event_data.get('user'),
         data=audit_event_data['data'],
-        db_object=db_object)
+        db_object=None)
+    if 'objectType' in audit_event_data:
+        audit_event.object_type = AUDIT_OBJECT_TYPES[audit_event_data['objectType']].__name__
+        audit_event.object_id = object_pk
 
     db.session.add(audit_event)
     db.session.commit()
@@ -156,6 +232,76 @@ def create_audit_event():
     return jsonify(auditEvents=audit_event.serialize()), 201
 
 
+@main.route('/audit-events/bulk', methods=['POST'])
+def create_audit_events():
+    """Create a batch of audit events in one transaction
+
+    Takes the same events as `POST /audit-events`. The referenced objects are looked up with
+    one query per object type, and the events are written with a single multi-row INSERT.
+    """
+    audit_events = _get_bulk_audit_events_from_request()
+
+    limit = current_app.config['DM_API_AUDIT_EVENTS_BULK_LIMIT']
+    if len(audit_events) > limit:
+        abort(400, "Cannot create more than {} audit events in one request".format(limit))
+
+    for audit_event_data in audit_events:
+        _validate_audit_event(audit_event_data)
+
+    # JSON ids may be numbers or strings, so they're converted to the type of the id column,
+    # both to compare them with it in SQL and to match them with the ids found
+    object_ids = defaultdict(set)
+    for audit_event_data in audit_events:
+        if 'objectType' in audit_event_data:
+            object_type = audit_event_data['objectType']
+            object_ids[object_type].add(_coerce_object_id(object_type, audit_event_data['objectId']))
+
+    object_pks = {}
+    for object_type, type_object_ids in object_ids.items():
+        id_field = AUDIT_OBJECT_ID_FIELDS[object_type]
+        primary_key, = inspect(AUDIT_OBJECT_TYPES[object_type]).primary_key
+        for object_id, object_pk in db.session.query(id_field, primary_key).filter(id_field.in_(type_object_ids)):
+            object_pks[(object_type, object_id)] = object_pk
+
+    now = datetime.utcnow()
+    rows = []
+    for audit_event_data in audit_events:
+        object_type = object_pk = None
+        if 'objectType' in audit_event_data:
+            object_type = AUDIT_OBJECT_TYPES[audit_event_data['objectType']].__name__
+            object_pk = object_pks.get((
+                audit_event_data['objectType'],
+                _coerce_object_id(audit_event_data['objectType'], audit_event_data['objectId'])
+            ))
+            if object_pk is None:
+                abort(400, "referenced object does not exist: {} {}".format(
+                    audit_event_data['objectType'], audit_event_data['objectId']))
+
+        rows.append({
+            'type': AuditTypes[audit_event_data['type']].value,
+            'created_at': now,
+            'user': audit_event_data.get('user'),
+            'data': audit_event_data['data'],
+            'object_type': object_type,
+            'object_id': object_pk,
+            'acknowledged': False,
+        })
+
+    # Inserts into audit_events are routed to a partition by a trigger, so `RETURNING`
+    # doesn't return anything: the ids are taken from the sequence up front instead
+    ids = sorted(event_id for event_id, in db.session.execute(
+        "SELECT nextval(pg_get_serial_sequence('audit_events', 'id')) FROM generate_series(1, :count)",
+        {'count': len(rows)}
+    ))
+    for event_id, row in zip(ids, rows):
+        row['id'] = event_id
+
+    db.session.execute(AuditEvent.__table__.insert().values(rows))
+    db.session.commit()
+
+    return jsonify(auditEventIds=ids), 201
+
+
 @main.route('/audit-events/<int:audit_id>/acknowledge', methods=['POST'])
 def acknowledge_audit(audit_id):
     updater_json = validate_and_return_updater_request()
@@ -13,7 +13,7 @@ from ...utils import (
     validate_and_return_updater_request, get_request_page_questions
 )
 
-from ...brief_utils import get_supplier_service_eligible_for_brief
+from ...brief_utils import get_brief_role, get_supplier_service_eligible_for_brief
 from ...service_utils import validate_and_return_supplier
 
 
@@ -57,7 +57,7 @@ def create_brief_response():
         brief=brief,
     )
 
-    brief_role = brief.data["specialistRole"] if brief.lot.slug == "digital-specialists" else None
+    brief_role = get_brief_role(brief)
     service_max_day_rate = brief_service.data[brief_role + "PriceMax"] if brief_role else None
 
     brief_response.validate(enforce_required=False, required_fields=page_questions, max_day_rate=service_max_day_rate)
@@ -110,7 +110,7 @@ def update_brief_response(brief_response_id):
     if brief.framework.status not in ['live', 'expired']:
         abort(400, "Brief framework must be live or expired")
 
-    brief_role = brief.data["specialistRole"] if brief.lot.slug == "digital-specialists" else None
+    brief_role = get_brief_role(brief)
     service_max_day_rate = brief_service.data[brief_role + "PriceMax"] if brief_role else None
 
     brief_response.update_from_json(brief_response_json)
@@ -126,6 +126,7 @@ def update_brief_response(brief_response_id):
         },
         db_object=brief_response,
     )
+    audit.encode_payload_delta()
 
     db.session.add(brief_response)
     db.session.add(audit)
@@ -159,7 +160,7 @@ def submit_brief_response(brief_response_id):
     if brief.framework.status not in ['live', 'expired']:
         abort(400, "Brief framework must be live or expired")
 
-    brief_role = brief.data["specialistRole"] if brief.lot.slug == "digital-specialists" else None
+    brief_role = get_brief_role(brief)
     service_max_day_rate = brief_service.data[brief_role + "PriceMax"] if brief_role else None
 
     brief_response.validate(max_day_rate=service_max_day_rate)
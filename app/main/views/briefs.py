@@ -1,4 +1,5 @@
 from flask import jsonify, abort, current_app, request
+from sqlalchemy import orm
 from sqlalchemy.exc import IntegrityError
 
 from dmapiclient.audit import AuditTypes
@@ -7,10 +8,13 @@ from ... import db
 from ...models import User, Brief, AuditEvent, Framework, Lot, Supplier, Service
 from ...utils import (
     get_json_from_request, get_int_or_400, json_has_required_keys, pagination_links,
-    get_valid_page_or_1, get_request_page_questions, validate_and_return_updater_request
+    get_valid_page_or_1, get_request_page_questions, validate_and_return_updater_request,
+    is_keyset_pagination_request, keyset_paginate
+)
+from ...service_utils import validate_and_return_lot
+from ...brief_utils import (
+    get_services_eligible_for_brief, get_suppliers_eligible_for_brief, validate_brief_data
 )
-from ...service_utils import validate_and_return_lot, filter_services
-from ...brief_utils import validate_brief_data
 
 
 @main.route('/briefs', methods=['POST'])
@@ -90,6 +94,7 @@ def update_brief(brief_id):
         },
         db_object=brief,
     )
+    audit.encode_payload_delta()
 
     db.session.add(brief)
     db.session.add(audit)
@@ -117,6 +122,13 @@ def list_briefs():
     page = get_valid_page_or_1()
 
     with_users = request.args.get('with_users', 'false').lower() == 'true'
+    summary = request.args.get('summary', 'false').lower() == 'true'
+
+    # Load the collections serialize() reads for the whole page at once rather than per brief
+    if with_users:
+        briefs = briefs.options(orm.subqueryload(Brief.users))
+    if not summary:
+        briefs = briefs.options(orm.subqueryload(Brief.clarification_questions))
 
     user_id = get_int_or_400(request.args, 'user_id')
 
@@ -140,9 +152,28 @@ def list_briefs():
 
     if user_id:
         return jsonify(
-            briefs=[brief.serialize(with_users) for brief in briefs.all()],
+            briefs=[brief.serialize(with_users, with_clarification_questions=not summary) for brief in briefs.all()],
             links={},
         )
+    elif is_keyset_pagination_request():
+        if request.args.get('human'):
+            abort(400, "'after' cannot be used with 'human' ordering")
+
+        briefs = keyset_paginate(
+            briefs,
+            [Brief.id],
+            after=request.args['after'],
+            per_page=current_app.config['DM_API_BRIEFS_PAGE_SIZE'],
+        )
+
+        return jsonify(
+            briefs=[brief.serialize(with_users, with_clarification_questions=not summary) for brief in briefs.items],
+            links=pagination_links(
+                briefs,
+                '.list_briefs',
+                request.args
+            ),
+        )
     else:
         briefs = briefs.paginate(
             page=page,
@@ -150,7 +181,7 @@ def list_briefs():
         )
 
         return jsonify(
-            briefs=[brief.serialize(with_users) for brief in briefs.items],
+            briefs=[brief.serialize(with_users, with_clarification_questions=not summary) for brief in briefs.items],
             meta={
                 "total": briefs.total,
             },
@@ -322,13 +353,21 @@ def list_brief_services(brief_id):
         Supplier.supplier_id == supplier_id
     ).first_or_404()
 
-    services = filter_services(
-        framework_slugs=[brief.framework.slug],
-        statuses=["published"],
-        lot_slug=brief.lot.slug,
-        role=brief.data["specialistRole"] if brief.lot.slug == "digital-specialists" else None
-    )
-
-    services = services.filter(Service.supplier_id == supplier.supplier_id)
+    services = get_services_eligible_for_brief(brief).filter(Service.supplier_id == supplier.supplier_id)
 
     return jsonify(services=[service.serialize() for service in services])
+
+
+@main.route("/briefs/<int:brief_id>/eligible-suppliers", methods=["GET"])
+def list_brief_eligible_suppliers(brief_id):
+    """Every supplier with a published service that lets them respond to the brief"""
+    brief = Brief.query.filter(
+        Brief.id == brief_id
+    ).filter(
+        Brief.status != "draft"
+    ).first_or_404()
+
+    return jsonify(suppliers=[
+        {'id': supplier_id, 'name': name}
+        for supplier_id, name in get_suppliers_eligible_for_brief(brief)
+    ])
@@ -8,7 +8,8 @@ from .. import main
 from ... import db, isolation_level
 from ...utils import json_only_has_required_keys
 from ...validation import is_valid_service_id_or_400
-from ...models import Service, DraftService, Supplier, AuditEvent, Framework
+from ...framework_registry import get_framework
+from ...models import Service, DraftService, Supplier, AuditEvent
 from ...utils import (
     validate_and_return_updater_request,
     get_request_page_questions, get_int_or_400,
@@ -101,6 +102,7 @@ def edit_draft_service(draft_id):
         },
         db_object=draft
     )
+    audit.encode_payload_delta()
 
     db.session.add(draft)
     db.session.add(audit)
@@ -136,9 +138,7 @@ def list_draft_services():
         services = services.filter(DraftService.service_id == service_id)
 
     if framework_slug:
-        framework = Framework.query.filter(
-            Framework.slug == framework_slug
-        ).first()
+        framework = get_framework(framework_slug)
         if not framework:
             abort(404, "framework '{}' not found".format(framework_slug))
         services = services.filter(DraftService.framework_id == framework.id)
@@ -243,6 +243,7 @@ def publish_draft_service(draft_id):
     else:
         service_from_draft = create_service_from_draft(draft, "published")
 
+    index_service(service_from_draft)
     commit_and_archive_service(service_from_draft, update_details,
                                AuditTypes.publish_draft_service,
                                audit_data={'draftId': draft_id})
@@ -262,8 +263,6 @@ def publish_draft_service(draft_id):
                 extra=dict(
                     action=action, draft_id=draft_id, service_id=service_from_draft.service_id, error=e.message)))
 
-    index_service(service_from_draft)
-
     return jsonify(services=service_from_draft.serialize()), 200
 
 
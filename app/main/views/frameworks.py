@@ -1,25 +1,28 @@
 from flask import jsonify, abort, request
 from sqlalchemy.types import String
 from sqlalchemy.exc import IntegrityError, DataError
-from sqlalchemy import func, orm, case, cast
+from sqlalchemy import func, orm, cast
+from collections import Counter
 import datetime
 
 from dmapiclient.audit import AuditTypes
 from dmutils.config import convert_to_boolean
 from .. import main
 from ...models import (
-    db, Framework, DraftService, User, Supplier, SupplierFramework, AuditEvent, Lot, FrameworkAgreement
+    db, Framework, User, SupplierFramework, AuditEvent, Lot, FrameworkAgreement,
+    FrameworkDraftStats, FrameworkSupplierStats
 )
 from ...utils import (
     get_json_from_request, json_has_required_keys, json_only_has_required_keys,
     validate_and_return_updater_request,
 )
+from ...framework_registry import get_framework_or_404, get_frameworks
 from ...framework_utils import validate_framework_agreement_details_data
 
 
 @main.route('/frameworks', methods=['GET'])
 def list_frameworks():
-    frameworks = Framework.query.all()
+    frameworks = get_frameworks()
 
     return jsonify(
         frameworks=[f.serialize() for f in frameworks]
@@ -71,9 +74,7 @@ def create_framework():
 
 @main.route('/frameworks/<string:framework_slug>', methods=['GET'])
 def get_framework(framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     return jsonify(frameworks=framework.serialize())
 
@@ -131,49 +132,34 @@ def update_framework(framework_slug):
 
 @main.route('/frameworks/<string:framework_slug>/stats', methods=['GET'])
 def get_framework_stats(framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     seven_days_ago = datetime.datetime.utcnow() + datetime.timedelta(-7)
 
-    has_completed_drafts_query = db.session.query(
-        DraftService.supplier_id, func.min(DraftService.id)
-    ).filter(
-        DraftService.framework_id == framework.id,
-        DraftService.status == 'submitted'
-    ).group_by(
-        DraftService.supplier_id
-    ).subquery('completed_drafts')
-
-    drafts_alias = orm.aliased(DraftService, has_completed_drafts_query)
-
     def label_columns(labels, query):
         return [
             dict(zip(labels, item))
             for item in sorted(query, key=lambda x: list(map(str, x)))
         ]
 
-    is_declaration_complete = case([
-        (SupplierFramework.declaration['status'].astext == 'complete', True)
-    ], else_=False)
+    # Draft and supplier counts are maintained by triggers, see app/framework_stats.py
+    lot_slugs = {lot.id: lot.slug for lot in framework.lots}
+    draft_counts = Counter()
+    for stats in FrameworkDraftStats.query.filter(FrameworkDraftStats.framework_id == framework.id):
+        draft_counts[
+            stats.draft_status, lot_slugs[stats.lot_id], stats.declaration_status == 'complete'
+        ] += stats.draft_count
+
+    supplier_counts = Counter()
+    for stats in FrameworkSupplierStats.query.filter(FrameworkSupplierStats.framework_id == framework.id):
+        supplier_counts[
+            stats.declaration_status or None, stats.has_completed_services
+        ] += stats.supplier_count
 
     return jsonify({
         'services': label_columns(
             ['status', 'lot', 'declaration_made', 'count'],
-            db.session.query(
-                DraftService.status, Lot.slug, is_declaration_complete, func.count()
-            ).outerjoin(
-                SupplierFramework, DraftService.supplier_id == SupplierFramework.supplier_id
-            ).join(
-                Lot, DraftService.lot_id == Lot.id
-            ).group_by(
-                DraftService.status, Lot.slug, is_declaration_complete
-            ).filter(
-                SupplierFramework.framework_id == framework.id,
-                DraftService.framework_id == framework.id,
-                SupplierFramework.declaration.isnot(None)
-            ).all()
+            [key + (count,) for key, count in draft_counts.items() if count > 0]
         ),
         'supplier_users': label_columns(
             ['recent_login', 'count'],
@@ -187,30 +173,14 @@ def get_framework_stats(framework_slug):
         ),
         'interested_suppliers': label_columns(
             ['declaration_status', 'has_completed_services', 'count'],
-            db.session.query(
-                SupplierFramework.declaration['status'].astext,
-                drafts_alias.supplier_id.isnot(None), func.count()
-            ).select_from(
-                Supplier
-            ).join(
-                SupplierFramework
-            ).outerjoin(
-                drafts_alias
-            ).filter(
-                SupplierFramework.framework_id == framework.id,
-                SupplierFramework.declaration.isnot(None)
-            ).group_by(
-                SupplierFramework.declaration['status'].astext, drafts_alias.supplier_id.isnot(None)
-            ).all()
+            [key + (count,) for key, count in supplier_counts.items() if count > 0]
         )
     })
 
 
 @main.route('/frameworks/<string:framework_slug>/suppliers', methods=['GET'])
 def get_framework_suppliers(framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     # we're going to need an "alias" for the current_framework_agreement join
     # so that we can refer to it in later clauses
@@ -262,9 +232,7 @@ def get_framework_suppliers(framework_slug):
 
 @main.route('/frameworks/<string:framework_slug>/interest', methods=['GET'])
 def get_framework_interest(framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     supplier_frameworks = SupplierFramework.query.filter(
         SupplierFramework.framework_id == framework.id
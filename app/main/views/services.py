@@ -1,23 +1,29 @@
 from dmapiclient.audit import AuditTypes
 
-from flask import jsonify, abort, request, current_app
+from flask import json, jsonify, abort, request, current_app, Response, stream_with_context
 
 from .. import main
+from ... import db
 from ...models import ArchivedService, Service, Supplier, AuditEvent, Framework, ValidationError
 
-from sqlalchemy import asc
-from ...validation import is_valid_service_id_or_400
+from sqlalchemy import asc, orm
+from ...validation import is_valid_service_id, is_valid_service_id_or_400
 from ...utils import (
     url_for, pagination_links, display_list, get_valid_page_or_1,
-    validate_and_return_updater_request, get_int_or_400
+    validate_and_return_updater_request, get_int_or_400,
+    is_keyset_pagination_request, keyset_paginate,
+    get_json_from_request, json_has_required_keys
 )
 
 from ...service_utils import (
     validate_and_return_service_request,
     update_and_validate_service,
     index_service,
+    index_services,
     delete_service_from_index,
     commit_and_archive_service,
+    bulk_commit_and_archive_services,
+    get_service_validation_errors,
     validate_service_data,
     validate_and_return_related_objects,
     filter_services)
@@ -35,12 +41,7 @@ def index():
     ), 200
 
 
-@main.route('/services', methods=['GET'])
-def list_services():
-    page = get_valid_page_or_1()
-
-    supplier_id = get_int_or_400(request.args, 'supplier_id')
-
+def filter_services_from_request_args():
     if request.args.get('framework'):
         frameworks = [slug.strip() for slug in request.args['framework'].split(',')]
     else:
@@ -52,7 +53,7 @@ def list_services():
         statuses = None
 
     try:
-        services = filter_services(
+        return filter_services(
             framework_slugs=frameworks,
             statuses=statuses,
             lot_slug=request.args.get('lot'),
@@ -62,6 +63,15 @@ def list_services():
     except ValidationError as e:
         abort(400, e.message)
 
+
+@main.route('/services', methods=['GET'])
+def list_services():
+    page = get_valid_page_or_1()
+
+    supplier_id = get_int_or_400(request.args, 'supplier_id')
+
+    services = filter_services_from_request_args()
+
     if supplier_id is not None:
         supplier = Supplier.query.filter(Supplier.supplier_id == supplier_id).all()
         if not supplier:
@@ -72,13 +82,19 @@ def list_services():
             services=[service.serialize() for service in items],
             links=dict()
         )
-    else:
-        services = services.order_by(asc(Service.id))
 
-    services = services.paginate(
-        page=page,
-        per_page=current_app.config['DM_API_SERVICES_PAGE_SIZE'],
-    )
+    if is_keyset_pagination_request():
+        services = keyset_paginate(
+            services,
+            [Service.id],
+            after=request.args['after'],
+            per_page=current_app.config['DM_API_SERVICES_PAGE_SIZE'],
+        )
+    else:
+        services = services.order_by(asc(Service.id)).paginate(
+            page=page,
+            per_page=current_app.config['DM_API_SERVICES_PAGE_SIZE'],
+        )
 
     return jsonify(
         services=[service.serialize() for service in services.items],
@@ -90,6 +106,43 @@ def list_services():
     )
 
 
+@main.route('/services/export', methods=['GET'])
+def export_services():
+    """
+    Streams every service matching the same filters as `list_services` as
+    newline-delimited JSON, one serialized service per line, reading them
+    from the database with a server-side cursor.
+    """
+    supplier_id = get_int_or_400(request.args, 'supplier_id')
+
+    services = filter_services_from_request_args()
+
+    if supplier_id is not None:
+        services = services.filter(Service.supplier_id == supplier_id)
+
+    batch_size = current_app.config['DM_API_SERVICES_EXPORT_BATCH_SIZE']
+    services = services.options(
+        # yield_per can't be combined with eager loading of collections, which
+        # serialize() doesn't use anyway
+        orm.joinedload(Service.supplier).lazyload(Supplier.contact_information),
+        orm.joinedload(Service.framework).lazyload(Framework.lots),
+    ).order_by(
+        asc(Service.id)
+    ).yield_per(batch_size)
+
+    def generate():
+        lines = []
+        for service in services:
+            lines.append(json.dumps(service.serialize()))
+            if len(lines) == batch_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @main.route('/archived-services', methods=['GET'])
 def list_archived_services_by_service_id():
     """
@@ -142,13 +195,82 @@ def update_service(service_id):
 
     updated_service = update_and_validate_service(service, update)
 
+    index_service(updated_service)
     commit_and_archive_service(updated_service, update_details,
                                AuditTypes.update_service)
-    index_service(updated_service)
 
     return jsonify(message="done"), 200
 
 
+@main.route('/services/bulk-update', methods=['POST'])
+def bulk_update_services():
+    """
+        Update many services in one request. Takes a `services` object mapping service IDs
+        to the same JSON updates accepted by `update_service`.
+
+        Services that fail validation are reported under `errors` and left unchanged,
+        the rest are archived and audited together in a single transaction.
+    """
+    update_details = validate_and_return_updater_request()
+
+    json_payload = get_json_from_request()
+    json_has_required_keys(json_payload, ['services'])
+    updates = json_payload['services']
+
+    if not isinstance(updates, dict) or not updates:
+        abort(400, "'services' must be an object mapping service IDs to updates")
+
+    limit = current_app.config['DM_API_SERVICES_BULK_UPDATE_LIMIT']
+    if len(updates) > limit:
+        abort(400, "Cannot update more than {} services in one request".format(limit))
+
+    errors = {}
+    for service_id, update in updates.items():
+        if not is_valid_service_id(service_id):
+            errors[service_id] = "Invalid service ID supplied"
+        elif not isinstance(update, dict):
+            errors[service_id] = "Update must be a JSON object"
+        elif 'id' in update and update['id'] != service_id:
+            errors[service_id] = "id parameter must match id in data"
+
+    service_ids = [service_id for service_id in updates if service_id not in errors]
+    services = {}
+    if service_ids:
+        services = {
+            service.service_id: service
+            for service in Service.query.filter(Service.service_id.in_(service_ids))
+        }
+
+    updated_services = []
+    for service_id in sorted(updates):
+        if service_id in errors:
+            continue
+        service = services.get(service_id)
+        if service is None:
+            errors[service_id] = "Service not found"
+            continue
+
+        service.update_from_json(updates[service_id])
+        validation_errors = get_service_validation_errors(service)
+        if validation_errors:
+            errors[service_id] = validation_errors
+            # Discard the rejected update so it isn't flushed with the valid ones
+            db.session.expire(service)
+        else:
+            updated_services.append(service)
+
+    if not updated_services:
+        abort(400, errors)
+
+    index_services(updated_services)
+    bulk_commit_and_archive_services(updated_services, update_details, AuditTypes.update_service)
+
+    return jsonify(
+        updated=[service.service_id for service in updated_services],
+        errors=errors
+    ), 200
+
+
 @main.route('/services/<string:service_id>', methods=['PUT'])
 def import_service(service_id):
     """Import services from legacy digital marketplace
@@ -183,8 +305,8 @@ def import_service(service_id):
 
     validate_service_data(service)
 
-    commit_and_archive_service(service, updater_json, AuditTypes.import_service)
     index_service(service)
+    commit_and_archive_service(service, updater_json, AuditTypes.import_service)
 
     return jsonify(services=service.serialize()), 201
 
@@ -274,11 +396,6 @@ def update_service_status(service_id, status):
 
     prior_status, service.status = service.status, status
 
-    commit_and_archive_service(service, update_json,
-                               AuditTypes.update_service_status,
-                               audit_data={'old_status': prior_status,
-                                           'new_status': status})
-
     if prior_status != status:
 
         # If it's being unpublished, delete it from the search api.
@@ -288,4 +405,9 @@ def update_service_status(service_id, status):
             # If it's being published, index in the search api.
             index_service(service)
 
+    commit_and_archive_service(service, update_json,
+                               AuditTypes.update_service_status,
+                               audit_data={'old_status': prior_status,
+                                           'new_status': status})
+
     return jsonify(services=service.serialize()), 200
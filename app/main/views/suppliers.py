@@ -3,6 +3,7 @@ from flask import jsonify, abort, request, current_app
 from sqlalchemy.exc import IntegrityError, DataError
 from .. import main
 from ... import db
+from ...framework_registry import get_framework_by_id, get_framework_or_404
 from ...models import (
     Supplier, ContactInformation, AuditEvent,
     Service, SupplierFramework, Framework, User,
@@ -23,6 +24,8 @@ from ...utils import (
     json_has_matching_id,
     get_valid_page_or_1,
     validate_and_return_updater_request,
+    is_keyset_pagination_request,
+    keyset_paginate,
 )
 from ...supplier_utils import validate_and_return_supplier_request, validate_agreement_details_data
 from dmapiclient.audit import AuditTypes
@@ -74,10 +77,18 @@ def list_suppliers():
     suppliers = suppliers.distinct(Supplier.name, Supplier.supplier_id)
 
     try:
-        suppliers = suppliers.paginate(
-            page=page,
-            per_page=current_app.config['DM_API_SUPPLIERS_PAGE_SIZE'],
-        )
+        if is_keyset_pagination_request():
+            suppliers = keyset_paginate(
+                suppliers,
+                [Supplier.name, Supplier.supplier_id],
+                after=request.args['after'],
+                per_page=current_app.config['DM_API_SUPPLIERS_PAGE_SIZE'],
+            )
+        else:
+            suppliers = suppliers.paginate(
+                page=page,
+                per_page=current_app.config['DM_API_SUPPLIERS_PAGE_SIZE'],
+            )
 
         return jsonify(
             suppliers=[supplier.serialize() for supplier in suppliers.items],
@@ -253,9 +264,7 @@ def update_contact_information(supplier_id, contact_id):
 
 @main.route('/suppliers/<supplier_id>/frameworks/<framework_slug>/declaration', methods=['PUT'])
 def set_a_declaration(supplier_id, framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     supplier_framework = SupplierFramework.find_by_supplier_and_framework(
         supplier_id, framework_slug
@@ -304,9 +313,7 @@ def get_registered_frameworks(supplier_id):
     ).all()
     slugs = []
     for framework in supplier_frameworks:
-        framework = Framework.query.filter(
-            Framework.id == framework.framework_id
-        ).first()
+        framework = get_framework_by_id(framework.framework_id)
         slugs.append(framework.slug)
 
     return jsonify(frameworks=slugs)
@@ -348,9 +355,7 @@ def get_supplier_framework_info(supplier_id, framework_slug):
 @main.route('/suppliers/<supplier_id>/frameworks/<framework_slug>', methods=['PUT'])
 def register_framework_interest(supplier_id, framework_slug):
 
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     supplier = Supplier.query.filter(
         Supplier.supplier_id == supplier_id
@@ -397,9 +402,7 @@ def register_framework_interest(supplier_id, framework_slug):
 
 @main.route('/suppliers/<supplier_id>/frameworks/<framework_slug>', methods=['POST'])
 def update_supplier_framework(supplier_id, framework_slug):
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     supplier = Supplier.query.filter(
         Supplier.supplier_id == supplier_id
@@ -456,9 +459,7 @@ def update_supplier_framework(supplier_id, framework_slug):
 @main.route('/suppliers/<int:supplier_id>/frameworks/<framework_slug>/variation/<variation_slug>', methods=['PUT'])
 def agree_framework_variation(supplier_id, framework_slug, variation_slug):
 
-    framework = Framework.query.filter(
-        Framework.slug == framework_slug
-    ).first_or_404()
+    framework = get_framework_or_404(framework_slug)
 
     supplier = Supplier.query.filter(
         Supplier.supplier_id == supplier_id
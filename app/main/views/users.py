@@ -1,12 +1,14 @@
 from datetime import datetime
 from dmapiclient.audit import AuditTypes
-from sqlalchemy import func
+from sqlalchemy import and_, case, exists, func
 from sqlalchemy.exc import IntegrityError, DataError
-from flask import jsonify, abort, request, current_app
+from six import string_types, text_type
+from flask import json, jsonify, abort, request, current_app, Response, stream_with_context
 
 from .. import main
 from ... import db, encryption
-from ...models import User, AuditEvent, Supplier, Framework, SupplierFramework, DraftService
+from ...framework_registry import get_framework
+from ...models import User, AuditEvent, Supplier, SupplierFramework, DraftService
 from ...utils import get_json_from_request, json_has_required_keys, \
     json_has_matching_id, pagination_links, get_valid_page_or_1, validate_and_return_updater_request
 from ...validation import validate_user_json_or_400, validate_user_auth_json_or_400, is_valid_buyer_email
@@ -24,6 +26,11 @@ def auth_user():
     if user is None:
         return jsonify(authorization=False), 404
     elif encryption.authenticate_user(json_payload['password'], user) and user.active:
+        if encryption.needs_rehash(user.password):
+            try:
+                user.password = encryption.hash_user_password(json_payload['password'])
+            except encryption.PasswordHashingUnavailable:
+                pass  # the password will be rehashed on a later login
         user.logged_in_at = datetime.utcnow()
         user.failed_login_count = 0
         db.session.add(user)
@@ -117,7 +124,7 @@ def create_user():
     if 'hashpw' in json_payload and not json_payload['hashpw']:
         password = json_payload['password']
     else:
-        password = encryption.hashpw(json_payload['password'])
+        password = encryption.hash_user_password(json_payload['password'])
 
     now = datetime.utcnow()
     user = User(
@@ -181,7 +188,7 @@ def update_user(user_id):
     json_has_matching_id(user_update, user_id)
 
     if 'password' in user_update:
-        user.password = encryption.hashpw(user_update['password'])
+        user.password = encryption.hash_user_password(user_update['password'])
         user.password_changed_at = datetime.utcnow()
         user_update['password'] = 'updated'
     if 'active' in user_update:
@@ -223,62 +230,124 @@ def update_user(user_id):
         abort(400, "Could not update user with: {0}".format(user_update))
 
 
+USER_EXPORT_FIELDS = [
+    'email address',
+    'user_name',
+    'supplier_id',
+    'declaration_status',
+    'application_status',
+    'application_result',
+    'framework_agreement',
+    'variations_agreed',
+]
+
+
+def _csv_line(values):
+    return u','.join(
+        u'"{}"'.format(text_type(value).replace(u'"', u'""')) for value in values
+    ) + u'\r\n'
+
+
 @main.route('/users/export/<framework_slug>', methods=['GET'])
 def export_users_for_framework(framework_slug):
+    """
+    Streams the active users of every supplier registered with the framework, with their
+    supplier's application status, as JSON (`{"users": [...]}`, the default), newline-delimited
+    JSON (`?format=ndjson`) or CSV (`?format=csv`). Rows are read with a server-side cursor.
+    """
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'ndjson', 'csv'):
+        abort(400, "Invalid format '{}'".format(export_format))
 
     # 400 if framework slug is invalid
-    framework = Framework.query.filter(Framework.slug == framework_slug).first()
+    framework = get_framework(framework_slug)
     if not framework:
         abort(400, 'invalid framework')
 
     if framework.status == 'coming':
         abort(400, 'framework not yet open')
-
-    suppliers_with_a_complete_service = framework.get_supplier_ids_for_completed_service()
-    supplier_frameworks_and_users = db.session.query(
-        SupplierFramework, User
+    framework_is_open = framework.status == 'open'
+
+    declaration_status = func.coalesce(SupplierFramework.declaration['status'].astext, 'unstarted')
+    has_completed_service = exists().where(and_(
+        DraftService.supplier_id == SupplierFramework.supplier_id,
+        DraftService.framework_id == SupplierFramework.framework_id,
+        DraftService.status.in_(('submitted', 'failed')),
+    ))
+    current_agreement = SupplierFramework._CurrentFrameworkAgreement.local_table
+
+    batch_size = current_app.config['DM_API_USERS_EXPORT_BATCH_SIZE']
+    rows = db.session.query(
+        User.email_address,
+        User.name,
+        SupplierFramework.supplier_id,
+        declaration_status,
+        case([(and_(declaration_status == 'complete', has_completed_service), 'application')],
+             else_='no_application'),
+        SupplierFramework.on_framework,
+        current_agreement.c.signed_agreement_returned_at.isnot(None),
+        SupplierFramework.agreed_variations,
     ).join(
         User, SupplierFramework.supplier_id == User.supplier_id
+    ).outerjoin(
+        current_agreement, and_(
+            current_agreement.c.supplier_id == SupplierFramework.supplier_id,
+            current_agreement.c.framework_id == SupplierFramework.framework_id,
+        )
     ).filter(
-        SupplierFramework.framework == framework
+        SupplierFramework.framework_id == framework.id
     ).filter(
         User.active.is_(True)
-    ).all()
-
-    user_rows = []
-
-    for sf, u in supplier_frameworks_and_users:
-
-        # always get the declaration status
-        declaration_status = sf.declaration.get('status') if sf.declaration else 'unstarted'
-        application_status = 'application' if (
-            declaration_status == 'complete' and sf.supplier_id in suppliers_with_a_complete_service
-        ) else 'no_application'
-        application_result = ''
-        framework_agreement = ''
-        variations_agreed = ''
-
-        # if framework is pending, live, or expired
-        if framework.status != 'open':
-            if sf.on_framework is None:
-                application_result = 'no result'
+    ).order_by(
+        SupplierFramework.supplier_id, User.id
+    ).yield_per(batch_size)
+
+    def user_rows():
+        for (email_address, name, supplier_id, declaration_status, application_status,
+             on_framework, framework_agreement, agreed_variations) in rows:
+            # only report results once the framework is pending, live, or expired
+            if framework_is_open:
+                application_result = framework_agreement = variations_agreed = ''
             else:
-                application_result = 'pass' if sf.on_framework else 'fail'
-            framework_agreement = bool(getattr(sf.current_framework_agreement, 'signed_agreement_returned_at', None))
-            variations_agreed = ', '.join(sf.agreed_variations.keys()) if sf.agreed_variations else ''
+                application_result = 'no result' if on_framework is None else ('pass' if on_framework else 'fail')
+                variations_agreed = ', '.join(agreed_variations.keys()) if agreed_variations else ''
+
+            yield {
+                'email address': email_address,
+                'user_name': name,
+                'supplier_id': supplier_id,
+                'declaration_status': declaration_status,
+                'application_status': application_status,
+                'framework_agreement': framework_agreement,
+                'application_result': application_result,
+                'variations_agreed': variations_agreed,
+            }
+
+    def generate():
+        if export_format == 'csv':
+            yield _csv_line(USER_EXPORT_FIELDS)
+        elif export_format == 'json':
+            yield '{"users": ['
+
+        lines = []
+        for index, user in enumerate(user_rows()):
+            if export_format == 'csv':
+                lines.append(_csv_line(user[field] for field in USER_EXPORT_FIELDS))
+            elif export_format == 'ndjson':
+                lines.append(json.dumps(user) + '\n')
+            else:
+                lines.append((',' if index else '') + json.dumps(user))
+            if len(lines) == batch_size:
+                yield ''.join(lines)
+                lines = []
+        if lines:
+            yield ''.join(lines)
 
-        user_rows.append({
-            'email address': u.email_address,
-            'user_name': u.name,
-            'supplier_id': sf.supplier_id,
-            'declaration_status': declaration_status,
-            'application_status': application_status,
-            'framework_agreement': framework_agreement,
-            'application_result': application_result,
-            'variations_agreed': variations_agreed
-        })
+        if export_format == 'json':
+            yield ']}'
 
-    return jsonify(users=[user for user in user_rows])
+    mimetypes = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+    return Response(stream_with_context(generate()), mimetype=mimetypes[export_format])
 
 
 @main.route("/users/check-buyer-email", methods=["GET"])
@@ -290,6 +359,31 @@ def email_has_valid_buyer_domain():
     return jsonify(valid=is_valid_buyer_email(email_address))
 
 
+@main.route("/users/check-buyer-emails", methods=["POST"])
+def email_addresses_have_valid_buyer_domains():
+    """
+        Check a list of email addresses in one request, eg when onboarding a whole
+        organisation. Returns whether each address is valid, in the order they were given.
+    """
+    json_payload = get_json_from_request()
+    json_has_required_keys(json_payload, ['emailAddresses'])
+    email_addresses = json_payload['emailAddresses']
+
+    if not isinstance(email_addresses, list) or not all(
+        isinstance(email_address, string_types) for email_address in email_addresses
+    ):
+        abort(400, "'emailAddresses' must be a list of email addresses")
+
+    limit = current_app.config['DM_API_BUYER_EMAIL_CHECK_LIMIT']
+    if len(email_addresses) > limit:
+        abort(400, "Cannot check more than {} email addresses in one request".format(limit))
+
+    return jsonify(emailAddresses=[
+        {'emailAddress': email_address, 'valid': is_valid_buyer_email(email_address)}
+        for email_address in email_addresses
+    ])
+
+
 def check_supplier_role(role, supplier_id):
     if role == 'supplier' and not supplier_id:
         abort(400, "'supplierId' is required for users with 'supplier' role")
@@ -6,15 +6,14 @@ from flask import current_app
 from flask_sqlalchemy import BaseQuery
 from six import string_types, iteritems
 
-from sqlalchemy import asc, desc
+from sqlalchemy import and_, asc, desc, false, or_
 from sqlalchemy import func
-from sqlalchemy.dialects.postgresql import INTERVAL
 import sqlalchemy.dialects.postgresql
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import validates, backref, mapper
 from sqlalchemy.orm.session import Session
-from sqlalchemy.sql.expression import case as sql_case, cast as sql_cast, select as sql_select
+from sqlalchemy.sql.expression import case as sql_case, select as sql_select
 from sqlalchemy.types import String
 from sqlalchemy import Sequence
 from sqlalchemy_utils import generic_relationship
@@ -25,14 +24,20 @@ from dmutils.formats import DATETIME_FORMAT
 from dmutils.dates import get_publishing_dates
 
 from . import db
-from .utils import link, url_for, strip_whitespace_from_data, drop_foreign_fields, purge_nulls_from_data
+from .audit_deltas import apply_payload_delta, delta_key, is_smaller, payload_delta
+from .utils import (
+    link, url_for, strip_whitespace_from_data, drop_foreign_fields, purge_nulls_from_data, request_cache
+)
 from .validation import is_valid_service_id, is_valid_buyer_email, get_validation_errors
 
 
-class JSON(sqlalchemy.dialects.postgresql.JSON):
+class JSON(sqlalchemy.dialects.postgresql.JSONB):
     """
-    Override SQLAlchemy JSON class to enforce None=>SQL-NULL mapping.
+    Override SQLAlchemy JSONB class to enforce None=>SQL-NULL mapping.
     (We want to avoid JSON-null and have consistency across our models.)
+
+    All our JSON columns are stored as JSONB so they can be indexed and queried with
+    the containment (@>) and key existence (?) operators.
     """
 
     def __init__(self, astext_type=None):
@@ -449,13 +454,14 @@ class SupplierFramework(db.Model):
         }
 
     @staticmethod
-    def serialize_agreed_variation(agreed_variation, with_users=False):
+    def serialize_agreed_variation(agreed_variation, with_users=False, users_by_id=None):
         if not (with_users and agreed_variation.get("agreedUserId")):
             return agreed_variation
 
-        user = User.query.filter(
-            User.id == agreed_variation["agreedUserId"]
-        ).first()
+        if users_by_id is None:
+            users_by_id, _ = load_users(ids=[agreed_variation["agreedUserId"]])
+
+        user = get_user_by_id(users_by_id, agreed_variation["agreedUserId"])
         if not user:
             return agreed_variation
 
@@ -465,8 +471,18 @@ class SupplierFramework(db.Model):
         })
 
     def serialize(self, data=None, with_users=False, with_declaration=True):
+        agreement = self.current_framework_agreement
+
+        users_by_id = {}
+        if with_users:
+            user_ids = [variation.get("agreedUserId") for variation in (self.agreed_variations or {}).values()]
+            if agreement:
+                user_ids.append((agreement.signed_agreement_details or {}).get("uploaderUserId"))
+                user_ids.append((agreement.countersigned_agreement_details or {}).get("approvedByUserId"))
+            users_by_id, _ = load_users(ids=user_ids)
+
         agreed_variations = {
-            k: self.serialize_agreed_variation(v, with_users=with_users)
+            k: self.serialize_agreed_variation(v, with_users=with_users, users_by_id=users_by_id)
             for k, v in iteritems(self.agreed_variations or {})
         }
 
@@ -487,7 +503,6 @@ class SupplierFramework(db.Model):
         if data:
             supplier_framework.update(data)
 
-        agreement = self.current_framework_agreement
         if agreement:
             supplier_framework.update({
                 'agreementId': agreement.id,
@@ -523,18 +538,14 @@ class SupplierFramework(db.Model):
 
         if with_users:
             if (supplier_framework.get("agreementDetails") or {}).get("uploaderUserId"):
-                user = User.query.filter(
-                    User.id == supplier_framework['agreementDetails']['uploaderUserId']
-                ).first()
+                user = get_user_by_id(users_by_id, supplier_framework['agreementDetails']['uploaderUserId'])
 
                 if user:
                     supplier_framework['agreementDetails']['uploaderUserName'] = user.name
                     supplier_framework['agreementDetails']['uploaderUserEmail'] = user.email_address
 
             if (supplier_framework.get("countersignedDetails") or {}).get("approvedByUserId"):
-                user = User.query.filter(
-                    User.id == supplier_framework['countersignedDetails']['approvedByUserId']
-                ).first()
+                user = get_user_by_id(users_by_id, supplier_framework['countersignedDetails']['approvedByUserId'])
 
                 if user:
                     supplier_framework['countersignedDetails']['approvedByUserName'] = user.name
@@ -776,6 +787,37 @@ class User(db.Model):
         return user
 
 
+def load_users(ids=(), email_addresses=()):
+    """Fetch the users with any of the given ids or email addresses in a single query
+
+    Used to look up all the users referenced by the objects being serialized at once,
+    rather than running a query for each reference.
+
+    :return: dicts of the users found by id and by email address
+    """
+    ids = set(user_id for user_id in ids if user_id)
+    email_addresses = set(email_address for email_address in email_addresses if email_address)
+
+    conditions = []
+    if ids:
+        conditions.append(User.id.in_(ids))
+    if email_addresses:
+        conditions.append(User.email_address.in_(email_addresses))
+    if not conditions:
+        return {}, {}
+
+    users = User.query.filter(or_(*conditions)).all()
+    return {user.id: user for user in users}, {user.email_address: user for user in users}
+
+
+def get_user_by_id(users_by_id, user_id):
+    """Look up a user id from JSON data, which may have been stored as a string"""
+    try:
+        return users_by_id.get(int(user_id))
+    except (TypeError, ValueError):
+        return None
+
+
 class ServiceTableMixin(object):
 
     STATUSES = ('disabled', 'enabled', 'published')
@@ -865,17 +907,24 @@ class ServiceTableMixin(object):
 
         data = dict(self.data.items())
 
+        data.update(self._serialize_related(self.supplier, self.supplier.supplier_id, lambda supplier: {
+            'supplierId': supplier.supplier_id,
+            'supplierName': supplier.name,
+        }))
+        data.update(self._serialize_related(self.framework, self.framework.id, lambda framework: {
+            'frameworkSlug': framework.slug,
+            'frameworkFramework': framework.framework,
+            'frameworkName': framework.name,
+            'frameworkStatus': framework.status,
+        }))
+        data.update(self._serialize_related(self.lot, self.lot.id, lambda lot: {
+            'lot': lot.slug,  # deprecated, use lotSlug instead
+            'lotSlug': lot.slug,
+            'lotName': lot.name,
+        }))
+
         data.update({
             'id': self.service_id,
-            'supplierId': self.supplier.supplier_id,
-            'supplierName': self.supplier.name,
-            'frameworkSlug': self.framework.slug,
-            'frameworkFramework': self.framework.framework,
-            'frameworkName': self.framework.name,
-            'frameworkStatus': self.framework.status,
-            'lot': self.lot.slug,  # deprecated, use lotSlug instead
-            'lotSlug': self.lot.slug,
-            'lotName': self.lot.name,
             'updatedAt': self.updated_at.strftime(DATETIME_FORMAT),
             'createdAt': self.created_at.strftime(DATETIME_FORMAT),
             'status': self.status
@@ -887,6 +936,22 @@ class ServiceTableMixin(object):
 
         return data
 
+    @staticmethod
+    def _serialize_related(obj, key, serialize):
+        """Serialize a supplier, framework or lot once per request
+
+        A page of services only has a few distinct frameworks and lots (and often suppliers),
+        so their fields are memoized for the rest of the request.
+        """
+        cache = request_cache('service_related')
+        if cache is None:
+            return serialize(obj)
+
+        key = (type(obj), key)
+        if key not in cache:
+            cache[key] = serialize(obj)
+        return cache[key]
+
     def update_from_json(self, data):
         current_data = dict(self.data.items())
         current_data.update(data)
@@ -940,15 +1005,40 @@ class Service(db.Model, ServiceTableMixin):
             return self.filter(Service.lot.has(Lot.slug == lot_slug))
 
         def data_has_key(self, key_to_find):
-            return self.filter(Service.data[key_to_find].astext != '')  # SQLAlchemy weirdness
+            return self.filter(Service.data.has_key(key_to_find))  # noqa
 
         def data_key_contains_value(self, k, v):
-            return self.filter(Service.data[k].astext.contains(u'"{}"'.format(v)))  # Postgres 9.3: use string matching
+            # Matches services where `k` is a list including `v`
+            return self.filter(Service.data.contains({k: [v]}))
 
     def get_link(self):
         return url_for(".get_service", service_id=self.service_id)
 
 
+# Used by the data_has_key and data_key_contains_value filters
+db.Index('ix_services_data', Service.data, postgresql_using='gin')
+
+
+class ServiceBriefEligibility(db.Model):
+    """
+        The briefs a published service lets its supplier respond to: a row with an empty role,
+        plus one for each digital specialist role it offers (each `<role>Locations` key in its
+        data). Maintained by a database trigger on services, see migration 910.
+    """
+    __tablename__ = 'service_brief_eligibility'
+
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id', ondelete='CASCADE'), primary_key=True)
+    role = db.Column(db.String, primary_key=True)
+    supplier_id = db.Column(db.BigInteger, nullable=False)
+    framework_id = db.Column(db.BigInteger, nullable=False)
+    lot_id = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_service_brief_eligibility_brief', framework_id, lot_id, role, supplier_id),
+        {}
+    )
+
+
 class ArchivedService(db.Model, ServiceTableMixin):
     """
         A record of a Service's past state
@@ -1045,8 +1135,72 @@ class DraftService(db.Model, ServiceTableMixin):
         return url_for(".fetch_draft_service", draft_id=self.id)
 
 
+class SearchIndexOutbox(db.Model):
+    """
+        A pending change to a service's search index entry, written in the same transaction
+        as the change to the service and sent to the search API by the search index worker
+    """
+    __tablename__ = 'search_index_outbox'
+
+    ACTIONS = ('index', 'delete')
+
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.String, index=True, nullable=False)
+    action = db.Column(db.String, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, index=True, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.String)
+
+    @validates('action')
+    def validates_action(self, key, value):
+        if value not in self.ACTIONS:
+            raise ValidationError("Invalid search index action '{}'".format(value))
+
+        return value
+
+    def __repr__(self):
+        return '<{}: service_id={}, action={}, attempts={}>'.format(
+            self.__class__.__name__, self.service_id, self.action, self.attempts
+        )
+
+
+class FrameworkDraftStats(db.Model):
+    """
+        Number of draft services by lot, draft status and the supplier's declaration status,
+        counting only suppliers that have made a declaration. Maintained by database triggers,
+        see migration 890.
+    """
+    __tablename__ = 'framework_draft_stats'
+
+    framework_id = db.Column(db.Integer, db.ForeignKey('frameworks.id'), primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('lots.id'), primary_key=True)
+    draft_status = db.Column(db.String, primary_key=True)
+    # '' for a declaration without a status
+    declaration_status = db.Column(db.String, primary_key=True)
+    draft_count = db.Column(db.Integer, nullable=False)
+
+
+class FrameworkSupplierStats(db.Model):
+    """
+        Number of suppliers that have made a declaration by declaration status and whether they
+        have submitted any draft services. Maintained by database triggers, see migration 890.
+    """
+    __tablename__ = 'framework_supplier_stats'
+
+    framework_id = db.Column(db.Integer, db.ForeignKey('frameworks.id'), primary_key=True)
+    # '' for a declaration without a status
+    declaration_status = db.Column(db.String, primary_key=True)
+    has_completed_services = db.Column(db.Boolean, primary_key=True)
+    supplier_count = db.Column(db.Integer, nullable=False)
+
+
 class AuditEvent(db.Model):
     __tablename__ = 'audit_events'
+    # Inserts are routed to a partition by a trigger, so `INSERT ... RETURNING` returns
+    # nothing; the id is fetched from the sequence beforehand instead
+    __table_args__ = {'implicit_returning': False}
 
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String, index=True, nullable=False)
@@ -1079,6 +1233,86 @@ class AuditEvent(db.Model):
         self.user = user
         self.acknowledged = False
 
+    # Audit types whose payload, in the data key given here, is stored as a delta against
+    # the last snapshot of it for the same object (see app/audit_deltas.py)
+    DELTA_PAYLOAD_KEYS = {
+        'update_draft_service': 'updateJson',
+        'update_brief': 'briefJson',
+        'update_brief_response': 'briefResponseData',
+    }
+
+    def _payload_delta(self):
+        payload_key = self.DELTA_PAYLOAD_KEYS.get(self.type)
+        if payload_key is None or not isinstance(self.data, dict):
+            return None, None
+        return payload_key, self.data.get(delta_key(payload_key))
+
+    @property
+    def snapshot_id(self):
+        """The id of the event this event's payload is a delta against, if it's a delta"""
+        _, delta = self._payload_delta()
+        return delta['snapshotId'] if delta else None
+
+    def encode_payload_delta(self):
+        """Store the payload as a delta against the last snapshot for the same object, unless
+        it's time for a new snapshot"""
+        payload_key = self.DELTA_PAYLOAD_KEYS.get(self.type)
+        if payload_key is None or self.object_id is None or not isinstance(self.data.get(payload_key), dict):
+            return
+
+        # Set here rather than on insert, so the month can't change in between
+        self.created_at = datetime.utcnow()
+
+        previous = AuditEvent.query.filter(
+            AuditEvent.object_type == self.object_type,
+            AuditEvent.object_id == self.object_id,
+            AuditEvent.type == self.type,
+        ).order_by(desc(AuditEvent.created_at), desc(AuditEvent.id)).first()
+        if previous is None:
+            return
+
+        _, previous_delta = previous._payload_delta()
+        if previous_delta is None:
+            snapshot, sequence = previous, 1
+        elif previous_delta['sequence'] < current_app.config['DM_API_AUDIT_SNAPSHOT_INTERVAL']:
+            snapshot, sequence = AuditEvent.query.get(previous_delta['snapshotId']), previous_delta['sequence'] + 1
+        else:
+            return
+
+        # Each month starts with a snapshot, so a delta is always in the same partition as
+        # its snapshot and archiving a month doesn't leave deltas that can't be expanded
+        if snapshot is None or not isinstance(snapshot.data.get(payload_key), dict) or \
+                snapshot.created_at.strftime('%Y-%m') != self.created_at.strftime('%Y-%m'):
+            return
+
+        delta = payload_delta(snapshot.data[payload_key], self.data[payload_key])
+        delta.update(snapshotId=snapshot.id, sequence=sequence)
+        if not is_smaller(delta, self.data[payload_key]):
+            return
+
+        data = dict((key, value) for key, value in self.data.items() if key != payload_key)
+        data[delta_key(payload_key)] = delta
+        self.data = data
+
+    def expanded_data(self, snapshots=None):
+        """`data`, with the full payload in place of a delta
+
+        :param snapshots: events already loaded with `load_audit_snapshots`
+        """
+        payload_key, delta = self._payload_delta()
+        if delta is None:
+            return self.data
+
+        if snapshots is None:
+            snapshots = load_audit_snapshots([self])
+        snapshot = snapshots.get(delta['snapshotId'])
+        if snapshot is None or payload_key not in snapshot.data:
+            return self.data
+
+        data = dict((key, value) for key, value in self.data.items() if key != delta_key(payload_key))
+        data[payload_key] = apply_payload_delta(snapshot.data[payload_key], delta)
+        return data
+
     class query_class(BaseQuery):
         def last_for_object(self, object, types=None):
             events = self.filter(AuditEvent.object == object)
@@ -1087,8 +1321,11 @@ class AuditEvent(db.Model):
 
             return events.order_by(desc(AuditEvent.created_at)).first()
 
-    def serialize(self, include_user=False):
+    def serialize(self, include_user=False, users_by_email=None, snapshots=None):
         """
+        :param users_by_email: users already loaded with `load_users`, to avoid a query
+                               for each event when serializing a list of events
+        :param snapshots: snapshots already loaded with `load_audit_snapshots`, likewise
         :return: dictionary representation of an audit event
         """
 
@@ -1097,7 +1334,7 @@ class AuditEvent(db.Model):
             'type': self.type,
             'acknowledged': self.acknowledged,
             'user': self.user,
-            'data': self.data,
+            'data': self.expanded_data(snapshots),
             'createdAt': self.created_at.strftime(DATETIME_FORMAT),
             'links': filter_null_value_fields({
                 "self": url_for(".list_audits"),
@@ -1119,16 +1356,26 @@ class AuditEvent(db.Model):
             })
 
         if include_user:
-            user = User.query.filter(
-                User.email_address == self.user
-            ).first()
+            if users_by_email is None:
+                _, users_by_email = load_users(email_addresses=[self.user])
 
+            user = users_by_email.get(self.user)
             if user:
                 data['userName'] = user.name
 
         return data
 
 
+def load_audit_snapshots(events):
+    """Fetch the snapshots the delta payloads of the given events are against in a single
+    query, by id"""
+    snapshot_ids = set(event.snapshot_id for event in events) - {None}
+    if not snapshot_ids:
+        return {}
+
+    return {event.id: event for event in AuditEvent.query.filter(AuditEvent.id.in_(snapshot_ids))}
+
+
 class Brief(db.Model):
     __tablename__ = 'briefs'
 
@@ -1149,6 +1396,11 @@ class Brief(db.Model):
     published_at = db.Column(db.DateTime, index=True, nullable=True)
     withdrawn_at = db.Column(db.DateTime, index=True, nullable=True)
 
+    # set from published_at and the brief's requirementsLength whenever either changes
+    applications_closed_at = db.Column(db.DateTime, index=True, nullable=True)
+    clarification_questions_closed_at = db.Column(db.DateTime, nullable=True)
+    clarification_questions_published_by = db.Column(db.DateTime, nullable=True)
+
     __table_args__ = (db.ForeignKeyConstraint([framework_id, _lot_id],
                                               ['framework_lots.framework_id', 'framework_lots.lot_id']),
                       {})
@@ -1192,39 +1444,32 @@ class Brief(db.Model):
         data = strip_whitespace_from_data(data)
         data = purge_nulls_from_data(data)
 
-        return data
+        self._set_publishing_dates(self.published_at, data)
 
-    @hybrid_property
-    def applications_closed_at(self):
-        if self.published_at is None:
-            return None
-        brief_publishing_date_and_length = self._build_date_and_length_data()
+        return data
 
-        return get_publishing_dates(brief_publishing_date_and_length)['closing_date']
+    @validates('published_at')
+    def validates_published_at(self, key, published_at):
+        self._set_publishing_dates(published_at, self.data)
 
-    @applications_closed_at.expression
-    def applications_closed_at(cls):
-        return sql_case([
-            (cls.data['requirementsLength'].astext == '1 week', func.date_trunc('day', cls.published_at) + sql_cast(
-                '1 week 23:59:59', INTERVAL)),
-            ], else_=func.date_trunc('day', cls.published_at) + sql_cast(
-                '2 weeks 23:59:59', INTERVAL))
-
-    @hybrid_property
-    def clarification_questions_closed_at(self_or_cls):
-        if self_or_cls.published_at is None:
-            return None
-        brief_publishing_date_and_length = self_or_cls._build_date_and_length_data()
+        return published_at
 
-        return get_publishing_dates(brief_publishing_date_and_length)['questions_close']
+    def _set_publishing_dates(self, published_at, data):
+        if published_at is None:
+            dates = {}
+        else:
+            dates = self.calculate_publishing_dates(published_at, (data or {}).get('requirementsLength'))
 
-    @hybrid_property
-    def clarification_questions_published_by(self_or_cls):
-        if self_or_cls.published_at is None:
-            return None
-        brief_publishing_date_and_length = self_or_cls._build_date_and_length_data()
+        self.applications_closed_at = dates.get('closing_date')
+        self.clarification_questions_closed_at = dates.get('questions_close')
+        self.clarification_questions_published_by = dates.get('answers_close')
 
-        return get_publishing_dates(brief_publishing_date_and_length)['answers_close']
+    @staticmethod
+    def calculate_publishing_dates(published_at, requirements_length):
+        return get_publishing_dates({
+            'publishedAt': published_at.replace(hour=23, minute=59, second=59, microsecond=0),
+            'requirementsLength': requirements_length,
+        })
 
     @hybrid_property
     def clarification_questions_are_closed(self_or_cls):
@@ -1263,7 +1508,18 @@ class Brief(db.Model):
 
     class query_class(BaseQuery):
         def has_statuses(self, *statuses):
-            return self.filter(Brief.status.in_(statuses))
+            # Filter on the underlying columns rather than the `status` CASE expression so
+            # the indexes on them can be used
+            now = datetime.utcnow()
+            status_filters = {
+                'withdrawn': Brief.withdrawn_at.isnot(None),
+                'draft': and_(Brief.withdrawn_at.is_(None), Brief.published_at.is_(None)),
+                'live': and_(Brief.withdrawn_at.is_(None), Brief.applications_closed_at > now),
+                'closed': and_(Brief.withdrawn_at.is_(None), Brief.applications_closed_at <= now),
+            }
+            return self.filter(or_(false(), *(
+                status_filters[status] for status in set(statuses) if status in status_filters
+            )))
 
     def add_clarification_question(self, question, answer):
         clarification_question = BriefClarificationQuestion(
@@ -1294,16 +1550,7 @@ class Brief(db.Model):
             users=self.users
         )
 
-    def _build_date_and_length_data(self):
-        published_day = self.published_at.replace(hour=23, minute=59, second=59, microsecond=0)
-        requirements_length = self.data.get('requirementsLength')
-
-        return {
-            'publishedAt': published_day,
-            'requirementsLength': requirements_length
-        }
-
-    def serialize(self, with_users=False):
+    def serialize(self, with_users=False, with_clarification_questions=True):
         data = dict(self.data.items())
 
         data.update({
@@ -1318,11 +1565,13 @@ class Brief(db.Model):
             'lotName': self.lot.name,
             'createdAt': self.created_at.strftime(DATETIME_FORMAT),
             'updatedAt': self.updated_at.strftime(DATETIME_FORMAT),
-            'clarificationQuestions': [
-                question.serialize() for question in self.clarification_questions
-            ],
         })
 
+        if with_clarification_questions:
+            data['clarificationQuestions'] = [
+                question.serialize() for question in self.clarification_questions
+            ]
+
         if self.published_at:
             data.update({
                 'publishedAt': self.published_at.strftime(DATETIME_FORMAT),
@@ -0,0 +1,87 @@
+"""
+Per-request database and serialization stats
+
+For each request we record the number of SQL statements run and the time spent running
+them (from the queries Flask-SQLAlchemy records when `SQLALCHEMY_RECORD_QUERIES` is on),
+the number of rows they returned and the time spent encoding JSON responses.
+
+The stats are logged with every request and, if `DM_API_QUERY_STATS_HEADERS` is set,
+returned in `DM-Query-*` and `DM-Serialization-Time` response headers.
+"""
+import time
+
+from flask import current_app, request
+from flask_sqlalchemy import get_debug_queries
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .utils import request_cache
+
+
+def init_app(app):
+    app.before_request(start_query_stats)
+    app.after_request(record_query_stats)
+    app.json_encoder = timed_json_encoder(app.json_encoder)
+
+
+def _query_stats():
+    stats = request_cache('query_stats')
+    if stats is not None and not stats:
+        stats.update(first_query=None, rows=0, serialization_time=0.0)
+    return stats
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _count_rows(conn, cursor, statement, parameters, context, executemany):
+    stats = _query_stats()
+    if stats is not None and cursor.description is not None:
+        stats['rows'] += max(cursor.rowcount, 0)
+
+
+def timed_json_encoder(base):
+    class TimedJSONEncoder(base):
+        def encode(self, o):
+            start = time.time()
+            try:
+                return super(TimedJSONEncoder, self).encode(o)
+            finally:
+                stats = _query_stats()
+                if stats is not None:
+                    stats['serialization_time'] += time.time() - start
+
+    return TimedJSONEncoder
+
+
+def start_query_stats():
+    # The app context (and the queries recorded on it) can outlive a single request
+    _query_stats()['first_query'] = len(get_debug_queries())
+
+
+def get_query_stats():
+    """Return the stats for the current request so far, with times in milliseconds"""
+    stats = _query_stats()
+    queries = get_debug_queries()[stats['first_query'] or 0:]
+
+    return {
+        'query_count': len(queries),
+        'query_time': round(sum(query.duration for query in queries) * 1000, 3),
+        'query_rows': stats['rows'],
+        'serialization_time': round(stats['serialization_time'] * 1000, 3),
+    }
+
+
+def record_query_stats(response):
+    stats = get_query_stats()
+
+    current_app.logger.info(
+        '{method} {path} ran {query_count} queries in {query_time}ms',
+        extra=dict(stats, method=request.method, path=request.path)
+    )
+
+    if current_app.config['DM_API_QUERY_STATS_HEADERS']:
+        response.headers['DM-Query-Count'] = stats['query_count']
+        response.headers['DM-Query-Time'] = stats['query_time']
+        response.headers['DM-Query-Rows'] = stats['query_rows']
+        response.headers['DM-Serialization-Time'] = stats['serialization_time']
+
+    return response
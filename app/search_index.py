@@ -0,0 +1,214 @@
+"""
+Search index updates are not sent to the search API while handling a request. Instead
+`queue_search_index_update` adds an entry to the `search_index_outbox` table in the same
+transaction as the change to the service, and the search index worker (`./application.py
+search_index_worker`) sends them to the search API in batches, retrying failed requests.
+
+The whole catalogue can be re-indexed with `./application.py reindex`, which
+serializes and sends services to the search API from a pool of worker processes.
+"""
+import multiprocessing
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_, select
+
+from . import db, dmapiclient, search_api_client
+from .models import Framework, SearchIndexOutbox, Service
+
+
+def is_indexable(service):
+    return (
+        service.framework.status == 'live' and
+        service.framework.framework == 'g-cloud' and
+        service.status == 'published'
+    )
+
+
+def queue_search_index_update(service, action):
+    db.session.add(SearchIndexOutbox(service_id=service.service_id, action=action))
+
+
+def retry_delay(attempts):
+    delay = current_app.config['DM_SEARCH_INDEX_RETRY_DELAY'] * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, current_app.config['DM_SEARCH_INDEX_MAX_RETRY_DELAY']))
+
+
+def _send_to_search_api(entry, service):
+    if entry.action == 'delete':
+        search_api_client.delete(entry.service_id)
+    # A service can stop being indexable between being queued and the entry being sent, in
+    # which case the delete queued by that change will follow
+    elif service is not None and is_indexable(service):
+        search_api_client.index(entry.service_id, service.serialize())
+
+
+def _retry_later(entry, error, now):
+    entry.attempts += 1
+    entry.last_error = str(error)
+
+    if entry.attempts >= current_app.config['DM_SEARCH_INDEX_MAX_ATTEMPTS']:
+        current_app.logger.error(
+            'Giving up on search index {} for {} after {} attempts: {}'.format(
+                entry.action, entry.service_id, entry.attempts, error))
+        db.session.delete(entry)
+    else:
+        current_app.logger.warning(
+            'Failed to send search index {} for {}: {}'.format(entry.action, entry.service_id, error))
+        entry.next_attempt_at = now + retry_delay(entry.attempts)
+
+
+def process_search_index_outbox(batch_size=None):
+    """Send one batch of due search index updates to the search API
+
+    Entries are coalesced by service ID, so a service updated several times is only
+    indexed once, using its current state. Failed updates are retried with exponential
+    backoff until `DM_SEARCH_INDEX_MAX_ATTEMPTS` is reached.
+
+    :return: the number of outbox entries in the batch
+    """
+    batch_size = batch_size or current_app.config['DM_SEARCH_INDEX_BATCH_SIZE']
+    now = datetime.utcnow()
+
+    entries = SearchIndexOutbox.query.filter(
+        SearchIndexOutbox.next_attempt_at <= now
+    ).order_by(
+        SearchIndexOutbox.id
+    ).limit(batch_size).with_for_update().all()
+
+    if not entries:
+        db.session.commit()
+        return 0
+
+    latest_entries = {}
+    for entry in entries:
+        latest_entries[entry.service_id] = entry
+    latest_entries = sorted(latest_entries.values(), key=lambda entry: entry.id)
+
+    # Earlier entries for the same services, including ones waiting to be retried, are
+    # replaced by the latest entry
+    SearchIndexOutbox.query.filter(or_(*[
+        and_(SearchIndexOutbox.service_id == entry.service_id, SearchIndexOutbox.id < entry.id)
+        for entry in latest_entries
+    ])).delete(synchronize_session=False)
+
+    services = {
+        service.service_id: service
+        for service in Service.query.filter(
+            Service.service_id.in_([entry.service_id for entry in latest_entries])
+        )
+    }
+
+    # Serialized services link back to the API, so URLs are built in a request for the API
+    # index ('/' is routed to the main blueprint, which relative endpoints like '.get_service' need)
+    with current_app.test_request_context('/', base_url=current_app.config['DM_API_BASE_URL']):
+        for entry in latest_entries:
+            try:
+                _send_to_search_api(entry, services.get(entry.service_id))
+            except dmapiclient.HTTPError as e:
+                _retry_later(entry, e.message, now)
+            else:
+                db.session.delete(entry)
+
+    db.session.commit()
+
+    return len(entries)
+
+
+def _check_api_base_url(config):
+    if not config['DM_API_BASE_URL']:
+        raise Exception("No DM_API_BASE_URL provided")
+
+
+def run_search_index_worker(batch_size=None, poll_interval=None, once=False):
+    """Process the search index outbox until it is empty (if `once`) or forever"""
+    _check_api_base_url(current_app.config)
+    poll_interval = poll_interval or current_app.config['DM_SEARCH_INDEX_POLL_INTERVAL']
+
+    while True:
+        processed = process_search_index_outbox(batch_size)
+        if processed:
+            current_app.logger.info('Processed {} search index updates'.format(processed))
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
+
+
+def indexable_service_id_chunks(engine, resume_from=None, chunk_size=100):
+    """Stream the IDs of all indexable services, in order, using a server-side cursor"""
+    services, frameworks = Service.__table__, Framework.__table__
+    query = select([services.c.service_id]).select_from(
+        services.join(frameworks, services.c.framework_id == frameworks.c.id)
+    ).where(and_(
+        frameworks.c.status == 'live',
+        frameworks.c.framework == 'g-cloud',
+        services.c.status == 'published',
+    )).order_by(services.c.service_id)
+
+    if resume_from is not None:
+        query = query.where(services.c.service_id > resume_from)
+
+    connection = engine.connect().execution_options(stream_results=True)
+    try:
+        result = connection.execute(query)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [row.service_id for row in rows]
+    finally:
+        connection.close()
+
+
+_reindex_app = None
+
+
+def _init_reindex_worker(config_name):
+    global _reindex_app
+    from . import create_app
+    _reindex_app = create_app(config_name)
+
+
+def index_service_chunk(service_ids):
+    """Serialize and index a chunk of services in a reindex worker process
+
+    :return: the last service ID in the chunk, the number of services indexed and the IDs
+             of services the search API failed to index
+    """
+    failed = []
+    with _reindex_app.test_request_context('/', base_url=_reindex_app.config['DM_API_BASE_URL']):
+        services = Service.query.filter(Service.service_id.in_(service_ids)).all()
+        for service in services:
+            try:
+                search_api_client.index(service.service_id, service.serialize())
+            except dmapiclient.HTTPError as e:
+                _reindex_app.logger.warning(
+                    'Failed to add {} to search index: {}'.format(service.service_id, e.message))
+                failed.append(service.service_id)
+
+    return service_ids[-1], len(services) - len(failed), failed
+
+
+def reindex_services(resume_from=None, processes=4, chunk_size=100):
+    """Index every published service on a live G-Cloud framework
+
+    Service IDs are streamed from the database in order and indexed in chunks by a pool of
+    `processes` workers, each with its own app and database connection. Results are yielded
+    in service ID order as chunks complete, so the last service ID of a yielded chunk is a
+    safe point to resume from.
+    """
+    _check_api_base_url(current_app.config)
+    ids = indexable_service_id_chunks(db.get_engine(current_app), resume_from, chunk_size)
+
+    pool = multiprocessing.Pool(
+        processes, initializer=_init_reindex_worker, initargs=(current_app.config['DM_ENVIRONMENT'],)
+    )
+    try:
+        for result in pool.imap(index_service_chunk, ids):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -1,12 +1,16 @@
+from datetime import datetime
+
 from flask import current_app, abort
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError, DataError
 
 from .utils import get_json_from_request, \
     json_has_matching_id, json_has_required_keys
 from .validation import get_validation_errors
-from . import search_api_client, dmapiclient
+from .search_index import is_indexable, queue_search_index_update
 from . import db
-from .models import ArchivedService, AuditEvent, Framework, Service, Supplier, ValidationError
+from .framework_registry import get_framework
+from .models import ArchivedService, AuditEvent, Service, Supplier, ValidationError
 
 
 def validate_and_return_service_request(service_id):
@@ -19,9 +23,7 @@ def validate_and_return_service_request(service_id):
 def validate_and_return_lot(json_payload):
     json_has_required_keys(json_payload, ['frameworkSlug', 'lot'])
 
-    framework = Framework.query.filter(
-        Framework.slug == json_payload['frameworkSlug']
-    ).first()
+    framework = get_framework(json_payload['frameworkSlug'])
 
     if not framework:
         abort(400, "Framework '{}' does not exist".format(json_payload['frameworkSlug']))
@@ -128,27 +130,92 @@ def commit_and_archive_service(updated_service, update_details,
         abort(400, e.orig)
 
 
+def bulk_commit_and_archive_services(updated_services, update_details, audit_type):
+    """Archive and audit a batch of updated services in a single transaction
+
+    Equivalent to calling `commit_and_archive_service` for each service, but the previous
+    archive ids are fetched in one query and the archived services and audit events are
+    each written with a single multi-row INSERT.
+    """
+    if not updated_services:
+        return
+
+    service_ids = [service.service_id for service in updated_services]
+    last_archives = dict(
+        db.session.query(
+            ArchivedService.service_id, func.max(ArchivedService.id)
+        ).filter(
+            ArchivedService.service_id.in_(service_ids)
+        ).group_by(
+            ArchivedService.service_id
+        ).all()
+    )
+
+    archived_services_table = ArchivedService.__table__
+    audit_events_table = AuditEvent.__table__
+
+    # Archives are taken before flushing, like ArchivedService.from_service, so they have
+    # the new data but keep the previous updated_at
+    archive_rows = [{
+        'service_id': service.service_id,
+        'supplier_id': service.supplier_id,
+        'framework_id': service.framework_id,
+        'lot_id': service.lot_id,
+        'created_at': service.created_at,
+        'updated_at': service.updated_at,
+        'data': service.data,
+        'status': service.status,
+    } for service in updated_services]
+
+    try:
+        db.session.add_all(updated_services)
+        db.session.flush()
+
+        new_archives = dict(
+            (service_id, archive_id) for archive_id, service_id in db.session.execute(
+                archived_services_table.insert().values(archive_rows).returning(
+                    archived_services_table.c.id, archived_services_table.c.service_id
+                )
+            )
+        )
+
+        now = datetime.utcnow()
+        db.session.execute(audit_events_table.insert().values([{
+            'type': audit_type.value,
+            'created_at': now,
+            'user': update_details['updated_by'],
+            'data': {
+                'supplierName': service.supplier.name,
+                'supplierId': service.supplier.supplier_id,
+                'serviceId': service.service_id,
+                'oldArchivedServiceId': last_archives.get(service.service_id),
+                'newArchivedServiceId': new_archives[service.service_id],
+            },
+            'object_type': Service.__name__,
+            'object_id': service.id,
+            'acknowledged': False,
+        } for service in updated_services]))
+
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        abort(400, e.orig)
+
+
 def index_service(service):
-    if (
-        service.framework.status == 'live' and
-        service.framework.framework == 'g-cloud' and
-        service.status == 'published'
-    ):
-        try:
-            search_api_client.index(service.service_id, service.serialize())
-        except dmapiclient.HTTPError as e:
-            current_app.logger.warning(
-                'Failed to add {} to search index: {}'.format(
-                    service.service_id, e.message))
+    """Queue the service to be indexed when the current transaction is committed"""
+    if is_indexable(service):
+        queue_search_index_update(service, 'index')
+
+
+def index_services(services):
+    for service in services:
+        index_service(service)
 
 
 def delete_service_from_index(service):
-    try:
-        search_api_client.delete(service.service_id)
-    except dmapiclient.HTTPError as e:
-        current_app.logger.warning(
-            'Failed to remove {} to search index: {}'.format(
-                service.service_id, e.message))
+    """Queue the service to be removed from the search index when the current transaction is committed"""
+    queue_search_index_update(service, 'delete')
 
 
 def create_service_from_draft(draft, status):
@@ -3,7 +3,7 @@ from sqlalchemy.exc import SQLAlchemyError
 
 from . import status
 from . import utils
-from ..models import Framework
+from ..framework_registry import get_frameworks
 from dmutils.status import get_flags
 
 
@@ -20,7 +20,7 @@ def status_no_db():
     try:
         return jsonify(
             status="ok",
-            frameworks={f.slug: f.status for f in Framework.query.all()},
+            frameworks={f.slug: f.status for f in get_frameworks()},
             version=version,
             db_version=utils.get_db_version(),
             flags=get_flags(current_app)
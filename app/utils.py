@@ -1,7 +1,19 @@
+import base64
+import binascii
+import json
+import weakref
+from datetime import datetime
+
 from flask import url_for as base_url_for
-from flask import abort, request
-from six import iteritems, string_types
+from flask import abort, request, _request_ctx_stack
+from six import integer_types, iteritems, string_types
+from sqlalchemy import asc, desc, tuple_
+from sqlalchemy.types import DateTime, Integer, String
 from werkzeug.exceptions import BadRequest
+from werkzeug.routing import parse_rule
+from werkzeug.urls import url_quote
+
+from dmutils.formats import DATETIME_FORMAT
 
 from .validation import validate_updater_json_or_400
 
@@ -23,9 +35,129 @@ def link(rel, href):
         return {rel: href}
 
 
-def url_for(*args, **kwargs):
-    kwargs.setdefault('_external', True)
-    return base_url_for(*args, **kwargs)
+def url_for(endpoint, **values):
+    """`flask.url_for`, making external URLs by default
+
+    Links are built with a compiled `LinkBuilder` where possible, as most serialized objects
+    have one or more links and werkzeug's URL building is relatively slow.
+    """
+    external = values.pop('_external', True)
+    if external:
+        link = build_link(endpoint, values)
+        if link is not None:
+            return link
+
+    return base_url_for(endpoint, _external=external, **values)
+
+
+class LinkBuilder(object):
+    """Builds external URLs for a URL rule from a format string compiled from the rule
+
+    Produces the same URLs as werkzeug's `MapAdapter.build` for rules without defaults or
+    subdomains, when given exactly the rule's arguments.
+    """
+
+    def __init__(self, rule):
+        self.arguments = frozenset(rule.arguments)
+        self._converters = []
+
+        template = []
+        for converter, _, variable in parse_rule(rule.rule):
+            if converter is None:
+                static = url_quote(variable, rule.map.charset, safe='/:|+')
+                template.append(static.replace('{', '{{').replace('}', '}}'))
+            else:
+                template.append('{}')
+                self._converters.append((variable, rule._converters[variable].to_url))
+        self._template = ''.join(template).lstrip('/')
+
+    @classmethod
+    def for_endpoint(cls, url_map, endpoint):
+        """Return a builder for the endpoint, or None if it can't be built by a `LinkBuilder`"""
+        rules = url_map._rules_by_endpoint.get(endpoint, [])
+        if len(rules) != 1 or url_map.host_matching:
+            return None
+        rule = rules[0]
+        if rule.defaults or rule.subdomain or rule.build_only:
+            return None
+        return cls(rule)
+
+    def can_build(self, values):
+        # Anything else (e.g. query string arguments, or None values which werkzeug drops)
+        # is left to werkzeug
+        return len(values) == len(self.arguments) and all(
+            values.get(argument) is not None for argument in self.arguments
+        )
+
+    def build(self, prefix, values):
+        return str(prefix + self._template.format(
+            *[to_url(values[variable]) for variable, to_url in self._converters]
+        ))
+
+
+# Compiled link builders (or None if the endpoint can't be compiled) for each URL map
+_link_builders = weakref.WeakKeyDictionary()
+
+
+class _RequestLinks(object):
+    """The link builders and external URL prefix for a request"""
+
+    def __init__(self, ctx):
+        self.url_map = ctx.app.url_map
+        self.builders = _link_builders.setdefault(self.url_map, {})
+        self.blueprint = ctx.request.blueprint
+
+        # As built by werkzeug's MapAdapter.build for external URLs
+        url_adapter = ctx.url_adapter
+        self.prefix = u'{}//{}{}/'.format(
+            url_adapter.url_scheme + ':' if url_adapter.url_scheme else '',
+            url_adapter.get_host(''),
+            url_adapter.script_name[:-1],
+        )
+
+    def build(self, endpoint, values):
+        if endpoint[:1] == '.':
+            endpoint = self.blueprint + endpoint if self.blueprint is not None else endpoint[1:]
+
+        try:
+            builder = self.builders[endpoint]
+        except KeyError:
+            builder = self.builders[endpoint] = LinkBuilder.for_endpoint(self.url_map, endpoint)
+
+        if builder is not None and builder.can_build(values):
+            return builder.build(self.prefix, values)
+
+
+def build_link(endpoint, values):
+    """Build an external URL for the endpoint in the current request with a `LinkBuilder`
+
+    Returns None if the URL needs to be built by `flask.url_for` instead, e.g. because it's
+    outside a request, it needs a query string, or the endpoint's rule can't be compiled.
+    """
+    ctx = _request_ctx_stack.top
+    if ctx is None or ctx.url_adapter is None or ctx.app.url_default_functions:
+        return None
+
+    links = getattr(ctx, 'dm_links', None)
+    if links is None:
+        links = ctx.dm_links = _RequestLinks(ctx)
+    return links.build(endpoint, values)
+
+
+def request_cache(name):
+    """Return a dict kept for the rest of the current request, or None outside a request.
+
+    Used to memoize values that are the same for every object serialized in a request. It's
+    kept on the request context rather than `flask.g` because `g` belongs to the app context,
+    which long-running commands like the search index worker keep open across requests.
+    """
+    ctx = _request_ctx_stack.top
+    if ctx is None:
+        return None
+
+    if not hasattr(ctx, 'dm_caches'):
+        ctx.dm_caches = {}
+    return ctx.dm_caches.setdefault(name, {})
 
 
 def get_valid_page_or_1():
@@ -50,6 +182,11 @@ def get_int_or_400(data, key):
 def pagination_links(pagination, endpoint, args):
     links = dict()
     links['self'] = url_for(endpoint, **args)
+    if isinstance(pagination, KeysetPagination):
+        if pagination.has_next:
+            next_args = [(k, v) for k, v in args.items() if k not in ('after', 'page')]
+            links['next'] = url_for(endpoint, **dict(next_args + [('after', pagination.next_cursor)]))
+        return links
     if pagination.has_prev:
         links['prev'] = url_for(endpoint, **dict(list(args.items()) + [('page', pagination.prev_num)]))
     if pagination.has_next:
@@ -58,6 +195,98 @@ def pagination_links(pagination, endpoint, args):
     return links
 
 
+def is_keyset_pagination_request():
+    """Whether the client asked for keyset ("seek") pagination by passing `after`, which may be empty for the first
+    page, instead of `page`"""
+    return 'after' in request.args
+
+
+class KeysetPagination(object):
+    """A page of results fetched with `keyset_paginate`
+
+    Has the attributes `pagination_links` needs, but no page numbers or total count: there is no
+    way to jump to an arbitrary page and counting all results is what we're trying to avoid.
+    """
+    has_prev = False
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _encode_cursor_value(value):
+    return value.strftime(DATETIME_FORMAT) if isinstance(value, datetime) else value
+
+
+def _decode_cursor_value(column, value):
+    """The cursor value for `column` as the column's type, or ValueError if it's the wrong type"""
+    if isinstance(column.type, DateTime):
+        if not isinstance(value, string_types):
+            raise ValueError("Expected a datetime cursor value")
+        return datetime.strptime(value, DATETIME_FORMAT)
+    if isinstance(column.type, Integer):
+        if not isinstance(value, integer_types) or isinstance(value, bool):
+            raise ValueError("Expected an integer cursor value")
+        return value
+    if isinstance(column.type, String):
+        if not isinstance(value, string_types):
+            raise ValueError("Expected a string cursor value")
+        return value
+    raise ValueError("Unsupported cursor column type")
+
+
+def encode_cursor(columns, item):
+    key = [_encode_cursor_value(getattr(item, column.key)) for column in columns]
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor_or_400(columns, cursor):
+    try:
+        cursor = cursor.encode('ascii')
+        key = json.loads(base64.urlsafe_b64decode(cursor + b'=' * (-len(cursor) % 4)).decode('utf-8'))
+        if not isinstance(key, list) or len(key) != len(columns):
+            raise ValueError("Wrong number of cursor values")
+        return [_decode_cursor_value(column, value) for column, value in zip(columns, key)]
+    except (TypeError, ValueError, binascii.Error):
+        abort(400, "Invalid after argument")
+
+
+def keyset_paginate(query, columns, after, per_page, descending=False):
+    """Return the page of `query` results following the row identified by the cursor `after`
+
+    Unlike `.paginate()` this doesn't use OFFSET or count the results, so fetching a page costs the
+    same however deep into the results it is. `columns` replace any existing ordering of `query` and
+    must uniquely identify a row (e.g. `created_at, id`).
+
+    :param after: cursor from a previous page's `next_cursor`, or an empty string for the first page
+    """
+    if per_page < 1:
+        abort(400, "Invalid page size")
+
+    if after:
+        key = decode_cursor_or_400(columns, after)
+        # The bound on the first column on its own is redundant, but unlike the row comparison
+        # the planner can use it to skip audit_events partitions
+        if descending:
+            query = query.filter(columns[0] <= key[0], tuple_(*columns) < tuple_(*key))
+        else:
+            query = query.filter(columns[0] >= key[0], tuple_(*columns) > tuple_(*key))
+
+    items = query.order_by(None).order_by(
+        *(desc(column) if descending else asc(column) for column in columns)
+    ).limit(per_page + 1).all()
+
+    if len(items) > per_page:
+        items = items[:per_page]
+        return KeysetPagination(items, encode_cursor(columns, items[-1]))
+
+    return KeysetPagination(items, None)
+
+
 def get_json_from_request():
     if request.content_type not in ['application/json',
                                     'application/json; charset=UTF-8']:
@@ -1,7 +1,10 @@
 import json
 import re
 import os
-import copy
+import pickle
+import threading
+import time
+from collections import OrderedDict
 from decimal import Decimal
 
 from flask import abort
@@ -67,38 +70,163 @@ SCHEMA_NAMES = [
 ]
 FORMAT_CHECKER = FormatChecker()
 
+# Enough for every schema in both its strict form and a good number of distinct
+# page-question sets in relaxed form
+VALIDATOR_CACHE_SIZE = 512
+
+
+def load_schema(schemas_path, schema_name):
+    schema_path = os.path.join(schemas_path, '{}.json'.format(schema_name))
+
+    with open(schema_path) as f:
+        schema = json.load(f)
+        validator = validator_for(schema)
+        validator.check_schema(schema)
+        return schema
+
 
 def load_schemas(schemas_path, schema_names):
-    loaded_schemas = {}
-    for schema_name in schema_names:
-        schema_path = os.path.join(schemas_path, '{}.json'.format(schema_name))
+    return {schema_name: load_schema(schemas_path, schema_name) for schema_name in schema_names}
 
-        with open(schema_path) as f:
-            schema = json.load(f)
-            validator = validator_for(schema)
-            validator.check_schema(schema)
-            loaded_schemas[schema_name] = schema
-    return loaded_schemas
 
+class SchemaRegistry(object):
+    """Mapping of schema name to schema, loading each schema the first time it's used.
 
-_SCHEMAS = load_schemas(JSON_SCHEMAS_PATH, SCHEMA_NAMES)
+    Reading and meta-validating every schema up front is slow enough to show up in
+    the start-up time of every worker, script and test run, most of which only need
+    a handful of them. Deployed apps can still load everything at start-up with
+    `preload`, optionally from a bundle built by `scripts/build_schema_bundle.py`.
+    """
 
+    def __init__(self, schemas_path, schema_names):
+        self.schemas_path = schemas_path
+        self.schema_names = frozenset(schema_names)
+        self._schemas = {}
+        self._lock = threading.Lock()
 
-def get_validator(schema_name, enforce_required=True, required_fields=None):
-    if required_fields is None:
-        required_fields = []
-    if enforce_required:
-        schema = _SCHEMAS[schema_name]
-    else:
-        schema = copy.deepcopy(_SCHEMAS[schema_name])
-        schema['required'] = [
-            field for field in schema.get('required', [])
-            if field in required_fields
-        ]
-        schema.pop('anyOf', None)
+    def __contains__(self, schema_name):
+        return schema_name in self.schema_names
+
+    def __getitem__(self, schema_name):
+        try:
+            return self._schemas[schema_name]
+        except KeyError:
+            pass
+
+        if schema_name not in self.schema_names:
+            raise KeyError(schema_name)
+
+        with self._lock:
+            if schema_name not in self._schemas:
+                self._schemas[schema_name] = load_schema(self.schemas_path, schema_name)
+
+        return self._schemas[schema_name]
+
+    def loaded_schema_names(self):
+        return set(self._schemas.keys())
+
+    def preload(self, bundle_path=None):
+        """Load all schemas now, taking already meta-validated ones from `bundle_path` if given"""
+        if bundle_path is not None:
+            with open(bundle_path, 'rb') as f:
+                bundled_schemas = pickle.load(f)
+            with self._lock:
+                self._schemas.update(
+                    (name, schema) for name, schema in bundled_schemas.items() if name in self.schema_names
+                )
+
+        for schema_name in self.schema_names:
+            self[schema_name]
+
+
+def build_schema_bundle(bundle_path, schemas_path=JSON_SCHEMAS_PATH, schema_names=SCHEMA_NAMES):
+    """Meta-validate every schema and write them all to a pickle for `SchemaRegistry.preload`"""
+    schemas = load_schemas(schemas_path, schema_names)
+    with open(bundle_path, 'wb') as f:
+        pickle.dump(schemas, f, pickle.HIGHEST_PROTOCOL)
+
+    return schemas
+
+
+_SCHEMAS = SchemaRegistry(JSON_SCHEMAS_PATH, SCHEMA_NAMES)
+
+
+def preload_schemas(bundle_path=None):
+    _SCHEMAS.preload(bundle_path)
+
+
+class ValidatorCache(object):
+    """Bounded LRU cache of ready-to-use validator instances.
+
+    jsonschema validators hold no per-validation state, so a single instance can
+    be shared between requests. Building one (and, for relaxed validation, a copy
+    of the schema) on every call dominates the cost of validating draft autosaves.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._validators = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._validators)
+
+    def get(self, key, factory):
+        with self._lock:
+            validator = self._validators.pop(key, None)
+            if validator is not None:
+                self._validators[key] = validator
+                return validator
+
+        validator = factory()
+
+        with self._lock:
+            self._validators[key] = validator
+            while len(self._validators) > self.maxsize:
+                self._validators.popitem(last=False)
+
+        return validator
+
+    def clear(self):
+        with self._lock:
+            self._validators.clear()
+
+
+_VALIDATORS = ValidatorCache(VALIDATOR_CACHE_SIZE)
+
+
+def _relaxed_schema(schema, required_fields):
+    """Return a copy of `schema` only requiring the fields in `required_fields`
+
+    Only top-level keys are changed, so a shallow copy is enough and the (large)
+    nested property definitions are shared with the original schema.
+    """
+    relaxed_schema = dict(schema)
+    relaxed_schema['required'] = [
+        field for field in schema.get('required', [])
+        if field in required_fields
+    ]
+    relaxed_schema.pop('anyOf', None)
+    return relaxed_schema
+
+
+def _build_validator(schema_name, enforce_required, required_fields):
+    schema = _SCHEMAS[schema_name]
+    if not enforce_required:
+        schema = _relaxed_schema(schema, required_fields)
     return validator_for(schema)(schema, format_checker=FORMAT_CHECKER)
 
 
+def get_validator(schema_name, enforce_required=True, required_fields=None):
+    # required_fields only has an effect on relaxed validators, so don't let it
+    # fragment the cache for the strict ones
+    required_fields = frozenset(required_fields or []) if not enforce_required else frozenset()
+    return _VALIDATORS.get(
+        (schema_name, enforce_required, required_fields),
+        lambda: _build_validator(schema_name, enforce_required, required_fields)
+    )
+
+
 def validate_updater_json_or_400(submitted_json):
     try:
         get_validator('services-update').validate(submitted_json)
@@ -377,12 +505,72 @@ def _get_word_count(message):
 
 def load_buyer_email_domains(path):
     with open(path) as f:
-        return [line.strip() for line in f]
+        return [line.strip() for line in f if line.strip()]
+
+
+class BuyerEmailDomains(object):
+    """Index of the buyer email domains listed in a file, reloaded when the file changes.
+
+    Domains are stored as a trie of their labels in reverse order (`gov.uk` is
+    `{'uk': {'gov': {None: True}}}`), so checking an address takes one lookup per label
+    of its domain however many domains are listed.
+
+    The file's mtime is checked at most once every `MTIME_CHECK_INTERVAL` seconds. A new
+    index is built before replacing the old one, so replace the file with a rename to
+    stop a half-written file being loaded.
+    """
+    MTIME_CHECK_INTERVAL = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._trie = {}
+        self._mtime = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build_trie(domains):
+        trie = {}
+        for domain in domains:
+            node = trie
+            for label in reversed(domain.split('.')):
+                node = node.setdefault(label, {})
+            node[None] = True
+        return trie
+
+    def _reload_if_changed(self):
+        if time.time() - self._checked_at < self.MTIME_CHECK_INTERVAL:
+            return
+
+        with self._lock:
+            if time.time() - self._checked_at < self.MTIME_CHECK_INTERVAL:
+                return
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    self._trie = self._build_trie(load_buyer_email_domains(self.path))
+                    self._mtime = mtime
+            except (IOError, OSError):
+                # Keep the domains we have if the file is missing while it's being replaced
+                if self._mtime is None:
+                    raise
+            self._checked_at = time.time()
+
+    def is_valid(self, email):
+        self._reload_if_changed()
+
+        node = self._trie
+        for label in reversed(email.split('@')[-1].split('.')):
+            node = node.get(label)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
 
 
-_BUYER_EMAIL_DOMAINS = load_buyer_email_domains('./data/buyer-email-domains.txt')
+_BUYER_EMAIL_DOMAINS = BuyerEmailDomains('./data/buyer-email-domains.txt')
 
 
 def is_valid_buyer_email(email):
-    domain = email.split('@')[-1]
-    return any(domain == d or domain.endswith('.' + d) for d in _BUYER_EMAIL_DOMAINS)
+    return _BUYER_EMAIL_DOMAINS.is_valid(email)
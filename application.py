@@ -3,11 +3,14 @@
 from __future__ import print_function
 
 import os
+import time
 
 from dmutils import init_manager
 from flask.ext.migrate import Migrate, MigrateCommand
 
-from app import create_app, db
+from app import audit_partitions, create_app, db, framework_stats
+from app.models import Framework
+from app.search_index import reindex_services, run_search_index_worker
 
 
 application = create_app(os.getenv('DM_ENVIRONMENT') or 'development')
@@ -17,5 +20,80 @@ migrate = Migrate(application, db)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.option('--batch-size', dest='batch_size', type=int, default=None,
+                help='Maximum number of queued updates to send per batch')
+@manager.option('--poll-interval', dest='poll_interval', type=float, default=None,
+                help='Seconds to wait before checking an empty queue again')
+@manager.option('--once', dest='once', action='store_true', default=False,
+                help='Exit once there are no more queued updates due to be sent')
+def search_index_worker(batch_size, poll_interval, once):
+    """Send queued service updates to the search API"""
+    with application.app_context():
+        run_search_index_worker(batch_size=batch_size, poll_interval=poll_interval, once=once)
+
+
+@manager.option('--resume-from', dest='resume_from', default=None,
+                help='Only index services with a service ID after this one')
+@manager.option('--processes', dest='processes', type=int, default=4,
+                help='Number of worker processes serializing and indexing services')
+@manager.option('--chunk-size', dest='chunk_size', type=int, default=100,
+                help='Number of services sent to a worker at a time')
+def reindex(resume_from, processes, chunk_size):
+    """Index all published services on live G-Cloud frameworks"""
+    start = time.time()
+    indexed, failed = 0, []
+
+    with application.app_context():
+        for last_service_id, chunk_indexed, chunk_failed in reindex_services(resume_from, processes, chunk_size):
+            indexed += chunk_indexed
+            failed.extend(chunk_failed)
+            print("Indexed {} services ({:.1f}/s), resume from {}".format(
+                indexed, indexed / (time.time() - start), last_service_id))
+
+    print("Indexed {} services in {:.1f}s".format(indexed, time.time() - start))
+    if failed:
+        print("Failed to index {} services: {}".format(len(failed), ", ".join(failed)))
+
+
+@manager.option('--framework', dest='framework_slug', default=None,
+                help='Only reconcile the stats for this framework')
+@manager.option('--dry-run', dest='dry_run', action='store_true', default=False,
+                help='Report drift without correcting it')
+def reconcile_framework_stats(framework_slug, dry_run):
+    """Recompute the framework application stats and report any that had drifted"""
+    with application.app_context():
+        framework_ids = None
+        if framework_slug:
+            framework_ids = [Framework.query.filter(Framework.slug == framework_slug).one().id]
+
+        drift = framework_stats.reconcile_framework_stats(framework_ids, dry_run=dry_run)
+
+    for table, key, recorded, expected in drift:
+        print("{} {}: recorded {}, expected {}".format(table, key, recorded, expected))
+    print("{} counts had drifted{}".format(len(drift), "" if dry_run or not drift else ", corrected"))
+
+
+@manager.option('--months-ahead', dest='months_ahead', type=int, default=3,
+                help='Number of months after this one to create partitions for')
+def create_audit_partitions(months_ahead):
+    """Create the monthly audit_events partitions that don't exist yet"""
+    with application.app_context():
+        created = audit_partitions.create_partitions(months_ahead)
+
+    print("Created {} partitions{}".format(len(created), "".join("\n  " + name for name in created)))
+
+
+@manager.option('--archive-dir', dest='archive_dir', required=True,
+                help='Directory to write the exported partitions to')
+@manager.option('--retain-months', dest='retain_months', type=int, required=True,
+                help='Number of months before this one to keep partitions for')
+def archive_audit_partitions(archive_dir, retain_months):
+    """Export old audit_events partitions to gzipped CSV files and drop them"""
+    with application.app_context():
+        archived = audit_partitions.archive_partitions(archive_dir, retain_months)
+
+    print("Archived {} partitions{}".format(len(archived), "".join("\n  " + path for path in archived)))
+
+
 if __name__ == '__main__':
     manager.run()
@@ -10,6 +10,8 @@ class Config:
     DM_SEARCH_API_URL = None
     DM_SEARCH_API_AUTH_TOKEN = None
     DM_API_AUTH_TOKENS = None
+    # Used for links in services sent to the search API by the search index worker
+    DM_API_BASE_URL = 'http://localhost:5000'
     ES_ENABLED = True
     ALLOW_EXPLORER = True
     AUTH_REQUIRED = True
@@ -31,12 +33,48 @@ class Config:
     DM_API_SUPPLIERS_PAGE_SIZE = 100
     DM_API_BRIEFS_PAGE_SIZE = 100
     DM_API_BRIEF_RESPONSES_PAGE_SIZE = 100
+    DM_API_SERVICES_EXPORT_BATCH_SIZE = 500
+    DM_API_USERS_EXPORT_BATCH_SIZE = 500
+    DM_API_SERVICES_BULK_UPDATE_LIMIT = 1000
+    DM_API_BUYER_EMAIL_CHECK_LIMIT = 10000
+    DM_API_AUDIT_EVENTS_BULK_LIMIT = 1000
+    # Autosave audit payloads are stored as deltas, with a full snapshot after this many,
+    # see app/audit_deltas.py
+    DM_API_AUDIT_SNAPSHOT_INTERVAL = 10
     SQLALCHEMY_COMMIT_ON_TEARDOWN = False
     SQLALCHEMY_RECORD_QUERIES = True
+    # Return per-request query counts and timings in DM-Query-* headers, see app/query_stats.py
+    DM_API_QUERY_STATS_HEADERS = False
     SQLALCHEMY_DATABASE_URI = 'postgresql://localhost/digitalmarketplace'
 
     DM_FAILED_LOGIN_LIMIT = 5
 
+    # Password hashing, see app/encryption.py. Hashes made with a different number of rounds
+    # are updated on login. Hashing is limited to DM_PASSWORD_HASHING_CONCURRENCY processes
+    # per host, and requests that can't start hashing within the timeout (in seconds) get a 503
+    DM_PASSWORD_HASH_ROUNDS = 10
+    DM_PASSWORD_HASHING_CONCURRENCY = 2
+    DM_PASSWORD_HASHING_TIMEOUT = 0.5
+    DM_PASSWORD_HASHING_LOCK_DIR = None
+
+    # Search index worker, see app/search_index.py. Retry delays are in seconds and
+    # double after each failed attempt
+    DM_SEARCH_INDEX_BATCH_SIZE = 100
+    DM_SEARCH_INDEX_POLL_INTERVAL = 5
+    DM_SEARCH_INDEX_RETRY_DELAY = 10
+    DM_SEARCH_INDEX_MAX_RETRY_DELAY = 3600
+    DM_SEARCH_INDEX_MAX_ATTEMPTS = 10
+
+    # JSON schemas are loaded on first use unless preloaded at start-up, optionally
+    # from a bundle built by scripts/build_schema_bundle.py
+    DM_PRELOAD_SCHEMAS = False
+    DM_SCHEMA_BUNDLE_PATH = None
+
+    # Frameworks and lots are cached in each process, see app/framework_registry.py. Changes
+    # are picked up through Postgres NOTIFY or, if a notification is missed, after the TTL
+    DM_FRAMEWORK_REGISTRY_TTL = 300
+    DM_FRAMEWORK_REGISTRY_LISTEN = True
+
     VCAP_SERVICES = None
 
 
@@ -47,16 +85,27 @@ class Test(Config):
     ES_ENABLED = False
     SQLALCHEMY_DATABASE_URI = 'postgresql://localhost/digitalmarketplace_test'
     DM_API_AUTH_TOKENS = 'myToken'
+    DM_API_BASE_URL = 'http://localhost'
     DM_API_SERVICES_PAGE_SIZE = 5
     DM_API_SUPPLIERS_PAGE_SIZE = 5
     DM_API_BRIEFS_PAGE_SIZE = 5
     DM_API_BRIEF_RESPONSES_PAGE_SIZE = 5
+    DM_API_SERVICES_EXPORT_BATCH_SIZE = 2
+    DM_API_USERS_EXPORT_BATCH_SIZE = 2
+    DM_API_SERVICES_BULK_UPDATE_LIMIT = 3
+    DM_API_BUYER_EMAIL_CHECK_LIMIT = 3
+    DM_API_AUDIT_EVENTS_BULK_LIMIT = 5
+    DM_API_AUDIT_SNAPSHOT_INTERVAL = 2
+    DM_FRAMEWORK_REGISTRY_TTL = 0
+    DM_PASSWORD_HASH_ROUNDS = 4
+    DM_FRAMEWORK_REGISTRY_LISTEN = False
     FEATURE_FLAGS_TRANSACTION_ISOLATION = enabled_since('2015-08-27')
     FEATURE_FLAGS_NEW_SUPPLIER_FLOW = enabled_since('2016-11-29')
 
 
 class Development(Config):
     DEBUG = True
+    DM_API_QUERY_STATS_HEADERS = True
 
     DM_API_AUTH_TOKENS = 'myToken'
     DM_SEARCH_API_AUTH_TOKEN = 'myToken'
@@ -71,6 +120,9 @@ class Live(Config):
     ALLOW_EXPLORER = False
     DM_HTTP_PROTO = 'https'
     DM_LOG_PATH = '/var/log/digitalmarketplace/application.log'
+    DM_PRELOAD_SCHEMAS = True
+    # Must be set in the environment, or links sent to the search API would point at localhost
+    DM_API_BASE_URL = None
 
 
 class Preview(Live):
@@ -0,0 +1,35 @@
+"""Add search index outbox table
+
+Revision ID: 870
+Revises: 860
+Create Date: 2026-10-18 10:12:31.204117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '870'
+down_revision = '860'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('search_index_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.String(), nullable=False),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_search_index_outbox_service_id'), 'search_index_outbox', ['service_id'], unique=False)
+    op.create_index(op.f('ix_search_index_outbox_next_attempt_at'), 'search_index_outbox', ['next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_search_index_outbox_next_attempt_at'), table_name='search_index_outbox')
+    op.drop_index(op.f('ix_search_index_outbox_service_id'), table_name='search_index_outbox')
+    op.drop_table('search_index_outbox')
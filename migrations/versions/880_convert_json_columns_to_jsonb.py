@@ -0,0 +1,47 @@
+"""Convert JSON columns to JSONB and add a GIN index on services.data
+
+Rewrites each table, so expect this to take a while on audit_events.
+
+Revision ID: 880
+Revises: 870
+Create Date: 2026-10-18 14:02:47.318542
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '880'
+down_revision = '870'
+
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+JSON_COLUMNS = [
+    ('lots', 'data'),
+    ('frameworks', 'framework_agreement_details'),
+    ('suppliers', 'clients'),
+    ('supplier_frameworks', 'declaration'),
+    ('supplier_frameworks', 'agreed_variations'),
+    ('framework_agreements', 'signed_agreement_details'),
+    ('framework_agreements', 'countersigned_agreement_details'),
+    ('services', 'data'),
+    ('archived_services', 'data'),
+    ('draft_services', 'data'),
+    ('audit_events', 'data'),
+    ('briefs', 'data'),
+    ('brief_responses', 'data'),
+]
+
+
+def upgrade():
+    for table, column in JSON_COLUMNS:
+        op.alter_column(table, column, type_=postgresql.JSONB(), postgresql_using='{}::jsonb'.format(column))
+
+    op.create_index('ix_services_data', 'services', ['data'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_services_data', table_name='services')
+
+    for table, column in JSON_COLUMNS:
+        op.alter_column(table, column, type_=postgresql.JSON(), postgresql_using='{}::json'.format(column))
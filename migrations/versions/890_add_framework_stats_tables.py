@@ -0,0 +1,298 @@
+"""Add framework application stats tables maintained by triggers
+
+Draft services are counted by framework, lot, draft status and the supplier's declaration
+status, and suppliers by framework, declaration status and whether they have submitted a
+draft, so the framework stats endpoint doesn't have to aggregate the whole tables. Only
+suppliers with a declaration (and their drafts) are counted, and a declaration with no
+status is counted under ''.
+
+The counts are kept up to date by triggers on `draft_services` and `supplier_frameworks`,
+so they change in the same transaction as the drafts and declarations, however those are
+changed. `./application.py reconcile_framework_stats` recomputes them and reports drift.
+
+Revision ID: 890
+Revises: 880
+Create Date: 2026-10-18 20:02:45.117204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '890'
+down_revision = '880'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+FUNCTIONS = """
+CREATE OR REPLACE FUNCTION framework_draft_stats_add(
+    _framework_id bigint, _lot_id bigint, _draft_status varchar, _declaration_status varchar, _delta integer
+) RETURNS void AS $$
+BEGIN
+    IF _delta = 0 THEN
+        RETURN;
+    END IF;
+    LOOP
+        UPDATE framework_draft_stats SET draft_count = draft_count + _delta
+        WHERE framework_id = _framework_id AND lot_id = _lot_id
+          AND draft_status = _draft_status AND declaration_status = _declaration_status;
+        -- a missing row can only be decremented if the counts were cleared, leave it for reconciliation
+        IF found OR _delta < 0 THEN
+            RETURN;
+        END IF;
+        BEGIN
+            INSERT INTO framework_draft_stats (framework_id, lot_id, draft_status, declaration_status, draft_count)
+            VALUES (_framework_id, _lot_id, _draft_status, _declaration_status, _delta);
+            RETURN;
+        EXCEPTION WHEN unique_violation THEN
+            -- inserted by a concurrent transaction, update it instead
+        END;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION framework_supplier_stats_add(
+    _framework_id bigint, _declaration_status varchar, _has_completed_services boolean, _delta integer
+) RETURNS void AS $$
+BEGIN
+    IF _delta = 0 THEN
+        RETURN;
+    END IF;
+    LOOP
+        UPDATE framework_supplier_stats SET supplier_count = supplier_count + _delta
+        WHERE framework_id = _framework_id AND declaration_status = _declaration_status
+          AND has_completed_services = _has_completed_services;
+        IF found OR _delta < 0 THEN
+            RETURN;
+        END IF;
+        BEGIN
+            INSERT INTO framework_supplier_stats (framework_id, declaration_status, has_completed_services, supplier_count)
+            VALUES (_framework_id, _declaration_status, _has_completed_services, _delta);
+            RETURN;
+        EXCEPTION WHEN unique_violation THEN
+            -- as above
+        END;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Move a supplier between has_completed_services buckets if a change of _delta submitted
+-- drafts is about to take them from none to some or back. Called from a BEFORE trigger,
+-- so the count doesn't include the change but does include earlier rows in the statement
+CREATE OR REPLACE FUNCTION framework_supplier_stats_submitted_changed(
+    _supplier_id bigint, _framework_id bigint, _delta integer
+) RETURNS void AS $$
+DECLARE
+    _declaration_status varchar;
+    _submitted integer;
+BEGIN
+    IF _delta = 0 THEN
+        RETURN;
+    END IF;
+
+    -- Locking the supplier framework (as the draft services trigger already has) serialises
+    -- changes to the same supplier's drafts and declaration, so the count below includes any
+    -- made by transactions that committed while we waited
+    SELECT coalesce(declaration->>'status', '') INTO _declaration_status
+    FROM supplier_frameworks
+    WHERE supplier_id = _supplier_id AND framework_id = _framework_id AND declaration IS NOT NULL
+    FOR UPDATE;
+    IF NOT found THEN
+        RETURN;
+    END IF;
+
+    SELECT count(*) INTO _submitted FROM draft_services
+    WHERE supplier_id = _supplier_id AND framework_id = _framework_id AND status = 'submitted';
+
+    IF (_submitted > 0) <> (_submitted + _delta > 0) THEN
+        PERFORM framework_supplier_stats_add(_framework_id, _declaration_status, _submitted > 0, -1);
+        PERFORM framework_supplier_stats_add(_framework_id, _declaration_status, _submitted + _delta > 0, 1);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION draft_services_update_framework_stats() RETURNS trigger AS $$
+DECLARE
+    _declaration_status varchar;
+BEGIN
+    -- Lock the supplier framework so its declaration status can't change until we commit
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT coalesce(declaration->>'status', '') INTO _declaration_status
+        FROM supplier_frameworks
+        WHERE supplier_id = OLD.supplier_id AND framework_id = OLD.framework_id AND declaration IS NOT NULL
+        FOR UPDATE;
+        IF found THEN
+            PERFORM framework_draft_stats_add(OLD.framework_id, OLD.lot_id, OLD.status, _declaration_status, -1);
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        SELECT coalesce(declaration->>'status', '') INTO _declaration_status
+        FROM supplier_frameworks
+        WHERE supplier_id = NEW.supplier_id AND framework_id = NEW.framework_id AND declaration IS NOT NULL
+        FOR UPDATE;
+        IF found THEN
+            PERFORM framework_draft_stats_add(NEW.framework_id, NEW.lot_id, NEW.status, _declaration_status, 1);
+        END IF;
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND OLD.supplier_id = NEW.supplier_id AND OLD.framework_id = NEW.framework_id THEN
+        PERFORM framework_supplier_stats_submitted_changed(
+            NEW.supplier_id, NEW.framework_id,
+            (NEW.status = 'submitted')::integer - (OLD.status = 'submitted')::integer
+        );
+    ELSE
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM framework_supplier_stats_submitted_changed(
+                OLD.supplier_id, OLD.framework_id, -(OLD.status = 'submitted')::integer
+            );
+        END IF;
+        IF TG_OP IN ('UPDATE', 'INSERT') THEN
+            PERFORM framework_supplier_stats_submitted_changed(
+                NEW.supplier_id, NEW.framework_id, (NEW.status = 'submitted')::integer
+            );
+        END IF;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION supplier_frameworks_update_framework_stats() RETURNS trigger AS $$
+DECLARE
+    _old_status varchar;
+    _new_status varchar;
+    _draft record;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.declaration IS NOT NULL THEN
+        _old_status := coalesce(OLD.declaration->>'status', '');
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.declaration IS NOT NULL THEN
+        _new_status := coalesce(NEW.declaration->>'status', '');
+    END IF;
+
+    -- Most declaration updates are answers being saved, which don't change the counts
+    IF TG_OP = 'UPDATE' AND _old_status IS NOT DISTINCT FROM _new_status
+            AND OLD.supplier_id = NEW.supplier_id AND OLD.framework_id = NEW.framework_id THEN
+        RETURN NULL;
+    END IF;
+
+    IF _old_status IS NOT NULL THEN
+        FOR _draft IN
+            SELECT lot_id, status, count(*) AS draft_count FROM draft_services
+            WHERE supplier_id = OLD.supplier_id AND framework_id = OLD.framework_id
+            GROUP BY lot_id, status
+        LOOP
+            PERFORM framework_draft_stats_add(
+                OLD.framework_id, _draft.lot_id, _draft.status, _old_status, -_draft.draft_count::integer
+            );
+        END LOOP;
+        PERFORM framework_supplier_stats_add(
+            OLD.framework_id, _old_status,
+            EXISTS(
+                SELECT 1 FROM draft_services
+                WHERE supplier_id = OLD.supplier_id AND framework_id = OLD.framework_id AND status = 'submitted'
+            ),
+            -1
+        );
+    END IF;
+
+    IF _new_status IS NOT NULL THEN
+        FOR _draft IN
+            SELECT lot_id, status, count(*) AS draft_count FROM draft_services
+            WHERE supplier_id = NEW.supplier_id AND framework_id = NEW.framework_id
+            GROUP BY lot_id, status
+        LOOP
+            PERFORM framework_draft_stats_add(
+                NEW.framework_id, _draft.lot_id, _draft.status, _new_status, _draft.draft_count::integer
+            );
+        END LOOP;
+        PERFORM framework_supplier_stats_add(
+            NEW.framework_id, _new_status,
+            EXISTS(
+                SELECT 1 FROM draft_services
+                WHERE supplier_id = NEW.supplier_id AND framework_id = NEW.framework_id AND status = 'submitted'
+            ),
+            1
+        );
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- BEFORE rather than AFTER, as AFTER row triggers run once the whole statement has changed
+-- the table, so counting submitted drafts can't tell which row took a supplier past zero
+CREATE TRIGGER draft_services_update_framework_stats
+BEFORE INSERT OR DELETE OR UPDATE OF status, lot_id, framework_id, supplier_id ON draft_services
+FOR EACH ROW EXECUTE PROCEDURE draft_services_update_framework_stats();
+
+CREATE TRIGGER supplier_frameworks_update_framework_stats
+AFTER INSERT OR DELETE OR UPDATE OF declaration, framework_id, supplier_id ON supplier_frameworks
+FOR EACH ROW EXECUTE PROCEDURE supplier_frameworks_update_framework_stats();
+"""
+
+POPULATE = """
+INSERT INTO framework_draft_stats (framework_id, lot_id, draft_status, declaration_status, draft_count)
+SELECT draft_services.framework_id, draft_services.lot_id, draft_services.status,
+       coalesce(supplier_frameworks.declaration->>'status', ''), count(*)
+FROM draft_services
+JOIN supplier_frameworks ON supplier_frameworks.supplier_id = draft_services.supplier_id
+                        AND supplier_frameworks.framework_id = draft_services.framework_id
+WHERE supplier_frameworks.declaration IS NOT NULL
+GROUP BY 1, 2, 3, 4;
+
+INSERT INTO framework_supplier_stats (framework_id, declaration_status, has_completed_services, supplier_count)
+SELECT supplier_frameworks.framework_id, coalesce(supplier_frameworks.declaration->>'status', ''),
+       EXISTS(
+           SELECT 1 FROM draft_services
+           WHERE draft_services.supplier_id = supplier_frameworks.supplier_id
+             AND draft_services.framework_id = supplier_frameworks.framework_id
+             AND draft_services.status = 'submitted'
+       ),
+       count(*)
+FROM supplier_frameworks
+WHERE supplier_frameworks.declaration IS NOT NULL
+GROUP BY 1, 2, 3;
+"""
+
+
+def upgrade():
+    op.create_table('framework_draft_stats',
+    sa.Column('framework_id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('draft_status', sa.String(), nullable=False),
+    sa.Column('declaration_status', sa.String(), nullable=False),
+    sa.Column('draft_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['framework_id'], ['frameworks.id'], ),
+    sa.ForeignKeyConstraint(['lot_id'], ['lots.id'], ),
+    sa.PrimaryKeyConstraint('framework_id', 'lot_id', 'draft_status', 'declaration_status')
+    )
+    op.create_table('framework_supplier_stats',
+    sa.Column('framework_id', sa.Integer(), nullable=False),
+    sa.Column('declaration_status', sa.String(), nullable=False),
+    sa.Column('has_completed_services', sa.Boolean(), nullable=False),
+    sa.Column('supplier_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['framework_id'], ['frameworks.id'], ),
+    sa.PrimaryKeyConstraint('framework_id', 'declaration_status', 'has_completed_services')
+    )
+
+    op.execute(FUNCTIONS)
+    op.execute(POPULATE)
+
+
+def downgrade():
+    op.execute("""
+        DROP TRIGGER supplier_frameworks_update_framework_stats ON supplier_frameworks;
+        DROP TRIGGER draft_services_update_framework_stats ON draft_services;
+        DROP FUNCTION supplier_frameworks_update_framework_stats();
+        DROP FUNCTION draft_services_update_framework_stats();
+        DROP FUNCTION framework_supplier_stats_submitted_changed(bigint, bigint, integer);
+        DROP FUNCTION framework_supplier_stats_add(bigint, varchar, boolean, integer);
+        DROP FUNCTION framework_draft_stats_add(bigint, bigint, varchar, varchar, integer);
+    """)
+    op.drop_table('framework_supplier_stats')
+    op.drop_table('framework_draft_stats')
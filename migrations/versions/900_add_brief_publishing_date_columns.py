@@ -0,0 +1,57 @@
+"""Store the dates briefs close for applications and clarification questions
+
+They used to be worked out from published_at and the brief's requirementsLength on every
+read, which meant filtering briefs by status couldn't use an index. The model now sets them
+whenever published_at or the brief data changes; this fills them in for briefs that have
+already been published.
+
+Revision ID: 900
+Revises: 890
+Create Date: 2026-10-18 14:02:11.530244
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '900'
+down_revision = '890'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import text
+
+from dmutils.dates import get_publishing_dates
+
+
+def upgrade():
+    op.add_column('briefs', sa.Column('applications_closed_at', sa.DateTime(), nullable=True))
+    op.add_column('briefs', sa.Column('clarification_questions_closed_at', sa.DateTime(), nullable=True))
+    op.add_column('briefs', sa.Column('clarification_questions_published_by', sa.DateTime(), nullable=True))
+
+    conn = op.get_bind()
+    published_briefs = conn.execute("""
+        SELECT id, published_at, data->>'requirementsLength'
+        FROM briefs
+        WHERE published_at IS NOT NULL
+    """).fetchall()
+
+    for brief_id, published_at, requirements_length in published_briefs:
+        dates = get_publishing_dates({
+            'publishedAt': published_at.replace(hour=23, minute=59, second=59, microsecond=0),
+            'requirementsLength': requirements_length,
+        })
+        conn.execute(text("""
+            UPDATE briefs
+            SET applications_closed_at = :closing_date,
+                clarification_questions_closed_at = :questions_close,
+                clarification_questions_published_by = :answers_close
+            WHERE id = :brief_id
+        """), brief_id=brief_id, **{key: dates[key] for key in ['closing_date', 'questions_close', 'answers_close']})
+
+    op.create_index(op.f('ix_briefs_applications_closed_at'), 'briefs', ['applications_closed_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_briefs_applications_closed_at'), table_name='briefs')
+    op.drop_column('briefs', 'clarification_questions_published_by')
+    op.drop_column('briefs', 'clarification_questions_closed_at')
+    op.drop_column('briefs', 'applications_closed_at')
@@ -0,0 +1,81 @@
+"""Add service_brief_eligibility, maintained by a trigger on services
+
+A supplier can respond to a brief if they have a published service on the brief's framework
+and lot (and, for digital specialists, offering the brief's role - a `<role>Locations` key in
+the service data). Checking that against services meant subqueries on frameworks and lots
+and a key lookup in the service JSON, so this table holds a row for each published service
+with an empty role, plus one for each role it offers, and eligibility is an index lookup.
+
+Revision ID: 910
+Revises: 900
+Create Date: 2026-10-18 15:21:47.118402
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '910'
+down_revision = '900'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+SERVICE_ROLES = """
+    SELECT '' AS role
+    UNION ALL
+    SELECT left(key, -length('Locations')) FROM jsonb_object_keys({data}) AS key
+    WHERE key LIKE '%Locations' AND key <> 'Locations'
+"""
+
+FUNCTIONS = """
+CREATE OR REPLACE FUNCTION services_update_brief_eligibility() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM service_brief_eligibility WHERE service_id = OLD.id;
+    END IF;
+
+    IF NEW.status = 'published' THEN
+        INSERT INTO service_brief_eligibility (service_id, role, supplier_id, framework_id, lot_id)
+        SELECT NEW.id, roles.role, NEW.supplier_id, NEW.framework_id, NEW.lot_id
+        FROM ({service_roles}) AS roles;
+    END IF;
+
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER services_update_brief_eligibility
+    AFTER INSERT OR UPDATE OF status, data, supplier_id, framework_id, lot_id ON services
+    FOR EACH ROW EXECUTE PROCEDURE services_update_brief_eligibility();
+""".format(service_roles=SERVICE_ROLES.format(data='NEW.data'))
+
+POPULATE = """
+INSERT INTO service_brief_eligibility (service_id, role, supplier_id, framework_id, lot_id)
+SELECT services.id, roles.role, services.supplier_id, services.framework_id, services.lot_id
+FROM services, LATERAL ({service_roles}) AS roles
+WHERE services.status = 'published';
+""".format(service_roles=SERVICE_ROLES.format(data='services.data'))
+
+
+def upgrade():
+    op.create_table('service_brief_eligibility',
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(), nullable=False),
+    sa.Column('supplier_id', sa.BigInteger(), nullable=False),
+    sa.Column('framework_id', sa.BigInteger(), nullable=False),
+    sa.Column('lot_id', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('service_id', 'role')
+    )
+    op.create_index('ix_service_brief_eligibility_brief', 'service_brief_eligibility',
+                    ['framework_id', 'lot_id', 'role', 'supplier_id'], unique=False)
+
+    op.execute(FUNCTIONS)
+    op.execute(POPULATE)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER services_update_brief_eligibility ON services')
+    op.execute('DROP FUNCTION services_update_brief_eligibility()')
+    op.drop_index('ix_service_brief_eligibility_brief', table_name='service_brief_eligibility')
+    op.drop_table('service_brief_eligibility')
@@ -0,0 +1,112 @@
+"""Partition audit_events by month
+
+The Postgres version we run doesn't have declarative partitioning, so this uses table
+inheritance: each month's events go in an `audit_events_YYYY_MM` table that inherits from
+audit_events, with a CHECK constraint on created_at that lets the planner skip it when a
+query's created_at range can't match. A trigger on audit_events routes inserted rows to their
+month's partition, or leaves them in audit_events itself if it doesn't exist yet.
+
+Existing events are moved into partitions for their months, and partitions are created for
+the current and next three months. After this `./application.py create_audit_partitions`
+should run regularly to create partitions ahead of time (see app/audit_partitions.py).
+
+Revision ID: 920
+Revises: 910
+Create Date: 2026-10-18 16:40:05.671920
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '920'
+down_revision = '910'
+
+from datetime import datetime
+
+from alembic import op
+
+
+# The indexes on audit_events, each of which every partition gets a copy of
+INDEXES = [
+    ('ix_audit_events_type', ['type']),
+    ('ix_audit_events_created_at', ['created_at']),
+    ('ix_audit_events_acknowledged', ['acknowledged']),
+    ('idx_audit_events_object_and_type', ['object_type', 'object_id', 'type', 'created_at']),
+    ('idx_audit_events_type_acknowledged', ['type', 'acknowledged']),
+]
+
+FUNCTIONS = """
+CREATE OR REPLACE FUNCTION audit_events_insert_into_partition() RETURNS trigger AS $$
+DECLARE
+    _partition name := 'audit_events_' || to_char(NEW.created_at, 'YYYY_MM');
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_catalog.pg_class c JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = _partition AND n.nspname = TG_TABLE_SCHEMA
+    ) THEN
+        -- keep the event in audit_events until its month's partition is created
+        RETURN NEW;
+    END IF;
+
+    EXECUTE format('INSERT INTO %I.%I SELECT ($1).*', TG_TABLE_SCHEMA, _partition) USING NEW;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER audit_events_insert_into_partition
+    BEFORE INSERT ON audit_events
+    FOR EACH ROW EXECUTE PROCEDURE audit_events_insert_into_partition();
+"""
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def create_partition(conn, month):
+    name = 'audit_events_{:%Y_%m}'.format(month)
+    bounds = "created_at >= '{:%Y-%m-%d}' AND created_at < '{:%Y-%m-%d}'".format(month, next_month(month))
+
+    conn.execute(
+        'CREATE TABLE {name} (PRIMARY KEY (id), CHECK ({bounds})) INHERITS (audit_events)'.format(
+            name=name, bounds=bounds)
+    )
+    for index_name, columns in INDEXES:
+        op.create_index(index_name.replace('audit_events', name), name, columns, unique=False)
+
+    conn.execute('INSERT INTO {name} SELECT * FROM ONLY audit_events WHERE {bounds}'.format(
+        name=name, bounds=bounds))
+    conn.execute('DELETE FROM ONLY audit_events WHERE {bounds}'.format(bounds=bounds))
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    months = set(month for month, in conn.execute(
+        "SELECT DISTINCT date_trunc('month', created_at) FROM audit_events"
+    ))
+    month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(4):
+        months.add(month)
+        month = next_month(month)
+
+    for month in sorted(months):
+        create_partition(conn, month)
+
+    op.execute(FUNCTIONS)
+
+
+def downgrade():
+    conn = op.get_bind()
+
+    op.execute('DROP TRIGGER audit_events_insert_into_partition ON audit_events')
+    op.execute('DROP FUNCTION audit_events_insert_into_partition()')
+
+    partitions = conn.execute("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE parent.relname = 'audit_events'
+    """).fetchall()
+    for name, in partitions:
+        conn.execute('INSERT INTO audit_events SELECT * FROM {}'.format(name))
+        conn.execute('DROP TABLE {}'.format(name))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Measure login throughput and its effect on the latency of other routes
+
+Requests `--route` from `--clients` threads for `--duration` seconds on its own, then again
+while `--auth-clients` threads send `/users/auth` requests for an existing user. Prints
+latency percentiles for the route in both runs and the number of logins that succeeded or
+were rejected with a 503 because password hashing was saturated.
+
+Usage:
+    benchmark_auth.py <api_url> <api_token> <email_address> <password> [options]
+
+Options:
+    --route=<path>        Route to measure alongside logins [default: /frameworks]
+    --clients=<n>         Number of threads requesting the route [default: 2]
+    --auth-clients=<n>    Number of threads sending logins [default: 16]
+    --duration=<seconds>  Length of each run [default: 30]
+
+Example:
+    PYTHONPATH=. ./scripts/benchmark_auth.py http://localhost:5000 myToken test@example.com Password1234
+"""
+from __future__ import print_function
+
+import json
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from docopt import docopt
+
+
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile"""
+    index = max(0, int(round(p / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def run_clients(count, send, stop):
+    results = []
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        while not stop.is_set():
+            start = time.time()
+            try:
+                status = send(session).status_code
+            except requests.RequestException:
+                status = None
+            with lock:
+                results.append((status, time.time() - start))
+
+    threads = [threading.Thread(target=client) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def run(api_url, api_token, email_address, password, route, clients, auth_clients, duration):
+    headers = {'Authorization': 'Bearer {}'.format(api_token)}
+    auth_headers = dict(headers, **{'Content-Type': 'application/json'})
+    auth_body = json.dumps({'authUsers': {'emailAddress': email_address, 'password': password}})
+
+    def get_route(session):
+        return session.get(api_url + route, headers=headers)
+
+    def login(session):
+        return session.post(api_url + '/users/auth', data=auth_body, headers=auth_headers)
+
+    for label, logins in [('alone', 0), ('during logins', auth_clients)]:
+        stop = threading.Event()
+        route_threads, route_results = run_clients(clients, get_route, stop)
+        auth_threads, auth_results = run_clients(logins, login, stop)
+
+        time.sleep(duration)
+        stop.set()
+        for thread in route_threads + auth_threads:
+            thread.join()
+
+        timings = sorted(seconds * 1000 for _, seconds in route_results)
+        print("{} {}: {} requests".format(route, label, len(timings)) + ''.join(
+            ", p{} {:.1f}ms".format(p, percentile(timings, p)) for p in PERCENTILES))
+
+        if logins:
+            statuses = defaultdict(int)
+            for status, _ in auth_results:
+                statuses[status] += 1
+            print("/users/auth: {:.1f} logins/s, responses {}".format(
+                statuses[200] / float(duration),
+                ", ".join("{}: {}".format(status, count) for status, count in sorted(statuses.items()))
+            ))
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    run(
+        arguments['<api_url>'].rstrip('/'),
+        arguments['<api_token>'],
+        arguments['<email_address>'],
+        arguments['<password>'],
+        arguments['--route'],
+        int(arguments['--clients']),
+        int(arguments['--auth-clients']),
+        float(arguments['--duration']),
+    )
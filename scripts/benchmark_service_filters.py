@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Compare the service location filters before and after the move to JSONB
+
+Inserts synthetic services in a transaction that is rolled back at the end, then times
+the old string matching filter (`data->>'locations' LIKE '%"<location>"%'`) against the
+JSONB containment (`@>`) and key existence (`?`) filters used by `filter_services`, and
+prints the query plan for each.
+
+Usage:
+    benchmark_service_filters.py <config_name> [--services=<n>] [--runs=<n>]
+
+Options:
+    --services=<n>  Number of synthetic services to insert [default: 100000]
+    --runs=<n>      Number of times to run each query [default: 20]
+
+Example:
+    PYTHONPATH=. ./scripts/benchmark_service_filters.py development --services=200000
+"""
+from __future__ import print_function
+
+import time
+
+from docopt import docopt
+from sqlalchemy import text
+
+from app import create_app, db
+
+
+LOCATIONS = ['London', 'Scotland', 'Wales', 'North East England', 'South West England']
+
+INSERT_SERVICES = text("""
+    INSERT INTO services (service_id, supplier_id, framework_id, lot_id, status, data, created_at, updated_at)
+    SELECT 'bench-' || n, :supplier_id, :framework_id, :lot_id, 'published',
+           jsonb_build_object(
+               'locations', jsonb_build_array((:locations)[1 + n % 5], (:locations)[1 + (n / 5) % 5])
+           ) || CASE WHEN n % 3 = 0 THEN '{"developerLocations": ["London"]}'::jsonb ELSE '{}' END,
+           now(), now()
+    FROM generate_series(1, :count) AS n
+""")
+
+QUERIES = [
+    ('like', "SELECT count(*) FROM services WHERE data->>'locations' LIKE '%\"Scotland\"%'"),
+    ('contains', "SELECT count(*) FROM services WHERE data @> '{\"locations\": [\"Scotland\"]}'"),
+    ('has_key', "SELECT count(*) FROM services WHERE data ? 'developerLocations'"),
+]
+
+
+def benchmark(connection, runs):
+    for label, query in QUERIES:
+        start = time.time()
+        for _ in range(runs):
+            count = connection.execute(text(query)).scalar()
+        elapsed = (time.time() - start) * 1000 / runs
+
+        print("{:10} {:8} rows {:10.3f}ms per query".format(label, count, elapsed))
+        for row in connection.execute(text('EXPLAIN ' + query)):
+            print('    ' + row[0])
+
+
+def main(config_name, services, runs):
+    app = create_app(config_name)
+    with app.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        try:
+            supplier_id, framework_id, lot_id = connection.execute(text(
+                "SELECT supplier_id, framework_id, lot_id FROM services LIMIT 1"
+            )).first()
+
+            connection.execute(
+                INSERT_SERVICES, supplier_id=supplier_id, framework_id=framework_id, lot_id=lot_id,
+                locations=LOCATIONS, count=services
+            )
+            connection.execute(text('ANALYZE services'))
+
+            benchmark(connection, runs)
+        finally:
+            transaction.rollback()
+            connection.close()
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    main(arguments['<config_name>'], int(arguments['--services']), int(arguments['--runs']))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Measure the cost of building the links in serialized objects
+
+Compares building external URLs with `flask.url_for`, as `app.utils.url_for` used to,
+with the compiled link builders now used by `app.utils.url_for`.
+
+Usage:
+    benchmark_url_for.py [--links=<n>]
+
+Options:
+    --links=<n>  Number of links to build for each endpoint [default: 10000]
+
+Example:
+    PYTHONPATH=. ./scripts/benchmark_url_for.py --links=50000
+"""
+from __future__ import print_function
+
+import timeit
+
+from docopt import docopt
+from flask import url_for as flask_url_for
+
+from app import create_app
+from app.utils import url_for
+
+
+LINKS = [
+    ('.get_service', {'service_id': '1234567890123456'}),
+    ('.publish_draft_service', {'draft_id': 1234}),
+    ('.get_brief_response', {'brief_response_id': 1234}),
+    ('.get_framework', {'framework_slug': 'g-cloud-8'}),
+]
+
+
+def benchmark(links):
+    application = create_app('test')
+
+    with application.test_request_context('/'):
+        for endpoint, values in LINKS:
+            assert url_for(endpoint, **values) == flask_url_for(endpoint, _external=True, **values)
+
+            flask_seconds = timeit.timeit(lambda: flask_url_for(endpoint, _external=True, **values), number=links)
+            compiled_seconds = timeit.timeit(lambda: url_for(endpoint, **values), number=links)
+
+            print("{:25} flask.url_for {:6.2f}us  compiled {:6.2f}us  ({:.1f}x)".format(
+                endpoint,
+                flask_seconds * 1e6 / links,
+                compiled_seconds * 1e6 / links,
+                flask_seconds / compiled_seconds,
+            ))
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    benchmark(int(arguments['--links']))
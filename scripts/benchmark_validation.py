@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Measure the per-request cost of validating a draft service autosave
+
+Compares building a fresh (deep-copied, relaxed) validator for every request, as
+`get_validator` used to, with the cached validators now returned by `get_validator`.
+
+Usage:
+    benchmark_validation.py [--schema=<schema_name>] [--listing=<listing_name>] [--requests=<n>]
+
+Options:
+    --schema=<schema_name>    Schema to validate against [default: services-g-cloud-7-scs]
+    --listing=<listing_name>  Example listing to validate [default: G7-SCS]
+    --requests=<n>            Number of simulated autosave requests [default: 200]
+
+Example:
+    PYTHONPATH=. ./scripts/benchmark_validation.py --requests=500
+"""
+from __future__ import print_function
+
+import copy
+import json
+import os
+import timeit
+
+from docopt import docopt
+from jsonschema.validators import validator_for
+
+from app import validation
+
+
+def load_listing(name):
+    with open(os.path.join('example_listings', '{}.json'.format(name))) as f:
+        return json.load(f)
+
+
+def uncached_validator(schema_name, required_fields):
+    schema = copy.deepcopy(validation._SCHEMAS[schema_name])
+    schema['required'] = [field for field in schema.get('required', []) if field in required_fields]
+    schema.pop('anyOf', None)
+    return validator_for(schema)(schema, format_checker=validation.FORMAT_CHECKER)
+
+
+def benchmark(schema_name, listing_name, requests):
+    data = load_listing(listing_name)
+    page_questions = sorted(data.keys())[:5]
+
+    def uncached():
+        errors = uncached_validator(schema_name, page_questions).iter_errors(data)
+        validation.translate_json_schema_errors(errors, data)
+
+    def cached():
+        validation.get_validation_errors(
+            schema_name, data, enforce_required=False, required_fields=page_questions
+        )
+
+    for label, request in [('uncached', uncached), ('cached', cached)]:
+        seconds = timeit.timeit(request, number=requests)
+        print("{:10} {:8.3f}ms per request".format(label, seconds * 1000 / requests))
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    benchmark(arguments['--schema'], arguments['--listing'], int(arguments['--requests']))
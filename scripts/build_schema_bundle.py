@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""Build a bundle of pre-validated JSON schemas for faster app start-up
+
+The bundle is loaded by `create_app` when DM_PRELOAD_SCHEMAS is set and
+DM_SCHEMA_BUNDLE_PATH points at it, so it must be rebuilt whenever the schemas
+in json_schemas/ change.
+
+Usage:
+    build_schema_bundle.py [<bundle_path>]
+
+Example:
+    PYTHONPATH=. ./scripts/build_schema_bundle.py json_schemas.pickle
+"""
+from __future__ import print_function
+
+from docopt import docopt
+
+from app.validation import build_schema_bundle
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    bundle_path = arguments['<bundle_path>'] or 'json_schemas.pickle'
+
+    schemas = build_schema_bundle(bundle_path)
+    print("Wrote {} schemas to {}".format(len(schemas), bundle_path))
@@ -0,0 +1,567 @@
+#!/usr/bin/env python
+"""Load a synthetic dataset into a local database for performance testing
+
+Generates suppliers, users, services, briefs, brief responses and audit events and
+loads them with COPY. Service, brief and brief response data is generated from the
+JSON schemas in `json_schemas/` for each framework and lot in the database, so it has
+the shape (and roughly the size) of real submissions.
+
+Rows are added alongside any existing data. Frameworks and lots are not created, so run
+the migrations first.
+
+Usage:
+    generate_dataset.py <config_name> [options]
+
+Options:
+    --suppliers=<n>        Number of suppliers [default: 20000]
+    --services=<n>         Number of services [default: 200000]
+    --briefs=<n>           Number of briefs [default: 5000]
+    --brief-responses=<n>  Number of brief responses [default: 50000]
+    --audit-events=<n>     Number of audit events [default: 2000000]
+    --batch-size=<n>       Number of rows sent in each COPY [default: 10000]
+    --seed=<n>             Random seed [default: 0]
+    --full-audit-payloads  Store brief autosave payloads in full rather than as deltas
+
+Example:
+    PYTHONPATH=. ./scripts/generate_dataset.py development --services=50000 --audit-events=500000
+
+The sizes of audit_events (including its partitions) are printed at the end, so the effect
+of delta-encoded payloads can be compared with a dataset made with --full-audit-payloads.
+"""
+from __future__ import print_function
+
+import csv
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime, timedelta
+
+import six
+from docopt import docopt
+
+from app import audit_partitions, create_app, db
+from app.audit_deltas import delta_key, is_smaller, payload_delta
+from app.encryption import hashpw
+from app.models import Brief
+
+
+WORDS = (
+    "cloud hosting platform secure data service support digital content management analytics "
+    "user research delivery agile network storage backup recovery monitoring identity access "
+    "integration migration training consultancy design development testing accessibility "
+    "performance availability resilient scalable open standards government public sector "
+    "application infrastructure software licence reporting dashboard workflow case records"
+).split()
+
+FRAMEWORK_WEIGHTS = {
+    'g-cloud-4': 1,
+    'g-cloud-5': 2,
+    'g-cloud-6': 3,
+    'g-cloud-7': 4,
+    'g-cloud-8': 5,
+    'g-cloud-9': 5,
+    'digital-outcomes-and-specialists': 2,
+    'digital-outcomes-and-specialists-2': 2,
+}
+
+SERVICE_STATUSES = ['published'] * 18 + ['enabled', 'disabled']
+
+NOW = datetime.utcnow()
+
+
+class SchemaFaker(object):
+    """Generates random documents that (mostly) match a JSON schema
+
+    Optional properties are included most of the time, and strings follow the
+    handful of patterns and formats used by our schemas.
+    """
+    WORD_COUNT_PATTERN = re.compile(r'\{0,(\d+)\}\\S\+\$')
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def value(self, schema):
+        if 'enum' in schema:
+            return self.rng.choice(schema['enum'])
+
+        for keyword in ('oneOf', 'anyOf'):
+            if keyword in schema and 'type' not in schema:
+                return self.value(self.rng.choice(schema[keyword]))
+
+        schema_type = schema.get('type', 'object' if 'properties' in schema else 'string')
+        if isinstance(schema_type, list):
+            schema_type = [t for t in schema_type if t != 'null'][0]
+
+        return getattr(self, '_' + schema_type)(schema)
+
+    def _object(self, schema):
+        properties = schema.get('properties', {})
+        required = set(schema.get('required', []))
+        document = {
+            key: self.value(property_schema)
+            for key, property_schema in properties.items()
+            if key in required or self.rng.random() < 0.7
+        }
+
+        for key, dependencies in schema.get('dependencies', {}).items():
+            if key in document and isinstance(dependencies, list):
+                self._add_properties(document, properties, dependencies)
+
+        # Conditional questions are described by an `allOf` list of `oneOf` branches
+        for condition in schema.get('allOf', []):
+            branches = [
+                branch for branch in condition.get('oneOf', [])
+                if not any('not' in constraint for constraint in branch.get('properties', {}).values())
+            ]
+            if branches:
+                self._apply_branch(document, properties, self.rng.choice(branches))
+
+        return document
+
+    def _add_properties(self, document, properties, keys):
+        for key in keys:
+            if key not in document and key in properties:
+                document[key] = self.value(properties[key])
+
+    def _apply_branch(self, document, properties, branch):
+        self._add_properties(document, properties, branch.get('required', []))
+
+        for key, constraint in branch.get('properties', {}).items():
+            if constraint.get('type') == 'null':
+                document.pop(key, None)
+            elif 'enum' in constraint:
+                document[key] = self.rng.choice(constraint['enum'])
+            elif key in document and 'enum' in constraint.get('items', {}):
+                allowed = constraint['items']['enum']
+                document[key] = [value for value in document[key] if value in allowed] or allowed[:1]
+
+    def _array(self, schema):
+        min_items = schema.get('minItems', 1)
+        count = self.rng.randint(min_items, min(schema.get('maxItems', min_items + 4), min_items + 4))
+        items = schema.get('items', {})
+
+        if schema.get('uniqueItems') and 'enum' in items:
+            return self.rng.sample(items['enum'], min(count, len(items['enum'])))
+
+        return [self.value(items) for _ in range(count)]
+
+    def _boolean(self, schema):
+        return self.rng.random() < 0.5
+
+    def _integer(self, schema):
+        minimum = schema.get('minimum', 0)
+        maximum = schema.get('maximum', minimum + 1000)
+        if schema.get('exclusiveMaximum'):
+            maximum -= 1
+        return self.rng.randint(minimum, maximum)
+
+    _number = _integer
+
+    def _string(self, schema):
+        pattern = schema.get('pattern', '')
+
+        if schema.get('format') == 'uri':
+            return 'https://assets.example.com/documents/{}.pdf'.format(self.rng.randint(1, 10 ** 9))
+        if schema.get('format') == 'email' or '@' in pattern:
+            return 'user{}@example.com'.format(self.rng.randint(1, 10 ** 6))
+        if r'\+' in pattern:
+            return '020 7946 {:04d}'.format(self.rng.randint(0, 9999))
+        if r'\d' in pattern or '[0-9]' in pattern:
+            return str(self.rng.randint(1, 2000))
+
+        match = self.WORD_COUNT_PATTERN.search(pattern)
+        max_words = int(match.group(1)) + 1 if match else 20
+        return self.words(self.rng.randint(1, min(max_words, 30)), schema.get('maxLength'))
+
+    def words(self, count, max_length=None):
+        text = ' '.join(self.rng.choice(WORDS) for _ in range(count)).capitalize()
+        if max_length and len(text) > max_length:
+            text = text[:max_length].rsplit(' ', 1)[0]
+        return text
+
+
+class CopyWriter(object):
+    """Buffers rows as CSV and sends them to a table with COPY every `batch_size` rows
+
+    Empty values (including None) are loaded as NULL.
+    """
+    def __init__(self, cursor, table, columns, batch_size):
+        self.cursor = cursor
+        self.statement = 'COPY {} ({}) FROM STDIN WITH CSV'.format(table, ', '.join(columns))
+        self.batch_size = batch_size
+        self.count = 0
+        self._reset()
+
+    def _reset(self):
+        self.buffer = six.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.buffered = 0
+
+    def write(self, *row):
+        self.writer.writerow([
+            json.dumps(value) if isinstance(value, (dict, list)) else value
+            for value in row
+        ])
+        self.buffered += 1
+        self.count += 1
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffered:
+            self.buffer.seek(0)
+            self.cursor.copy_expert(self.statement, self.buffer)
+            self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.flush()
+
+
+def load_schema(name):
+    path = os.path.join('json_schemas', '{}.json'.format(name))
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+
+def random_timestamp(rng, days=3 * 365):
+    return NOW - timedelta(seconds=rng.randint(0, days * 24 * 60 * 60))
+
+
+def next_id(cursor, table, column='id'):
+    cursor.execute('SELECT coalesce(max({}), 0) + 1 FROM {}'.format(column, table))
+    return cursor.fetchone()[0]
+
+
+def framework_lots(cursor):
+    cursor.execute("""
+        SELECT frameworks.id, frameworks.slug, frameworks.framework, lots.id, lots.slug
+        FROM frameworks
+        JOIN framework_lots ON framework_lots.framework_id = frameworks.id
+        JOIN lots ON lots.id = framework_lots.lot_id
+        ORDER BY frameworks.id, lots.id
+    """)
+    return cursor.fetchall()
+
+
+class DatasetGenerator(object):
+    def __init__(self, cursor, batch_size, seed, snapshot_interval=None):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.faker = SchemaFaker(self.rng)
+        # Brief autosave payloads are stored in full if None
+        self.snapshot_interval = snapshot_interval
+
+    def copy(self, table, columns):
+        return CopyWriter(self.cursor, table, columns, self.batch_size)
+
+    def generate_suppliers(self, count):
+        first_id = next_id(self.cursor, 'suppliers')
+        first_supplier_id = next_id(self.cursor, 'suppliers', 'supplier_id')
+        first_contact_id = next_id(self.cursor, 'contact_information')
+
+        with self.copy('suppliers', [
+            'id', 'supplier_id', 'name', 'description', 'duns_number', 'clients'
+        ]) as suppliers, self.copy('contact_information', [
+            'id', 'supplier_id', 'contact_name', 'email', 'phone_number', 'website', 'address1', 'city', 'postcode'
+        ]) as contacts:
+            for n in range(count):
+                supplier_id = first_supplier_id + n
+                suppliers.write(
+                    first_id + n, supplier_id, '{} Ltd'.format(self.faker.words(self.rng.randint(1, 3))),
+                    self.faker.words(self.rng.randint(10, 50), 500), '9{:08d}'.format(supplier_id),
+                    [self.faker.words(2) for _ in range(self.rng.randint(0, 10))]
+                )
+                contacts.write(
+                    first_contact_id + n, supplier_id, 'Contact {}'.format(supplier_id),
+                    'contact@supplier{}.example.com'.format(supplier_id), '020 7946 0000',
+                    'https://supplier{}.example.com'.format(supplier_id), '1 Example Street', 'London', 'SW1A 1AA'
+                )
+
+        self.supplier_ids = list(range(first_supplier_id, first_supplier_id + count))
+
+    def generate_users(self):
+        """One user for each supplier and a buyer for every ten suppliers"""
+        first_id = next_id(self.cursor, 'users')
+        password = hashpw('Password1234')
+
+        with self.copy('users', [
+            'id', 'name', 'email_address', 'password', 'active', 'created_at', 'updated_at',
+            'password_changed_at', 'failed_login_count', 'role', 'supplier_id'
+        ]) as users:
+            for n, supplier_id in enumerate(self.supplier_ids):
+                created_at = random_timestamp(self.rng)
+                users.write(
+                    first_id + n, 'Supplier user {}'.format(supplier_id),
+                    'user@supplier{}.example.com'.format(supplier_id), password, True,
+                    created_at, created_at, created_at, 0, 'supplier', supplier_id
+                )
+
+            self.buyer_ids = []
+            for n in range(len(self.supplier_ids), len(self.supplier_ids) + len(self.supplier_ids) // 10 + 1):
+                created_at = random_timestamp(self.rng)
+                users.write(
+                    first_id + n, 'Buyer {}'.format(n), 'buyer{}@digital.cabinet-office.gov.uk'.format(first_id + n),
+                    password, True, created_at, created_at, created_at, 0, 'buyer', None
+                )
+                self.buyer_ids.append(first_id + n)
+
+    def generate_services(self, count, framework_lots):
+        lots = []
+        for framework_id, framework_slug, framework, lot_id, lot_slug in framework_lots:
+            schema = load_schema('services-{}-{}'.format(framework_slug, lot_slug)) or \
+                load_schema('services-{}'.format(framework_slug))
+            if schema is not None and framework_slug in FRAMEWORK_WEIGHTS:
+                lots.append(((framework_id, lot_id, schema), FRAMEWORK_WEIGHTS[framework_slug]))
+
+        first_id = next_id(self.cursor, 'services')
+        supplier_frameworks = set()
+
+        with self.copy('services', [
+            'id', 'service_id', 'supplier_id', 'framework_id', 'lot_id', 'status', 'data', 'created_at', 'updated_at'
+        ]) as services:
+            for pk in range(first_id, first_id + count):
+                framework_id, lot_id, schema = self.weighted_choice(lots)
+                supplier_id = self.rng.choice(self.supplier_ids)
+                supplier_frameworks.add((supplier_id, framework_id))
+                created_at = random_timestamp(self.rng)
+                services.write(
+                    pk, '{:016d}'.format(9 * 10 ** 15 + pk), supplier_id, framework_id, lot_id,
+                    self.rng.choice(SERVICE_STATUSES), self.faker.value(schema),
+                    created_at, created_at + timedelta(days=self.rng.randint(0, 30))
+                )
+
+        self.service_ids = list(range(first_id, first_id + count))
+
+        self.cursor.execute('SELECT supplier_id, framework_id FROM supplier_frameworks')
+        supplier_frameworks.difference_update(tuple(row) for row in self.cursor.fetchall())
+        with self.copy('supplier_frameworks', [
+            'supplier_id', 'framework_id', 'declaration', 'on_framework'
+        ]) as rows:
+            for supplier_id, framework_id in sorted(supplier_frameworks):
+                rows.write(supplier_id, framework_id, {'status': 'complete'}, True)
+
+    def generate_briefs(self, count, framework_lots):
+        lots = []
+        for framework_id, framework_slug, framework, lot_id, lot_slug in framework_lots:
+            brief_schema = load_schema('briefs-{}-{}'.format(framework_slug, lot_slug))
+            response_schema = load_schema('brief-responses-{}-{}'.format(framework_slug, lot_slug))
+            if brief_schema is not None and response_schema is not None:
+                lots.append((framework_id, lot_id, brief_schema, response_schema))
+
+        first_id = next_id(self.cursor, 'briefs')
+        self.briefs = []
+        self.brief_documents = []
+        if not lots:
+            return
+
+        with self.copy('briefs', [
+            'id', 'framework_id', 'lot_id', 'data', 'created_at', 'updated_at', 'published_at', 'withdrawn_at',
+            'applications_closed_at', 'clarification_questions_closed_at', 'clarification_questions_published_by',
+        ]) as briefs, self.copy('brief_users', ['brief_id', 'user_id']) as brief_users:
+            for brief_id in range(first_id, first_id + count):
+                framework_id, lot_id, brief_schema, response_schema = self.rng.choice(lots)
+                data = self.faker.value(brief_schema)
+                self.brief_documents.append((brief_id, brief_schema, data))
+                created_at = random_timestamp(self.rng)
+                published_at = withdrawn_at = None
+                publishing_dates = {}
+                if self.rng.random() < 0.8:
+                    published_at = created_at + timedelta(days=self.rng.randint(0, 14))
+                    if self.rng.random() < 0.05:
+                        withdrawn_at = published_at + timedelta(days=self.rng.randint(0, 7))
+                    publishing_dates = Brief.calculate_publishing_dates(published_at, data.get('requirementsLength'))
+                    self.briefs.append((brief_id, response_schema, published_at))
+
+                briefs.write(
+                    brief_id, framework_id, lot_id, data,
+                    created_at, published_at or created_at, published_at, withdrawn_at,
+                    publishing_dates.get('closing_date'), publishing_dates.get('questions_close'),
+                    publishing_dates.get('answers_close'),
+                )
+                brief_users.write(brief_id, self.rng.choice(self.buyer_ids))
+
+    def generate_brief_responses(self, count):
+        first_id = next_id(self.cursor, 'brief_responses')
+        if not self.briefs:
+            return
+
+        with self.copy('brief_responses', [
+            'id', 'brief_id', 'supplier_id', 'data', 'created_at', 'submitted_at'
+        ]) as responses:
+            for pk in range(first_id, first_id + count):
+                brief_id, schema, published_at = self.rng.choice(self.briefs)
+                created_at = published_at + timedelta(seconds=self.rng.randint(0, 14 * 24 * 60 * 60))
+                responses.write(
+                    pk, brief_id, self.rng.choice(self.supplier_ids), self.faker.value(schema),
+                    created_at, created_at if self.rng.random() < 0.9 else None
+                )
+
+    def generate_audit_events(self, count):
+        """Mostly service updates, with supplier updates and runs of brief autosaves mixed in
+
+        Events older than a week have been acknowledged.
+        """
+        self.cursor.execute('SELECT id, supplier_id FROM suppliers WHERE supplier_id = ANY(%s)', (self.supplier_ids,))
+        supplier_pks = [row[0] for row in self.cursor.fetchall()]
+        objects = [
+            ((audit_type, object_type, object_ids), weight) for (audit_type, object_type, object_ids), weight in [
+                (('update_service', 'Service', self.service_ids), 6),
+                (('update_service_status', 'Service', self.service_ids), 1),
+                (('supplier_update', 'Supplier', supplier_pks), 2),
+                # a run of autosaves is 20 events on average
+                (('update_brief', 'Brief', self.brief_documents), 1.0 / 20),
+            ] if object_ids
+        ]
+        first_id = next_id(self.cursor, 'audit_events')
+
+        with self.copy('audit_events', [
+            'id', 'type', 'created_at', '"user"', 'data', 'object_type', 'object_id',
+            'acknowledged', 'acknowledged_by', 'acknowledged_at'
+        ]) as events:
+            pk = first_id
+            while pk < first_id + count:
+                audit_type, object_type, object_ids = self.weighted_choice(objects)
+                user = 'user{}@example.com'.format(self.rng.randint(1, 1000))
+                if audit_type == 'update_brief':
+                    object_id, saves = self.brief_autosaves(
+                        pk, min(self.rng.randint(1, 40), first_id + count - pk), random_timestamp(self.rng)
+                    )
+                else:
+                    object_id = self.rng.choice(object_ids)
+                    saves = [(pk, random_timestamp(self.rng), {
+                        'update': {self.rng.choice(WORDS): self.faker.words(self.rng.randint(1, 20))}
+                    })]
+
+                for pk, created_at, data in saves:
+                    acknowledged = created_at < NOW - timedelta(days=7)
+                    events.write(
+                        pk, audit_type, created_at, user, data, object_type, object_id,
+                        acknowledged,
+                        'admin@example.com' if acknowledged else None,
+                        created_at + timedelta(days=1) if acknowledged else None
+                    )
+                pk += 1
+
+    def brief_autosaves(self, first_id, count, created_at):
+        """`update_brief` events for a brief saved `count` times in a row, with a question or
+        two changed each time
+
+        The payloads are encoded the same way as `AuditEvent.encode_payload_delta`, except
+        that each run of saves starts with a snapshot. Returns the brief id and a list of
+        `(id, created_at, data)`.
+        """
+        brief_id, schema, brief_json = self.rng.choice(self.brief_documents)
+        brief_json = dict(brief_json)
+        properties = sorted(schema.get('properties', {}).items())
+
+        saves = []
+        snapshot = None
+        for pk in range(first_id, first_id + count):
+            for key, property_schema in self.rng.sample(properties, min(2, len(properties))):
+                brief_json[key] = self.faker.value(property_schema)
+            created_at += timedelta(seconds=self.rng.randint(10, 600))
+            data = {'briefId': brief_id, 'briefJson': dict(brief_json)}
+
+            if self.snapshot_interval is not None:
+                if snapshot is not None and sequence < self.snapshot_interval and \
+                        snapshot_month == created_at.strftime('%Y-%m'):
+                    delta = payload_delta(snapshot, brief_json)
+                    delta.update(snapshotId=snapshot_id, sequence=sequence + 1)
+                    if is_smaller(delta, brief_json):
+                        sequence += 1
+                        data = {'briefId': brief_id, delta_key('briefJson'): delta}
+                if 'briefJson' in data:
+                    snapshot, snapshot_id, snapshot_month, sequence = (
+                        dict(brief_json), pk, created_at.strftime('%Y-%m'), 0
+                    )
+
+            saves.append((pk, created_at, data))
+
+        return brief_id, saves
+
+    def weighted_choice(self, choices):
+        value = self.rng.uniform(0, sum(weight for _, weight in choices))
+        for choice, weight in choices:
+            value -= weight
+            if value <= 0:
+                return choice
+        return choices[-1][0]
+
+    def reset_sequences(self):
+        for table in ['suppliers', 'contact_information', 'users', 'services', 'briefs', 'brief_responses',
+                      'audit_events']:
+            self.cursor.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), (SELECT max(id) FROM {0}))".format(table)
+            )
+        self.cursor.execute(
+            "SELECT setval('suppliers_supplier_id_seq', (SELECT max(supplier_id) FROM suppliers))"
+        )
+
+
+def timed(label, function, *args):
+    start = time.time()
+    function(*args)
+    print("{:20} {:8.1f}s".format(label, time.time() - start))
+
+
+def print_audit_event_sizes(cursor):
+    cursor.execute("""
+        SELECT
+            sum(pg_relation_size(c.oid))::bigint,
+            sum(coalesce(pg_total_relation_size(nullif(c.reltoastrelid, 0)), 0))::bigint,
+            sum(pg_indexes_size(c.oid))::bigint
+        FROM pg_class c
+        WHERE c.relname = 'audit_events' OR c.oid IN (
+            SELECT inhrelid FROM pg_inherits WHERE inhparent = 'audit_events'::regclass
+        )
+    """)
+    for label, size in zip(['audit_events table', 'audit_events TOAST', 'audit_events indexes'], cursor.fetchone()):
+        print("{:20} {:8.1f}MB".format(label, size / 1024.0 / 1024.0))
+
+
+def main(config_name, arguments):
+    app = create_app(config_name)
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            generator = DatasetGenerator(
+                cursor, int(arguments['--batch-size']), int(arguments['--seed']),
+                None if arguments['--full-audit-payloads'] else app.config['DM_API_AUDIT_SNAPSHOT_INTERVAL']
+            )
+            lots = framework_lots(cursor)
+
+            timed('suppliers', generator.generate_suppliers, int(arguments['--suppliers']))
+            timed('users', generator.generate_users)
+            timed('services', generator.generate_services, int(arguments['--services']), lots)
+            timed('briefs', generator.generate_briefs, int(arguments['--briefs']), lots)
+            timed('brief responses', generator.generate_brief_responses, int(arguments['--brief-responses']))
+            timed('audit events', generator.generate_audit_events, int(arguments['--audit-events']))
+
+            generator.reset_sequences()
+            connection.commit()
+
+            # The generated events were loaded into audit_events itself as their months didn't
+            # have partitions, so create them
+            timed('audit partitions', audit_partitions.create_partitions)
+            timed('analyze', cursor.execute, 'ANALYZE')
+
+            connection.commit()
+
+            print_audit_event_sizes(cursor)
+        finally:
+            connection.close()
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    main(arguments['<config_name>'], arguments)
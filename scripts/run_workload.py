@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""Replay a mix of read requests against the API and report latency percentiles per route
+
+Service, supplier and brief IDs are sampled from random pages of the list endpoints
+before the run starts, then requests are picked from a weighted mix of the endpoints
+used by the frontend apps and sent from `--concurrency` threads.
+
+Usage:
+    run_workload.py <api_url> <api_token> [options]
+
+Options:
+    --requests=<n>     Number of requests to send [default: 2000]
+    --concurrency=<n>  Number of concurrent clients [default: 8]
+    --sample-pages=<n> Number of list pages to sample IDs from [default: 10]
+    --seed=<n>         Random seed [default: 0]
+
+Example:
+    PYTHONPATH=. ./scripts/run_workload.py http://localhost:5000 myToken --requests=10000
+"""
+from __future__ import print_function
+
+import random
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+import requests
+from docopt import docopt
+
+
+FRAMEWORKS = ['g-cloud-7', 'g-cloud-8', 'g-cloud-9', 'digital-outcomes-and-specialists-2']
+ROLES = ['developer', 'designer', 'deliveryManager', 'userResearcher', 'technicalArchitect']
+LOCATIONS = ['London', 'Scotland', 'Wales', 'North East England', 'South West England']
+
+# (weight, route, function of the sampled IDs returning the path to request)
+WORKLOAD = [
+    (25, '/services/<service_id>', lambda ids, rng: '/services/{}'.format(rng.choice(ids['services']))),
+    (8, '/services?framework=', lambda ids, rng: '/services?framework={}&page={}'.format(
+        rng.choice(FRAMEWORKS), rng.randint(1, 20))),
+    (4, '/services?lot=digital-specialists&role=&location=', lambda ids, rng: (
+        '/services?framework=digital-outcomes-and-specialists-2&lot=digital-specialists'
+        '&role={}&location={}'.format(rng.choice(ROLES), rng.choice(LOCATIONS)))),
+    (4, '/services?supplier_id=', lambda ids, rng: '/services?supplier_id={}'.format(rng.choice(ids['suppliers']))),
+    (12, '/suppliers/<supplier_id>', lambda ids, rng: '/suppliers/{}'.format(rng.choice(ids['suppliers']))),
+    (5, '/suppliers?prefix=', lambda ids, rng: '/suppliers?prefix={}'.format(rng.choice('abcdefghijklmnoprstw'))),
+    (4, '/users?supplier_id=', lambda ids, rng: '/users?supplier_id={}'.format(rng.choice(ids['suppliers']))),
+    (10, '/briefs/<brief_id>', lambda ids, rng: '/briefs/{}'.format(rng.choice(ids['briefs']))),
+    (6, '/briefs?status=live', lambda ids, rng: '/briefs?status=live&page={}'.format(rng.randint(1, 5))),
+    (5, '/brief-responses?brief_id=', lambda ids, rng: '/brief-responses?brief_id={}'.format(
+        rng.choice(ids['briefs']))),
+    (5, '/audit-events?object-type=services', lambda ids, rng: '/audit-events?object-type=services&object-id={}'.format(
+        rng.choice(ids['services']))),
+    (3, '/audit-events?acknowledged=false', lambda ids, rng: '/audit-events?acknowledged=false&page={}'.format(
+        rng.randint(1, 5))),
+    (2, '/frameworks', lambda ids, rng: '/frameworks'),
+    (1, '/frameworks/<framework_slug>/stats', lambda ids, rng: '/frameworks/{}/stats'.format(rng.choice(FRAMEWORKS))),
+]
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+class Client(object):
+    def __init__(self, api_url, api_token):
+        self.api_url = api_url.rstrip('/')
+        self.headers = {'Authorization': 'Bearer {}'.format(api_token)}
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.headers.update(self.headers)
+        return self.local.session
+
+    def get(self, path):
+        return self.session.get(self.api_url + path)
+
+
+def last_page(response):
+    last = response.json().get('links', {}).get('last')
+    if last is None:
+        return 1
+    return int(last.rsplit('page=', 1)[-1].split('&')[0])
+
+
+def sample_ids(client, rng, pages):
+    """Collect IDs from the first and some random pages of each list endpoint"""
+    ids = {}
+    for name, path, key, id_field in [
+        ('services', '/services', 'services', 'id'),
+        ('suppliers', '/suppliers', 'suppliers', 'id'),
+        ('briefs', '/briefs', 'briefs', 'id'),
+    ]:
+        first = client.get(path)
+        first.raise_for_status()
+        sampled = [item[id_field] for item in first.json()[key]]
+
+        for page in rng.sample(range(2, last_page(first) + 1), min(pages, last_page(first) - 1)):
+            sampled.extend(item[id_field] for item in client.get('{}?page={}'.format(path, page)).json()[key])
+
+        if not sampled:
+            raise ValueError("No {} found, load some data first".format(name))
+        ids[name] = sampled
+
+    return ids
+
+
+def plan_requests(ids, rng, count):
+    total = sum(weight for weight, _, _ in WORKLOAD)
+    plan = []
+    for _ in range(count):
+        value = rng.uniform(0, total)
+        for weight, route, path in WORKLOAD:
+            value -= weight
+            if value <= 0:
+                break
+        plan.append((route, path(ids, rng)))
+    return plan
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile"""
+    index = max(0, int(round(p / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def report(results, elapsed):
+    timings, errors = defaultdict(list), defaultdict(int)
+    for route, status, seconds in results:
+        timings[route].append(seconds * 1000)
+        if status is None or status >= 400:
+            errors[route] += 1
+
+    header = "{:55} {:>6} {:>6}".format('route', 'count', 'errors') + ''.join(
+        "{:>9}".format('p{}'.format(p)) for p in PERCENTILES) + "{:>9}".format('max')
+    print(header)
+    print('-' * len(header))
+    for route in sorted(timings, key=lambda route: -len(timings[route])):
+        values = sorted(timings[route])
+        print("{:55} {:6d} {:6d}".format(route, len(values), errors[route]) + ''.join(
+            "{:9.1f}".format(percentile(values, p)) for p in PERCENTILES) + "{:9.1f}".format(values[-1]))
+
+    print()
+    print("{} requests in {:.1f}s ({:.1f} requests/s)".format(len(results), elapsed, len(results) / elapsed))
+
+
+def run(api_url, api_token, count, concurrency, sample_pages, seed):
+    rng = random.Random(seed)
+    client = Client(api_url, api_token)
+
+    plan = plan_requests(sample_ids(client, rng, sample_pages), rng, count)
+
+    def send(planned):
+        route, path = planned
+        start = time.time()
+        try:
+            status = client.get(path).status_code
+        except requests.RequestException:
+            status = None
+        return route, status, time.time() - start
+
+    pool = ThreadPool(concurrency)
+    try:
+        start = time.time()
+        results = pool.map(send, plan, chunksize=1)
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+
+    report(results, elapsed)
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    run(
+        arguments['<api_url>'],
+        arguments['<api_token>'],
+        int(arguments['--requests']),
+        int(arguments['--concurrency']),
+        int(arguments['--sample-pages']),
+        int(arguments['--seed']),
+    )
@@ -2,6 +2,7 @@ from nose.tools import assert_equal, assert_in
 
 from app import create_app, db
 from app.models import Framework, FrameworkLot
+from app.search_index import process_search_index_outbox
 
 
 class WSGIApplicationWithEnvironment(object):
@@ -42,6 +43,12 @@ class BaseApplicationTest(object):
     def do_not_provide_access_token(self):
         self.app.wsgi_app = self.app.wsgi_app.app
 
+    def process_search_index_outbox(self):
+        """Send queued search index updates, as the search index worker would"""
+        with self.app.app_context():
+            while process_search_index_outbox():
+                pass
+
     def teardown(self):
         self.teardown_authorization()
         self.teardown_database()
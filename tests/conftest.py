@@ -19,6 +19,18 @@ from app.models import (
 )
 
 
+# Functions created by the migrations for triggers, which dropping the tables leaves behind
+TRIGGER_FUNCTIONS = [
+    'supplier_frameworks_update_framework_stats()',
+    'draft_services_update_framework_stats()',
+    'framework_supplier_stats_submitted_changed(bigint, bigint, integer)',
+    'framework_supplier_stats_add(bigint, varchar, boolean, integer)',
+    'framework_draft_stats_add(bigint, bigint, varchar, varchar, integer)',
+    'services_update_brief_eligibility()',
+    'audit_events_insert_into_partition()',
+]
+
+
 @pytest.fixture(autouse=True, scope='session')
 def db_migration(request):
     print("Doing db setup")
@@ -41,7 +53,14 @@ def db_migration(request):
         with app.app_context():
             db.session.remove()
             db.engine.execute("drop sequence suppliers_supplier_id_seq cascade")
+            # audit_events can't be dropped while its partitions inherit from it (see migration 920)
+            for partition, in db.engine.execute(
+                "select inhrelid::regclass::text from pg_inherits where inhparent = 'audit_events'::regclass"
+            ).fetchall():
+                db.engine.execute("drop table {}".format(partition))
             db.drop_all()
+            for function in TRIGGER_FUNCTIONS:
+                db.engine.execute("drop function if exists {}".format(function))
             db.engine.execute("drop table alembic_version")
             insp = inspect(db.engine)
             for enum in insp.get_enums():
@@ -2,9 +2,12 @@ from __future__ import absolute_import
 
 import json
 import os
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from app import db
 from app.models import Framework, User, Lot, Brief, Supplier, ContactInformation, Service
@@ -40,6 +43,30 @@ def fixture_params(fixture_name, params):
     return pytest.mark.parametrize(fixture_name, [params], indirect=True)
 
 
+@contextmanager
+def assert_max_queries(maximum):
+    """Fail if more than `maximum` SQL statements are run in the block
+
+    Used to keep endpoints within a query budget, so N+1 query regressions fail the tests::
+
+        with assert_max_queries(2):
+            self.client.get('/audit-events')
+    """
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record_statement)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record_statement)
+
+    assert len(statements) <= maximum, "{} queries run, expected at most {}:\n\n{}".format(
+        len(statements), maximum, '\n\n'.join(statements))
+
+
 class FixtureMixin(object):
     def setup_dummy_user(self, id=123, role='buyer'):
         with self.app.app_context():
@@ -8,9 +8,9 @@ from dmapiclient.audit import AuditTypes
 
 from app import db
 from app.models import AuditEvent
-from app.models import Supplier
+from app.models import Supplier, User
 from tests.bases import BaseApplicationTest
-from tests.helpers import FixtureMixin
+from tests.helpers import FixtureMixin, assert_max_queries
 
 
 class TestAuditEvents(BaseApplicationTest, FixtureMixin):
@@ -173,6 +173,42 @@ class TestAuditEvents(BaseApplicationTest, FixtureMixin):
         assert_equal(len(data['auditEvents']), 1)
         assert_equal(data['auditEvents'][0]['user'], 'rob')
 
+    def test_filtering_by_object_only_selects_its_primary_key(self):
+        self.add_audit_events_with_db_object()
+
+        with self.app.app_context(), assert_max_queries(3) as statements:
+            response = self.client.get('/audit-events?object-type=suppliers&object-id=1')
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(json.loads(response.get_data())['auditEvents']), 1)
+        supplier_lookup, = [statement for statement in statements if 'FROM suppliers' in statement]
+        assert_equal(supplier_lookup.split('FROM')[0].strip(), 'SELECT suppliers.id AS suppliers_id')
+
+    def test_filtering_by_object_identified_by_primary_key_does_not_look_it_up(self):
+        self.setup_dummy_user(id=123, role='buyer')
+        with self.app.app_context():
+            user = User.query.get(123)
+            db.session.add(AuditEvent(AuditTypes.update_user, "rob", {}, user))
+            db.session.commit()
+
+        with self.app.app_context(), assert_max_queries(2) as statements:
+            response = self.client.get('/audit-events?object-type=users&object-id=123')
+
+        assert_equal(response.status_code, 200)
+        assert_equal(len(json.loads(response.get_data())['auditEvents']), 1)
+        assert not any('FROM users' in statement for statement in statements)
+
+    def test_filtering_by_object_identified_by_primary_key_with_no_events(self):
+        response = self.client.get('/audit-events?object-type=users&object-id=100000')
+
+        assert_equal(response.status_code, 200)
+        assert_equal(json.loads(response.get_data())['auditEvents'], [])
+
+    def test_should_reject_non_integer_primary_key_object_id(self):
+        response = self.client.get('/audit-events?object-type=briefs&object-id=abc')
+
+        assert_equal(response.status_code, 400)
+
     def test_should_reject_invalid_object_type(self):
         self.add_audit_events_with_db_object()
 
@@ -255,6 +291,39 @@ class TestAuditEvents(BaseApplicationTest, FixtureMixin):
         assert_equal(data['auditEvents'][0]['user'], '5')
         assert_equal(data['auditEvents'][1]['user'], '6')
 
+    def test_keyset_paginated_audit_events(self):
+        self.add_audit_events(7)
+
+        response = self.client.get('/audit-events?after=')
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal([event['user'] for event in data['auditEvents']], ['0', '1', '2', '3', '4'])
+        assert_in('after=', data['links']['next'])
+
+        response = self.client.get(data['links']['next'])
+        data = json.loads(response.get_data())
+
+        assert_equal(response.status_code, 200)
+        assert_equal([event['user'] for event in data['auditEvents']], ['5', '6'])
+        assert_false('next' in data['links'])
+
+    def test_keyset_paginated_audit_events_latest_first(self):
+        self.add_audit_events(7)
+
+        response = self.client.get('/audit-events?after=&latest_first=true')
+        data = json.loads(response.get_data())
+        assert_equal([event['user'] for event in data['auditEvents']], ['6', '5', '4', '3', '2'])
+
+        response = self.client.get(data['links']['next'])
+        data = json.loads(response.get_data())
+        assert_equal([event['user'] for event in data['auditEvents']], ['1', '0'])
+
+    def test_keyset_paginated_audit_events_invalid_cursor(self):
+        response = self.client.get('/audit-events?after=bm90IGpzb24')
+
+        assert_equal(response.status_code, 400)
+
     def test_paginated_audit_with_custom_page_size(self):
         self.add_audit_events(12)
         response = self.client.get('/audit-events?per_page=10')
@@ -279,6 +348,13 @@ class TestAuditEvents(BaseApplicationTest, FixtureMixin):
         response = self.client.get('/audit-events?per_page=foo')
         assert_equal(response.status_code, 400)
 
+    def test_paginated_audit_with_page_size_below_one(self):
+        self.add_audit_event()
+        for per_page in ['0', '-1']:
+            for pagination in ['after=', 'page=1']:
+                response = self.client.get('/audit-events?{}&per_page={}'.format(pagination, per_page))
+                assert_equal(response.status_code, 400)
+
     def test_reject_invalid_audit_id_on_acknowledgement(self):
         res = self.client.post(
             '/audit-events/invalid-id!/acknowledge',
@@ -423,6 +499,20 @@ class TestCreateAuditEvent(BaseApplicationTest, FixtureMixin):
 
         assert_equal(res.status_code, 201)
 
+    def test_created_audit_event_references_the_object(self):
+        audit_event = self.audit_event_with_db_object()
+
+        res = self.client.post(
+            '/audit-events',
+            data=json.dumps({'auditEvents': audit_event}),
+            content_type='application/json')
+
+        assert_equal(res.status_code, 201)
+        with self.app.app_context():
+            supplier = Supplier.query.filter(Supplier.supplier_id == 0).first()
+            event = AuditEvent.query.get(json.loads(res.get_data())['auditEvents']['id'])
+            assert_equal(event.object, supplier)
+
     def test_create_audit_event_with_no_user(self):
         audit_event = self.audit_event()
         del audit_event['user']
@@ -524,3 +614,156 @@ class TestCreateAuditEvent(BaseApplicationTest, FixtureMixin):
 
         assert_equal(res.status_code, 400)
         assert_equal(data['error'], "referenced object does not exist")
+
+
+class TestCreateAuditEventsInBulk(BaseApplicationTest, FixtureMixin):
+    def setup(self):
+        super(TestCreateAuditEventsInBulk, self).setup()
+        self.setup_dummy_suppliers(3)
+
+    @staticmethod
+    def audit_event(object_type=None, object_id=None, user="A User"):
+        audit_event = {
+            "type": "register_framework_interest",
+            "user": user,
+            "data": {"Key": "value"},
+        }
+        if object_type is not None:
+            audit_event.update(objectType=object_type, objectId=object_id)
+
+        return audit_event
+
+    def post_audit_events(self, audit_events):
+        return self.client.post(
+            '/audit-events/bulk',
+            data=json.dumps({'auditEvents': audit_events}),
+            content_type='application/json')
+
+    def test_create_audit_events(self):
+        res = self.post_audit_events([
+            self.audit_event('suppliers', 2, user='first'),
+            self.audit_event('suppliers', '1', user='second'),
+            self.audit_event('frameworks', 'g-cloud-6', user='third'),
+            self.audit_event(user='fourth'),
+        ])
+
+        assert_equal(res.status_code, 201)
+        ids = json.loads(res.get_data())['auditEventIds']
+        with self.app.app_context():
+            events = [AuditEvent.query.get(event_id) for event_id in ids]
+            assert_equal([event.user for event in events], ['first', 'second', 'third', 'fourth'])
+            assert_equal([event.object.supplier_id for event in events[:2]], [2, 1])
+            assert_equal(events[2].object.slug, 'g-cloud-6')
+            assert_equal(events[3].object, None)
+            assert_equal(events[0].type, 'register_framework_interest')
+            assert_equal(events[0].data, {"Key": "value"})
+            assert_false(events[0].acknowledged)
+
+    def test_accepts_a_json_array(self):
+        res = self.client.post(
+            '/audit-events/bulk',
+            data=json.dumps([self.audit_event(), self.audit_event('suppliers', 0)]),
+            content_type='application/json')
+
+        assert_equal(res.status_code, 201)
+        assert_equal(len(json.loads(res.get_data())['auditEventIds']), 2)
+
+    def test_accepts_ndjson(self):
+        res = self.client.post(
+            '/audit-events/bulk',
+            data='\n'.join(json.dumps(self.audit_event('suppliers', i)) for i in range(3)) + '\n',
+            content_type='application/x-ndjson')
+
+        assert_equal(res.status_code, 201)
+        assert_equal(len(json.loads(res.get_data())['auditEventIds']), 3)
+
+    def test_should_reject_invalid_ndjson(self):
+        res = self.client.post(
+            '/audit-events/bulk',
+            data=json.dumps(self.audit_event()) + '\n{"type": \n',
+            content_type='application/x-ndjson')
+
+        assert_equal(res.status_code, 400)
+        assert_equal(json.loads(res.get_data())['error'], "Invalid JSON on line 2")
+
+    def test_objects_are_looked_up_with_a_query_per_object_type(self):
+        audit_events = [self.audit_event('suppliers', i % 3) for i in range(4)]
+        audit_events.append(self.audit_event('frameworks', 'g-cloud-6'))
+
+        with self.app.app_context(), assert_max_queries(4):
+            res = self.post_audit_events(audit_events)
+
+        assert_equal(res.status_code, 201)
+        with self.app.app_context():
+            assert_equal(AuditEvent.query.count(), 5)
+
+    def test_cannot_create_more_than_the_limit(self):
+        res = self.post_audit_events([self.audit_event() for _ in range(6)])
+
+        assert_equal(res.status_code, 400)
+        assert_equal(
+            json.loads(res.get_data())['error'], "Cannot create more than 5 audit events in one request"
+        )
+        with self.app.app_context():
+            assert_equal(AuditEvent.query.count(), 0)
+
+    def test_object_ids_are_converted_to_the_type_of_the_id_column(self):
+        with self.app.app_context():
+            self.setup_dummy_service('1234567890', supplier_id=0)
+
+        res = self.post_audit_events([
+            self.audit_event('services', 1234567890, user='number'),
+            self.audit_event('suppliers', '1', user='string'),
+        ])
+
+        assert_equal(res.status_code, 201)
+        ids = json.loads(res.get_data())['auditEventIds']
+        with self.app.app_context():
+            events = [AuditEvent.query.get(event_id) for event_id in ids]
+            assert_equal(events[0].object.service_id, '1234567890')
+            assert_equal(events[1].object.supplier_id, 1)
+
+    def test_numeric_object_id_for_a_string_id_column_that_does_not_exist(self):
+        res = self.post_audit_events([self.audit_event('services', 1234)])
+
+        assert_equal(res.status_code, 400)
+        assert_equal(json.loads(res.get_data())['error'], "referenced object does not exist: services 1234")
+
+    def test_should_reject_non_numeric_object_id_for_an_integer_id_column(self):
+        res = self.post_audit_events([self.audit_event('suppliers', 1), self.audit_event('users', 'abc')])
+
+        assert_equal(res.status_code, 400)
+        assert_equal(json.loads(res.get_data())['error'], "invalid object ID supplied: abc")
+        with self.app.app_context():
+            assert_equal(AuditEvent.query.count(), 0)
+
+    def test_should_reject_object_ids_that_are_not_strings_or_integers(self):
+        for object_id in ([1], {'id': 1}, True, 1.5):
+            res = self.post_audit_events([self.audit_event('suppliers', object_id)])
+
+            assert_equal(res.status_code, 400)
+            assert_equal(json.loads(res.get_data())['error'], "object ID must be a string or an integer")
+
+    def test_no_events_are_created_if_an_object_does_not_exist(self):
+        res = self.post_audit_events([self.audit_event('suppliers', 1), self.audit_event('suppliers', 6)])
+
+        assert_equal(res.status_code, 400)
+        assert_equal(json.loads(res.get_data())['error'], "referenced object does not exist: suppliers 6")
+        with self.app.app_context():
+            assert_equal(AuditEvent.query.count(), 0)
+
+    def test_no_events_are_created_if_an_event_is_invalid(self):
+        invalid_event = self.audit_event()
+        invalid_event['type'] = 'invalid'
+
+        res = self.post_audit_events([self.audit_event(), invalid_event])
+
+        assert_equal(res.status_code, 400)
+        assert_equal(json.loads(res.get_data())['error'], "invalid audit type supplied")
+        with self.app.app_context():
+            assert_equal(AuditEvent.query.count(), 0)
+
+    def test_should_reject_an_empty_list(self):
+        res = self.post_audit_events([])
+
+        assert_equal(res.status_code, 400)
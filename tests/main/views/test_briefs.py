@@ -4,12 +4,12 @@ from datetime import timedelta
 
 import pytest
 import mock
-from tests.helpers import COMPLETE_DIGITAL_SPECIALISTS_BRIEF, FixtureMixin
+from tests.helpers import COMPLETE_DIGITAL_SPECIALISTS_BRIEF, FixtureMixin, assert_max_queries
 from tests.bases import BaseApplicationTest
 
 from dmapiclient.audit import AuditTypes
 from app import db
-from app.models import Brief, Framework
+from app.models import Brief, Framework, Service
 
 
 class FrameworkSetupAndTeardown(BaseApplicationTest, FixtureMixin):
@@ -307,6 +307,37 @@ class TestUpdateBrief(FrameworkSetupAndTeardown):
         assert len(brief_audits) == 1
         assert brief_audits[0]['data'] == {'briefId': 1, 'briefJson': {'title': 'my title'}}
 
+    def test_update_brief_audit_events_are_listed_with_full_brief_json(self):
+        self.setup_dummy_briefs(1)
+        updates = [
+            {'title': 'my title', 'summary': 'a summary of the brief that is long enough to be worth a delta'},
+            {'title': 'my new title', 'summary': 'a summary of the brief that is long enough to be worth a delta'},
+            {'title': 'my new title'},
+        ]
+
+        for update in updates:
+            self.client.post(
+                '/briefs/1',
+                data=json.dumps({'briefs': update, 'updated_by': 'example'}),
+                content_type='application/json')
+
+        with self.app.app_context():
+            stored = AuditEvent.query.filter(
+                AuditEvent.type == AuditTypes.update_brief.value
+            ).order_by(AuditEvent.id).all()
+            assert [sorted(event.data) for event in stored] == [
+                # the last update is stored in full, as it's smaller than a delta removing the summary
+                ['briefId', 'briefJson'], ['briefId', 'briefJsonDelta'], ['briefId', 'briefJson'],
+            ]
+
+        audit_response = self.client.get('/audit-events?audit-type=update_brief')
+        assert audit_response.status_code == 200
+        data = json.loads(audit_response.get_data(as_text=True))
+
+        assert [event['data'] for event in data['auditEvents']] == [
+            {'briefId': 1, 'briefJson': update} for update in updates
+        ]
+
     def test_update_brief_fails_if_schema_validation_fails(self):
         self.setup_dummy_briefs(1)
 
@@ -659,6 +690,46 @@ class TestListBrief(FrameworkSetupAndTeardown):
         with pytest.raises(KeyError):
             data['briefs'][0]['users']
 
+    def setup_briefs_with_clarification_questions(self, n):
+        self.setup_dummy_briefs(n, status='live')
+        with self.app.app_context():
+            for brief in Brief.query.all():
+                brief.add_clarification_question('Why?', 'Because')
+            db.session.commit()
+
+    def test_list_briefs_loads_users_and_clarification_questions_in_batches(self):
+        self.setup_briefs_with_clarification_questions(5)
+
+        with assert_max_queries(4):
+            response = self.client.get('/briefs?with_users=true')
+        data = json.loads(response.get_data(as_text=True))
+
+        assert response.status_code == 200
+        assert len(data['briefs']) == 5
+        for brief in data['briefs']:
+            assert [user['id'] for user in brief['users']] == [1]
+            assert [question['question'] for question in brief['clarificationQuestions']] == ['Why?']
+
+    def test_list_briefs_for_a_user_loads_users_and_clarification_questions_in_batches(self):
+        self.setup_briefs_with_clarification_questions(5)
+
+        with assert_max_queries(3):
+            response = self.client.get('/briefs?user_id=1&with_users=true')
+
+        assert response.status_code == 200
+        assert len(json.loads(response.get_data(as_text=True))['briefs']) == 5
+
+    def test_list_briefs_summary_does_not_load_clarification_questions(self):
+        self.setup_briefs_with_clarification_questions(5)
+
+        with assert_max_queries(2) as statements:
+            response = self.client.get('/briefs?summary=true')
+        data = json.loads(response.get_data(as_text=True))
+
+        assert response.status_code == 200
+        assert not any('brief_clarification_questions' in statement for statement in statements)
+        assert all('clarificationQuestions' not in brief for brief in data['briefs'])
+
     def test_list_briefs_pagination_page_one(self):
         self.setup_dummy_briefs(7)
 
@@ -684,6 +755,29 @@ class TestListBrief(FrameworkSetupAndTeardown):
         assert data['meta']['total'] == 7
         assert data['links']['prev'] == 'http://localhost/briefs?page=1'
 
+    def test_list_briefs_keyset_pagination(self):
+        self.setup_dummy_briefs(7)
+
+        res = self.client.get('/briefs?after=')
+        data = json.loads(res.get_data(as_text=True))
+
+        assert res.status_code == 200
+        assert len(data['briefs']) == 5
+        assert 'meta' not in data
+        assert 'after=' in data['links']['next']
+
+        res = self.client.get(data['links']['next'])
+        data = json.loads(res.get_data(as_text=True))
+
+        assert res.status_code == 200
+        assert [brief['id'] for brief in data['briefs']] == [6, 7]
+        assert 'next' not in data['links']
+
+    def test_list_briefs_keyset_pagination_cannot_use_human_ordering(self):
+        res = self.client.get('/briefs?after=&human=true')
+
+        assert res.status_code == 400
+
     def test_list_briefs_no_pagination_if_user_id_supplied(self):
         self.setup_dummy_briefs(7)
 
@@ -1256,3 +1350,59 @@ class TestSupplierIsEligibleForBrief(BaseApplicationTest, FixtureMixin):
 
         assert response.status_code == 200
         assert data["services"]
+
+    def test_eligibility_follows_service_status(self):
+        self.setup_services()
+        self.setup_dummy_briefs(1, status="live")
+        with self.app.app_context():
+            Service.query.filter(Service.service_id == '10000000002').update({Service.status: 'disabled'})
+            db.session.commit()
+
+        response = self.client.get("/briefs/1/services?supplier_id=0")
+
+        assert response.status_code == 200
+        assert not json.loads(response.get_data(as_text=True))["services"]
+
+    def test_list_eligible_suppliers_for_specialist(self):
+        self.setup_services()
+        self.setup_dummy_briefs(1, status="live")
+
+        with assert_max_queries(2):
+            response = self.client.get("/briefs/1/eligible-suppliers")
+
+        assert response.status_code == 200
+        assert json.loads(response.get_data(as_text=True)) == {
+            "suppliers": [{"id": 0, "name": "Supplier 0"}, {"id": 1, "name": "Supplier 1"}]
+        }
+
+    def test_list_eligible_suppliers_for_outcome(self):
+        self.setup_services()
+        with self.app.app_context():
+            self.setup_dummy_user(id=1)
+            self.setup_dummy_brief(id=1, status="live", user_id=1, data={"location": "London"},
+                                   lot_slug="digital-outcomes")
+
+        response = self.client.get("/briefs/1/eligible-suppliers")
+
+        assert response.status_code == 200
+        assert json.loads(response.get_data(as_text=True)) == {"suppliers": [{"id": 0, "name": "Supplier 0"}]}
+
+    def test_list_eligible_suppliers_excludes_suppliers_without_the_role(self):
+        self.setup_services()
+        with self.app.app_context():
+            self.setup_dummy_user(id=1)
+            self.setup_dummy_brief(id=1, status="live", user_id=1,
+                                   data={"location": "London", "specialistRole": "agileCoach"})
+
+        response = self.client.get("/briefs/1/eligible-suppliers")
+
+        assert response.status_code == 200
+        assert json.loads(response.get_data(as_text=True)) == {"suppliers": []}
+
+    def test_list_eligible_suppliers_404s_for_draft_brief(self):
+        self.setup_services()
+        self.setup_dummy_briefs(1, status="draft")
+
+        response = self.client.get("/briefs/1/eligible-suppliers")
+
+        assert response.status_code == 404
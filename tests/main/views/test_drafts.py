@@ -721,7 +721,7 @@ class TestDraftServices(BaseApplicationTest, FixtureMixin):
             content_type='application/json')
         assert res.status_code == 404
 
-    @mock.patch('app.service_utils.search_api_client')
+    @mock.patch('app.search_index.search_api_client')
     def test_should_be_able_to_publish_valid_copied_draft_service(self, search_api_client):
         """
         this test creates a draft from a (live) service, updates the draft, and then publishes it.
@@ -787,6 +787,8 @@ class TestDraftServices(BaseApplicationTest, FixtureMixin):
             '/archived-services?service-id={}'.format(self.service_id))
         assert archives.status_code == 200
         assert json.loads(archives.get_data())['services'][0]['serviceName'] == 'chickens'
+
+        self.process_search_index_outbox()
         assert search_api_client.index.called
 
     def test_should_not_be_able_to_publish_submission_if_not_submitted(self):
@@ -805,7 +807,7 @@ class TestDraftServices(BaseApplicationTest, FixtureMixin):
         res = self.publish_draft_service(draft['id'])
         assert res.status_code == 400
 
-    @mock.patch('app.service_utils.search_api_client')
+    @mock.patch('app.search_index.search_api_client')
     def test_search_api_should_be_called_on_publish_if_framework_is_live(self, search_api_client):
         draft_id = self.create_draft_service()['id']
         self.complete_draft_service(draft_id)
@@ -815,11 +817,12 @@ class TestDraftServices(BaseApplicationTest, FixtureMixin):
             db.session.commit()
 
         res = self.publish_draft_service(draft_id)
-
         assert res.status_code == 200
+
+        self.process_search_index_outbox()
         assert search_api_client.index.called
 
-    @mock.patch('app.service_utils.search_api_client')
+    @mock.patch('app.search_index.search_api_client')
     def test_should_be_able_to_publish_valid_new_draft_service(self, search_api_client):
         draft_id = self.create_draft_service()['id']
         self.complete_draft_service(draft_id)
@@ -856,6 +859,7 @@ class TestDraftServices(BaseApplicationTest, FixtureMixin):
         assert json.loads(archives.get_data())['services'][0]['serviceName'] == 'An example G-7 SCS Service'
 
         # service should not be indexed as G-Cloud 7 is not live
+        self.process_search_index_outbox()
         assert not search_api_client.index.called
 
     def create_draft_service(self):
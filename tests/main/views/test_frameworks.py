@@ -5,8 +5,9 @@ from nose.tools import assert_equal, assert_in
 from freezegun import freeze_time
 
 from tests.bases import BaseApplicationTest, JSONUpdateTestMixin
+from app.framework_stats import reconcile_framework_stats
 from app.models import db, Framework, SupplierFramework, DraftService, User, FrameworkLot
-from tests.helpers import FixtureMixin
+from tests.helpers import FixtureMixin, assert_max_queries
 
 
 class TestListFrameworks(BaseApplicationTest):
@@ -536,6 +537,43 @@ class TestFrameworkStats(BaseApplicationTest, FixtureMixin):
 
         assert response.status_code == 200
 
+    def test_stats_follow_changes_to_drafts_and_declarations(self):
+        self.setup_data('g-cloud-7')
+        with self.app.app_context():
+            framework_id = Framework.query.filter(Framework.slug == 'g-cloud-7').first().id
+
+        self.make_declaration(framework_id, [14], status='complete')
+        with self.app.app_context():
+            DraftService.query.filter(
+                DraftService.supplier_id == 14,
+                DraftService.status == 'submitted'
+            ).delete(synchronize_session=False)
+            db.session.commit()
+
+        response = self.client.get('/frameworks/g-cloud-7/stats')
+        assert json.loads(response.get_data())['interested_suppliers'] == [
+            {u'count': 7, u'declaration_status': None, u'has_completed_services': False},
+            {u'count': 6, u'declaration_status': 'complete', u'has_completed_services': False},
+            {u'count': 1, u'declaration_status': 'complete', u'has_completed_services': True},
+            {u'count': 4, u'declaration_status': 'started', u'has_completed_services': False},
+            {u'count': 2, u'declaration_status': 'started', u'has_completed_services': True},
+        ]
+
+        with self.app.app_context():
+            assert reconcile_framework_stats(dry_run=True) == []
+
+    def test_stats_do_not_aggregate_drafts_or_declarations(self):
+        self.setup_data('g-cloud-7')
+
+        with assert_max_queries(5) as statements:
+            response = self.client.get('/frameworks/g-cloud-7/stats')
+
+        assert response.status_code == 200
+        assert not [
+            statement for statement in statements
+            if 'draft_services' in statement or 'supplier_frameworks' in statement
+        ]
+
 
 class TestGetFrameworkSuppliers(BaseApplicationTest, FixtureMixin):
     def setup(self):
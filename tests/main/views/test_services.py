@@ -3,7 +3,7 @@ import os
 
 from flask import json
 from app.models import Service, Supplier, ContactInformation, Framework, \
-    AuditEvent, FrameworkLot, ServiceTableMixin
+    AuditEvent, FrameworkLot, ServiceTableMixin, SearchIndexOutbox
 import mock
 import pytest
 from app import db, create_app
@@ -302,6 +302,37 @@ class TestListServices(BaseApplicationTest, FixtureMixin):
         prev_link = data['links']['prev']
         assert 'page=1' in prev_link
 
+    def test_keyset_paginated_list_services_first_page(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        response = self.client.get('/services?after=')
+        data = json.loads(response.get_data())
+
+        assert response.status_code == 200
+        assert len(data['services']) == 5
+        assert 'after=' in data['links']['next']
+        assert 'last' not in data['links']
+        assert 'prev' not in data['links']
+
+    def test_keyset_paginated_list_services_follows_next_link(self):
+        self.setup_dummy_services_including_unpublished(7)
+
+        first_page = json.loads(self.client.get('/services?after=').get_data())
+        response = self.client.get(first_page['links']['next'])
+        second_page = json.loads(response.get_data())
+
+        assert response.status_code == 200
+        assert len(second_page['services']) == 4
+        assert 'next' not in second_page['links']
+        assert not (
+            set(s['id'] for s in first_page['services']) & set(s['id'] for s in second_page['services'])
+        )
+
+    def test_keyset_paginated_list_services_invalid_cursor(self):
+        response = self.client.get('/services?after=not-a-cursor')
+
+        assert response.status_code == 400
+
     def test_paginated_list_services_page_out_of_range(self):
         self.setup_dummy_services_including_unpublished(10)
 
@@ -432,6 +463,55 @@ class TestListServices(BaseApplicationTest, FixtureMixin):
         assert data['error'] == 'Role must be specified for Digital Specialists'
 
 
+class TestExportServices(BaseApplicationTest, FixtureMixin):
+    def get_exported_services(self, query_string=''):
+        response = self.client.get('/services/export{}'.format(query_string))
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    def test_export_streams_all_services_in_id_order(self):
+        self.setup_dummy_services_including_unpublished(5)
+
+        services = self.get_exported_services()
+
+        assert len(services) == 7
+        assert services[0]['id'] == '2000000000'
+        assert services[0]['supplierName'] == 'Supplier 0'
+        assert services[0]['links']['self'] == 'http://localhost/services/2000000000'
+
+    def test_export_matches_list_services_serialization(self):
+        self.setup_dummy_services_including_unpublished(3)
+
+        listed = json.loads(self.client.get('/services').get_data())['services']
+
+        assert self.get_exported_services() == listed
+
+    def test_export_filters_by_status(self):
+        self.setup_dummy_services_including_unpublished(3)
+
+        services = self.get_exported_services('?status=enabled,disabled')
+
+        assert sorted(service['status'] for service in services) == ['disabled', 'enabled']
+
+    def test_export_filters_by_supplier_id(self):
+        self.setup_dummy_services_including_unpublished(6)
+
+        services = self.get_exported_services('?supplier_id=1')
+
+        assert len(services) == 2
+        assert all(service['supplierId'] == 1 for service in services)
+
+    def test_export_with_no_matching_services(self):
+        assert self.get_exported_services('?framework=g-cloud-4') == []
+
+    def test_export_rejects_invalid_filters(self):
+        response = self.client.get('/services/export?location=London')
+
+        assert response.status_code == 400
+
+
 class TestPostService(BaseApplicationTest, JSONUpdateTestMixin, FixtureMixin):
     endpoint = '/services/{self.service_id}'
     method = 'post'
@@ -825,7 +905,144 @@ class TestPostService(BaseApplicationTest, JSONUpdateTestMixin, FixtureMixin):
                 assert key not in service.data
 
 
-@mock.patch('app.service_utils.search_api_client')
+@mock.patch('app.search_index.search_api_client')
+class TestBulkUpdateServices(BaseApplicationTest, FixtureMixin):
+    service_ids = ['1234567890123458', '1234567890123459']
+
+    def setup(self):
+        super(TestBulkUpdateServices, self).setup()
+        payload = load_example_listing("G6-SaaS")
+        with self.app.app_context():
+            db.session.add(
+                Supplier(supplier_id=1, name=u"Supplier 1")
+            )
+            for service_id in self.service_ids:
+                payload['id'] = service_id
+                self.setup_dummy_service(service_id=service_id, **payload)
+
+    def _post_bulk_update(self, updates):
+        return self.client.post(
+            '/services/bulk-update',
+            data=json.dumps({
+                'updated_by': 'joeblogs',
+                'services': updates
+            }),
+            content_type='application/json')
+
+    def test_can_update_many_services(self, search_api_client):
+        response = self._post_bulk_update({
+            service_id: {'serviceName': 'new name {}'.format(service_id)} for service_id in self.service_ids
+        })
+
+        assert response.status_code == 200, response.get_data()
+        data = json.loads(response.get_data())
+        assert sorted(data['updated']) == self.service_ids
+        assert data['errors'] == {}
+
+        for service_id in self.service_ids:
+            response = self.client.get('/services/{}'.format(service_id))
+            assert json.loads(response.get_data())['services']['serviceName'] == 'new name {}'.format(service_id)
+
+    def test_bulk_update_archives_and_audits_each_service(self, search_api_client):
+        with self.app.app_context():
+            response = self._post_bulk_update({
+                service_id: {'serviceName': 'new service name'} for service_id in self.service_ids
+            })
+            assert response.status_code == 200
+
+            audit_events = AuditEvent.query.order_by(AuditEvent.id).all()
+            assert len(audit_events) == 2
+            for audit_event in audit_events:
+                assert audit_event.type == AuditTypes.update_service.value
+                assert audit_event.user == 'joeblogs'
+                assert audit_event.acknowledged is False
+
+                service = Service.query.filter(Service.service_id == audit_event.data['serviceId']).first()
+                assert audit_event.object == service
+                assert audit_event.data['oldArchivedServiceId'] is None
+
+                archived = self.client.get(
+                    '/archived-services/{}'.format(audit_event.data['newArchivedServiceId'])
+                )
+                archived_data = json.loads(archived.get_data())['services']
+                assert archived_data['id'] == service.service_id
+                assert archived_data['serviceName'] == 'new service name'
+
+    def test_bulk_update_links_to_previous_archived_service(self, search_api_client):
+        with self.app.app_context():
+            for name in ['new service name', 'new new service name']:
+                response = self._post_bulk_update({self.service_ids[0]: {'serviceName': name}})
+                assert response.status_code == 200
+
+            first, second = AuditEvent.query.order_by(AuditEvent.id).all()
+            assert second.data['oldArchivedServiceId'] == first.data['newArchivedServiceId']
+
+    def test_bulk_update_reports_per_service_errors(self, search_api_client):
+        with self.app.app_context():
+            response = self._post_bulk_update({
+                self.service_ids[0]: {'serviceName': 'new service name'},
+                self.service_ids[1]: {'priceMin': 'not a price'},
+                '9999999999': {'serviceName': 'new service name'},
+                'not a service id': {'serviceName': 'new service name'},
+            })
+
+            assert response.status_code == 200
+            data = json.loads(response.get_data())
+            assert data['updated'] == [self.service_ids[0]]
+            assert data['errors'][self.service_ids[1]] == {'priceMin': 'not_money_format'}
+            assert data['errors']['9999999999'] == 'Service not found'
+            assert data['errors']['not a service id'] == 'Invalid service ID supplied'
+
+            invalid_service = Service.query.filter(Service.service_id == self.service_ids[1]).first()
+            assert invalid_service.data['priceMin'] != 'not a price'
+            assert AuditEvent.query.count() == 1
+
+    def test_bulk_update_returns_400_if_no_services_are_valid(self, search_api_client):
+        response = self._post_bulk_update({self.service_ids[0]: {'priceMin': 'not a price'}})
+
+        assert response.status_code == 400
+        assert json.loads(response.get_data())['error'] == {
+            self.service_ids[0]: {'priceMin': 'not_money_format'}
+        }
+
+        self.process_search_index_outbox()
+        assert not search_api_client.index.called
+
+    def test_bulk_update_rejects_mismatched_ids(self, search_api_client):
+        response = self._post_bulk_update({
+            self.service_ids[0]: {'id': self.service_ids[1], 'serviceName': 'new service name'},
+            self.service_ids[1]: {'serviceName': 'new service name'},
+        })
+
+        assert response.status_code == 200
+        data = json.loads(response.get_data())
+        assert data['errors'] == {self.service_ids[0]: 'id parameter must match id in data'}
+
+    def test_bulk_update_requires_services_object(self, search_api_client):
+        response = self._post_bulk_update([])
+
+        assert response.status_code == 400
+        assert b"'services' must be an object" in response.get_data()
+
+    def test_bulk_update_is_limited_in_size(self, search_api_client):
+        response = self._post_bulk_update({
+            str(1234567890123450 + i): {'serviceName': 'new service name'} for i in range(4)
+        })
+
+        assert response.status_code == 400
+        assert b"Cannot update more than 3 services" in response.get_data()
+
+    def test_bulk_update_indexes_updated_services(self, search_api_client):
+        response = self._post_bulk_update({
+            service_id: {'serviceName': 'new service name'} for service_id in self.service_ids
+        })
+        assert response.status_code == 200
+
+        self.process_search_index_outbox()
+        assert sorted(call[0][0] for call in search_api_client.index.call_args_list) == self.service_ids
+
+
+@mock.patch('app.search_index.search_api_client')
 class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
     def setup(self):
         super(TestShouldCallSearchApiOnPutToCreateService, self).setup()
@@ -851,6 +1068,7 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
                 ),
                 content_type='application/json')
 
+            self.process_search_index_outbox()
             search_api_client.index.assert_called_with(
                 "1234567890123456",
                 json.loads(response.get_data())['services']
@@ -874,6 +1092,8 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
 
             assert res.status_code == 201
             assert Service.query.filter(Service.service_id == payload["id"]).first() is not None
+
+            self.process_search_index_outbox()
             assert search_api_client.index.called is False
 
     def test_should_ignore_index_error_on_service_put(self, search_api_client):
@@ -893,8 +1113,12 @@ class TestShouldCallSearchApiOnPutToCreateService(BaseApplicationTest):
 
             assert response.status_code == 201
 
+            self.process_search_index_outbox()
+            assert search_api_client.index.called
+            assert SearchIndexOutbox.query.one().attempts == 1
+
 
-@mock.patch('app.service_utils.search_api_client')
+@mock.patch('app.search_index.search_api_client')
 class TestShouldCallSearchApiOnPost(BaseApplicationTest, FixtureMixin):
 
     payload = None
@@ -931,6 +1155,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest, FixtureMixin):
                 ),
                 content_type='application/json')
 
+            self.process_search_index_outbox()
             search_api_client.index.assert_called_with(
                 self.payload['id'],
                 mock.ANY
@@ -954,7 +1179,7 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest, FixtureMixin):
                         'services': payload}
                 ),
                 content_type='application/json')
-            assert search_api_client.index.called is False
+            assert SearchIndexOutbox.query.count() == 0
 
     def test_should_not_index_on_service_on_expired_frameworks(
             self, search_api_client
@@ -973,6 +1198,8 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest, FixtureMixin):
                 content_type='application/json')
 
             assert res.status_code == 200
+
+            self.process_search_index_outbox()
             assert not search_api_client.index.called
 
     def test_should_ignore_index_error(self, search_api_client):
@@ -991,6 +1218,10 @@ class TestShouldCallSearchApiOnPost(BaseApplicationTest, FixtureMixin):
 
             assert response.status_code == 200, response.get_data()
 
+            self.process_search_index_outbox()
+            assert search_api_client.index.called
+            assert SearchIndexOutbox.query.one().attempts == 1
+
 
 class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest, FixtureMixin):
     def setup(self):
@@ -1031,7 +1262,7 @@ class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest, FixtureMixi
                             service_is_indexed, service_is_deleted,
                             expected_status_code):
 
-        with mock.patch('app.service_utils.search_api_client') \
+        with mock.patch('app.search_index.search_api_client') \
                 as search_api_client:
 
             search_api_client.index.return_value = True
@@ -1060,6 +1291,8 @@ class TestShouldCallSearchApiOnPostStatusUpdate(BaseApplicationTest, FixtureMixi
             # Check that service in database has been updated
             assert new_status == service.status
 
+            self.process_search_index_outbox()
+
             # Check that search_api_client is doing the right thing
             if service_is_indexed:
                 search_api_client.index.assert_called_with(
@@ -151,6 +151,22 @@ class TestListSuppliers(BaseApplicationTest, FixtureMixin):
         prev_link = data['links']['prev']
         assert 'page=1' in prev_link
 
+    def test_query_string_prefix_returns_keyset_paginated_pages(self):
+        response = self.client.get('/suppliers?prefix=s&after=')
+        data = json.loads(response.get_data())
+
+        assert response.status_code == 200
+        assert len(data['suppliers']) == 5
+        assert 'prefix=s' in data['links']['next']
+
+        response = self.client.get(data['links']['next'])
+        second_page = json.loads(response.get_data())
+
+        assert response.status_code == 200
+        assert len(second_page['suppliers']) == 2
+        assert 'next' not in second_page['links']
+        assert second_page['suppliers'][0]['name'] > data['suppliers'][-1]['name']
+
     def test_query_string_prefix_returns_no_pagination_for_single_page(self):
         self.setup_additional_dummy_suppliers(5, 'T')
         response = self.client.get('/suppliers?prefix=t')
@@ -1,3 +1,4 @@
+import pytest
 from flask import json
 from freezegun import freeze_time
 from app import db, encryption
@@ -168,6 +169,38 @@ class TestUsersAuth(BaseUserTest):
             db.session.commit()
             self._return_post_login(status_code=403)
 
+    def test_password_is_rehashed_on_login_if_the_number_of_rounds_has_changed(self):
+        self.create_user()
+        self.app.config['DM_PASSWORD_HASH_ROUNDS'] = 5
+
+        with self.app.app_context():
+            self.valid_login()
+            user = User.get_by_email_address('joeblogs@email.com')
+
+            assert user.password.split('$')[2] == '05'
+            assert encryption.checkpw('1234567890', user.password)
+            self.valid_login()
+
+    def test_password_is_not_rehashed_if_the_number_of_rounds_has_not_changed(self):
+        self.create_user()
+
+        with self.app.app_context():
+            password = User.get_by_email_address('joeblogs@email.com').password
+            self.valid_login()
+
+            assert User.get_by_email_address('joeblogs@email.com').password == password
+
+    def test_returns_503_if_password_hashing_is_saturated(self):
+        self.create_user()
+        self.app.config['DM_PASSWORD_HASHING_TIMEOUT'] = 0
+
+        with self.app.app_context():
+            with encryption.hashing_slot(), encryption.hashing_slot():
+                response = self._return_post_login(status_code=503)
+
+            assert response.headers['Retry-After'] == '1'
+            assert User.get_by_email_address('joeblogs@email.com').failed_login_count == 0
+
 
 class TestUsersPost(BaseApplicationTest, JSONTestMixin):
     method = "post"
@@ -1411,6 +1444,59 @@ class TestUsersExport(BaseUserTest, FixtureMixin):
                 'agreed_variations': '1'
             })
 
+    def test_response_spanning_several_batches_is_valid_json(self):
+        self._setup()
+        self._post_user({
+            "emailAddress": "third-user@example.com",
+            "name": "Third User",
+            "password": "minimum10characterpassword",
+            "role": "supplier",
+            "supplierId": self.supplier_id
+        })
+
+        data = json.loads(self._return_users_export_after_setting_framework_status().get_data())["users"]
+        assert sorted(row['email address'] for row in data) == sorted(user['emailAddress'] for user in self.users)
+
+    def test_ndjson_format(self):
+        self._setup()
+        self._put_complete_declaration()
+        self._set_framework_status('pending')
+
+        response = self.client.get('/users/export/{}?format=ndjson'.format(self.framework_slug))
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+
+        lines = response.get_data(as_text=True).splitlines()
+        assert len(lines) == len(self.users)
+        for line in lines:
+            self._assert_things_about_export_response(json.loads(line), parameters={'declaration_status': 'complete'})
+
+    def test_csv_format(self):
+        self._setup()
+        self._put_declaration(status='a "quoted", status')
+        self._set_framework_status('pending')
+
+        response = self.client.get('/users/export/{}?format=csv'.format(self.framework_slug))
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+
+        lines = response.get_data(as_text=True).splitlines()
+        assert lines[0] == (
+            '"email address","user_name","supplier_id","declaration_status","application_status",'
+            '"application_result","framework_agreement","variations_agreed"'
+        )
+        assert sorted(lines[1:]) == sorted(
+            '"{}","{}","{}","a ""quoted"", status","no_application","no result","False",""'.format(
+                user['emailAddress'], user['name'], self.supplier_id
+            )
+            for user in self.users
+        )
+
+    def test_400_response_if_bad_format(self):
+        self._setup()
+        response = self.client.get('/users/export/{}?format=xml'.format(self.framework_slug))
+        assert response.status_code == 400
+
 
 class TestUsersEmailCheck(BaseUserTest):
     def test_valid_email_is_ok(self):
@@ -1426,3 +1512,39 @@ class TestUsersEmailCheck(BaseUserTest):
     def test_email_address_is_required(self):
         response = self.client.get('/users/check-buyer-email')
         assert response.status_code == 400
+
+
+class TestUsersBatchEmailCheck(BaseUserTest):
+    def _check(self, email_addresses):
+        return self.client.post(
+            '/users/check-buyer-emails',
+            data=json.dumps({'emailAddresses': email_addresses}),
+            content_type='application/json')
+
+    def test_returns_whether_each_email_address_is_valid(self):
+        response = self._check(['buyer@gov.uk', 'someone@notgov.uk', 'buyer@department.gov.uk'])
+
+        assert response.status_code == 200
+        assert json.loads(response.get_data())['emailAddresses'] == [
+            {'emailAddress': 'buyer@gov.uk', 'valid': True},
+            {'emailAddress': 'someone@notgov.uk', 'valid': False},
+            {'emailAddress': 'buyer@department.gov.uk', 'valid': True},
+        ]
+
+    def test_email_addresses_are_required(self):
+        response = self.client.post(
+            '/users/check-buyer-emails', data=json.dumps({}), content_type='application/json')
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize('email_addresses', ['buyer@gov.uk', {'buyer@gov.uk': True}, ['buyer@gov.uk', 1]])
+    def test_email_addresses_must_be_a_list_of_strings(self, email_addresses):
+        response = self._check(email_addresses)
+
+        assert response.status_code == 400
+        assert json.loads(response.get_data())['error'] == "'emailAddresses' must be a list of email addresses"
+
+    def test_cannot_check_more_than_the_limit(self):
+        response = self._check(['buyer{}@gov.uk'.format(n) for n in range(4)])
+
+        assert response.status_code == 400
+        assert json.loads(response.get_data())['error'] == "Cannot check more than 3 email addresses in one request"
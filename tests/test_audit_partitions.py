@@ -0,0 +1,74 @@
+import gzip
+from datetime import datetime
+
+from dmapiclient.audit import AuditTypes
+
+from app import db
+from app.audit_partitions import archive_partitions, create_partitions, list_partitions
+from app.models import AuditEvent
+from tests.bases import BaseApplicationTest
+
+
+class TestAuditPartitions(BaseApplicationTest):
+    def teardown(self):
+        with self.app.app_context():
+            for month, name in list_partitions():
+                if month.year == 2016:
+                    db.session.execute('DROP TABLE {}'.format(name))
+            db.session.commit()
+        super(TestAuditPartitions, self).teardown()
+
+    def create_event(self, created_at):
+        event = AuditEvent(AuditTypes.supplier_update, 'user', {'created': str(created_at)}, None)
+        event.created_at = created_at
+        db.session.add(event)
+        db.session.commit()
+        return event.id
+
+    def count(self, table):
+        return db.session.execute('SELECT count(*) FROM {}'.format(table)).scalar()
+
+    def test_events_are_inserted_into_their_months_partition(self):
+        with self.app.app_context():
+            assert create_partitions(1, now=datetime(2016, 1, 15)) == ['audit_events_2016_01', 'audit_events_2016_02']
+
+            event_id = self.create_event(datetime(2016, 2, 3))
+
+            assert self.count('audit_events_2016_02') == 1
+            assert self.count('ONLY audit_events') == 0
+            assert AuditEvent.query.get(event_id).created_at == datetime(2016, 2, 3)
+
+    def test_events_are_moved_into_partitions_created_after_them(self):
+        with self.app.app_context():
+            self.create_event(datetime(2016, 5, 1))
+            assert self.count('ONLY audit_events') == 1
+
+            assert create_partitions(0, now=datetime(2016, 1, 1)) == ['audit_events_2016_01', 'audit_events_2016_05']
+
+            assert self.count('ONLY audit_events') == 0
+            assert self.count('audit_events_2016_05') == 1
+
+    def test_existing_partitions_are_not_created_again(self):
+        with self.app.app_context():
+            create_partitions(1, now=datetime(2016, 1, 1))
+
+            assert create_partitions(2, now=datetime(2016, 1, 1)) == ['audit_events_2016_03']
+
+    def test_old_partitions_are_exported_and_dropped(self, tmpdir):
+        with self.app.app_context():
+            create_partitions(2, now=datetime(2016, 1, 1))
+            self.create_event(datetime(2016, 1, 20))
+            march_event_id = self.create_event(datetime(2016, 3, 2))
+
+            archived = archive_partitions(str(tmpdir), 1, now=datetime(2016, 3, 10))
+
+            assert archived == [str(tmpdir.join('audit_events_2016_01.csv.gz'))]
+            with gzip.open(archived[0], 'rb') as archive:
+                lines = archive.read().decode('utf-8').splitlines()
+            assert lines[0].startswith('id,type,created_at')
+            assert len(lines) == 2 and '2016-01-20' in lines[1]
+
+            assert [name for month, name in list_partitions() if month.year == 2016] == [
+                'audit_events_2016_02', 'audit_events_2016_03'
+            ]
+            assert [event.id for event in AuditEvent.query.all()] == [march_event_id]
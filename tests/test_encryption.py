@@ -1,6 +1,13 @@
+import tempfile
+import time
+
+import pytest
 from nose.tools import assert_equal, assert_not_equal
 
-from app.encryption import checkpw, hashpw
+from app.encryption import (
+    PasswordHashingUnavailable, checkpw, hash_user_password, hashing_slot, hashpw, needs_rehash
+)
+from tests.bases import BaseApplicationTest
 
 
 def test_should_hash_password():
@@ -18,3 +25,44 @@ def test_should_check_invalid_password():
     password = "mypassword"
     password_hash = hashpw(password)
     assert_equal(checkpw("not my password", password_hash), False)
+
+
+class TestPasswordHashing(BaseApplicationTest):
+    def setup(self):
+        super(TestPasswordHashing, self).setup()
+        self.app.config['DM_PASSWORD_HASHING_CONCURRENCY'] = 1
+        self.app.config['DM_PASSWORD_HASHING_TIMEOUT'] = 0
+        self.app.config['DM_PASSWORD_HASHING_LOCK_DIR'] = tempfile.mkdtemp()
+
+    def test_hash_user_password_uses_the_configured_number_of_rounds(self):
+        with self.app.app_context():
+            password_hash = hash_user_password("mypassword")
+
+            assert password_hash.split('$')[2] == '04'
+            assert checkpw("mypassword", password_hash)
+
+    def test_needs_rehash(self):
+        with self.app.app_context():
+            assert not needs_rehash(hashpw("mypassword", 4))
+            assert needs_rehash(hashpw("mypassword", 5))
+            assert not needs_rehash("not a hash")
+
+    def test_hashing_slots_are_released(self):
+        with self.app.app_context():
+            hash_user_password("mypassword")
+            hash_user_password("mypassword")
+
+    def test_hashing_fails_if_there_are_no_free_slots(self):
+        with self.app.app_context(), hashing_slot():
+            with pytest.raises(PasswordHashingUnavailable):
+                hash_user_password("mypassword")
+
+    def test_hashing_waits_for_a_free_slot_until_the_timeout(self):
+        self.app.config['DM_PASSWORD_HASHING_TIMEOUT'] = 0.05
+
+        with self.app.app_context(), hashing_slot():
+            start = time.time()
+            with pytest.raises(PasswordHashingUnavailable):
+                hash_user_password("mypassword")
+
+            assert time.time() - start >= 0.05
@@ -0,0 +1,152 @@
+import json
+
+import mock
+import pytest
+from werkzeug.exceptions import NotFound
+
+from app import db
+from app.framework_registry import (
+    registry, get_framework, get_framework_by_id, get_framework_or_404, get_frameworks
+)
+from app.models import Framework, FrameworkLot
+from tests.bases import BaseApplicationTest
+from tests.helpers import FixtureMixin, assert_max_queries
+
+
+class TestFrameworkRegistry(BaseApplicationTest, FixtureMixin):
+    def setup(self):
+        super(TestFrameworkRegistry, self).setup()
+        self.app.config['DM_FRAMEWORK_REGISTRY_TTL'] = 300
+        registry.clear()
+
+    def teardown(self):
+        registry.clear()
+        super(TestFrameworkRegistry, self).teardown()
+        with self.app.app_context():
+            framework = Framework.query.filter(Framework.slug == 'example').first()
+            if framework:
+                FrameworkLot.query.filter(FrameworkLot.framework_id == framework.id).delete()
+                Framework.query.filter(Framework.id == framework.id).delete()
+                db.session.commit()
+
+    def test_lookups_are_served_from_memory(self):
+        with self.app.app_context():
+            get_frameworks()
+
+            with assert_max_queries(0):
+                framework = get_framework('g-cloud-7')
+                assert framework.slug == 'g-cloud-7'
+                assert {lot.slug for lot in framework.lots} == {'saas', 'paas', 'iaas', 'scs'}
+                assert get_framework_by_id(framework.id).slug == 'g-cloud-7'
+                assert get_framework('not-a-framework') is None
+
+    def test_lookups_return_objects_in_the_current_session(self):
+        with self.app.app_context():
+            framework = get_framework('g-cloud-7')
+
+            assert framework in db.session
+            assert get_framework('g-cloud-7') is framework
+
+    def test_get_frameworks_returns_all_frameworks(self):
+        with self.app.app_context():
+            assert [f.slug for f in get_frameworks()] == [f.slug for f in Framework.query.order_by(Framework.id)]
+
+    def test_get_framework_or_404(self):
+        with self.app.app_context():
+            assert get_framework_or_404('g-cloud-7').slug == 'g-cloud-7'
+            with pytest.raises(NotFound):
+                get_framework_or_404('not-a-framework')
+
+    def test_frameworks_are_reloaded_after_the_ttl(self, open_example_framework):
+        with self.app.app_context():
+            get_framework('example-framework')
+            db.engine.execute("UPDATE frameworks SET status = 'live' WHERE slug = 'example-framework'")
+            assert get_framework('example-framework').status == 'open'
+
+            self.app.config['DM_FRAMEWORK_REGISTRY_TTL'] = 0
+            db.session.remove()
+            assert get_framework('example-framework').status == 'live'
+
+    def test_committing_a_framework_change_clears_the_cache_and_notifies_other_processes(
+        self, open_example_framework
+    ):
+        with self.app.app_context():
+            get_framework('example-framework')
+
+            framework = Framework.query.filter(Framework.slug == 'example-framework').first()
+            framework.status = 'live'
+            with assert_max_queries(5) as statements:
+                db.session.commit()
+
+            assert 'NOTIFY dm_framework_registry' in statements
+            db.session.remove()
+            assert get_framework('example-framework').status == 'live'
+
+    def test_bulk_framework_updates_clear_the_cache(self, open_example_framework):
+        with self.app.app_context():
+            get_framework('example-framework')
+
+        self.set_framework_status('example-framework', 'live')
+
+        with self.app.app_context():
+            assert get_framework('example-framework').status == 'live'
+
+    def test_rolled_back_changes_do_not_clear_the_cache(self, open_example_framework):
+        with self.app.app_context():
+            get_framework('example-framework')
+
+            Framework.query.filter(Framework.slug == 'example-framework').update({'status': 'live'})
+            db.session.rollback()
+            db.session.commit()
+
+            with assert_max_queries(0):
+                assert get_framework('example-framework').status == 'open'
+
+    def test_update_framework_invalidates_the_cache(self, open_example_framework):
+        assert self.client.get('/frameworks/example-framework').status_code == 200
+
+        response = self.client.post(
+            '/frameworks/example-framework',
+            data=json.dumps({'frameworks': {'status': 'live'}, 'updated_by': 'example user'}),
+            content_type='application/json'
+        )
+        assert response.status_code == 200
+
+        response = self.client.get('/frameworks/example-framework')
+        assert json.loads(response.get_data())['frameworks']['status'] == 'live'
+
+    def test_create_framework_invalidates_the_cache(self):
+        assert self.client.get('/frameworks/example').status_code == 404
+
+        response = self.client.post(
+            '/frameworks',
+            data=json.dumps({
+                'frameworks': {
+                    'slug': 'example',
+                    'name': 'Example',
+                    'framework': 'g-cloud',
+                    'status': 'open',
+                    'clarificationQuestionsOpen': False,
+                    'lots': ['saas'],
+                },
+                'updated_by': 'example user',
+            }),
+            content_type='application/json'
+        )
+        assert response.status_code == 200
+
+        assert self.client.get('/frameworks/example').status_code == 200
+
+    def test_listener_is_started_once_per_process(self):
+        self.app.config['DM_FRAMEWORK_REGISTRY_LISTEN'] = True
+        registry._listener_pid = None
+
+        with mock.patch('app.framework_registry.threading.Thread') as thread, self.app.app_context():
+            get_framework('g-cloud-7')
+            get_framework('g-cloud-7')
+
+            with mock.patch('app.framework_registry.os.getpid', return_value=-1):
+                get_framework('g-cloud-7')
+
+        assert thread.call_count == 2
+        registry._listener_pid = None
@@ -0,0 +1,77 @@
+from app import db
+from app.framework_stats import reconcile_framework_stats
+from app.models import DraftService, Framework, FrameworkDraftStats, SupplierFramework
+from tests.bases import BaseApplicationTest
+from tests.helpers import FixtureMixin
+
+
+class TestReconcileFrameworkStats(BaseApplicationTest, FixtureMixin):
+    def setup(self):
+        super(TestReconcileFrameworkStats, self).setup()
+        self.setup_dummy_suppliers(2)
+        with self.app.app_context():
+            self.framework_id = Framework.query.filter(Framework.slug == 'g-cloud-7').first().id
+            self.other_framework_id = Framework.query.filter(Framework.slug == 'g-cloud-6').first().id
+            for framework_id in [self.framework_id, self.other_framework_id]:
+                framework = Framework.query.get(framework_id)
+                for supplier_id in [0, 1]:
+                    db.session.add(SupplierFramework(
+                        framework_id=framework_id, supplier_id=supplier_id, declaration={'status': 'complete'}
+                    ))
+                    db.session.add(DraftService(
+                        framework_id=framework_id, lot=framework.lots[0], supplier_id=supplier_id,
+                        data={}, status='submitted'
+                    ))
+            db.session.commit()
+            self.lot_id = Framework.query.get(self.framework_id).lots[0].id
+
+    def corrupt_draft_count(self, framework_id, draft_count):
+        db.session.query(FrameworkDraftStats).filter(
+            FrameworkDraftStats.framework_id == framework_id
+        ).update({FrameworkDraftStats.draft_count: draft_count}, synchronize_session=False)
+        db.session.commit()
+
+    def draft_count(self):
+        return db.session.query(FrameworkDraftStats.draft_count).filter(
+            FrameworkDraftStats.framework_id == self.framework_id,
+            FrameworkDraftStats.lot_id == self.lot_id,
+            FrameworkDraftStats.draft_status == 'submitted',
+            FrameworkDraftStats.declaration_status == 'complete',
+        ).scalar()
+
+    def test_triggers_keep_stats_in_step(self):
+        with self.app.app_context():
+            assert self.draft_count() == 2
+            assert reconcile_framework_stats() == []
+
+    def test_dry_run_reports_drift_without_correcting_it(self):
+        with self.app.app_context():
+            self.corrupt_draft_count(self.framework_id, 5)
+
+            assert reconcile_framework_stats(dry_run=True) == [
+                ('framework_draft_stats', (self.framework_id, self.lot_id, 'submitted', 'complete'), 5, 2),
+            ]
+            assert self.draft_count() == 5
+
+    def test_drift_is_corrected(self):
+        with self.app.app_context():
+            self.corrupt_draft_count(self.framework_id, 5)
+
+            assert len(reconcile_framework_stats()) == 1
+            assert self.draft_count() == 2
+            assert reconcile_framework_stats() == []
+
+    def test_missing_stats_are_recreated(self):
+        with self.app.app_context():
+            FrameworkDraftStats.query.delete()
+            db.session.commit()
+
+            assert len(reconcile_framework_stats()) == 2
+            assert self.draft_count() == 2
+
+    def test_only_the_given_frameworks_are_reconciled(self):
+        with self.app.app_context():
+            self.corrupt_draft_count(self.other_framework_id, 5)
+
+            assert reconcile_framework_stats([self.framework_id]) == []
+            assert len(reconcile_framework_stats([self.other_framework_id], dry_run=True)) == 1
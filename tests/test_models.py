@@ -2,12 +2,14 @@ from datetime import datetime, timedelta
 
 import mock
 import pytest
+from freezegun import freeze_time
+from dmapiclient.audit import AuditTypes
 from nose.tools import assert_equal, assert_raises
 from sqlalchemy.exc import IntegrityError
 
 from app import db, create_app
 from app.models import (
-    User, Lot, Framework, Service,
+    AuditEvent, User, Lot, Framework, Service, load_users, load_audit_snapshots,
     Supplier, SupplierFramework, FrameworkAgreement,
     Brief, BriefResponse,
     ValidationError,
@@ -17,7 +19,7 @@ from app.models import (
 )
 
 from tests.bases import BaseApplicationTest
-from tests.helpers import FixtureMixin
+from tests.helpers import FixtureMixin, assert_max_queries
 
 
 def test_should_not_return_password_on_user():
@@ -268,6 +270,44 @@ class TestBriefs(BaseApplicationTest, FixtureMixin):
             db.session.commit()
             assert Brief.query.filter(Brief.applications_closed_at == datetime(2016, 3, 17, 23, 59, 59)).count() == 3
 
+    def test_closing_dates_are_stored_when_a_brief_is_published(self):
+        with self.app.app_context():
+            brief = Brief(data={'requirementsLength': '1 week'}, framework=self.framework, lot=self.lot)
+            db.session.add(brief)
+            db.session.commit()
+            assert brief.applications_closed_at is None
+
+            brief.published_at = datetime(2016, 3, 3, 12, 30, 1, 2)
+            db.session.commit()
+            db.session.expire_all()
+
+            assert brief.applications_closed_at == datetime(2016, 3, 10, 23, 59, 59)
+            assert brief.clarification_questions_closed_at == datetime(2016, 3, 7, 23, 59, 59)
+            assert brief.clarification_questions_published_by == datetime(2016, 3, 9, 23, 59, 59)
+
+    def test_closing_dates_follow_changes_to_requirements_length(self):
+        brief = Brief(data={'requirementsLength': '1 week'}, framework=self.framework, lot=self.lot,
+                      published_at=datetime(2016, 3, 3, 12, 30, 1, 2))
+        brief.update_from_json({'requirementsLength': '2 weeks'})
+
+        assert brief.applications_closed_at == datetime(2016, 3, 17, 23, 59, 59)
+        assert brief.clarification_questions_closed_at == datetime(2016, 3, 10, 23, 59, 59)
+
+    def test_has_statuses_filters_on_columns(self):
+        with self.app.app_context():
+            db.session.add(Brief(data={}, framework=self.framework, lot=self.lot))
+            db.session.add(Brief(data={}, framework=self.framework, lot=self.lot, published_at=datetime.utcnow()))
+            db.session.add(Brief(data={}, framework=self.framework, lot=self.lot, published_at=datetime(2000, 1, 1)))
+            db.session.add(Brief(data={}, framework=self.framework, lot=self.lot,
+                                 published_at=datetime(2000, 1, 1), withdrawn_at=datetime(2000, 1, 2)))
+            db.session.commit()
+
+            for status in ['draft', 'live', 'closed', 'withdrawn']:
+                assert [brief.status for brief in Brief.query.has_statuses(status)] == [status]
+            assert Brief.query.has_statuses('live', 'closed').count() == 2
+            assert Brief.query.has_statuses('invalid').count() == 0
+            assert 'CASE' not in str(Brief.query.has_statuses('live').statement)
+
     def test_expired_status_for_a_brief_with_passed_close_date(self):
         brief = Brief(data={}, framework=self.framework, lot=self.lot,
                       published_at=datetime.utcnow() - timedelta(days=1000))
@@ -808,6 +848,9 @@ class TestServices(BaseApplicationTest, FixtureMixin):
             services = Service.query.data_key_contains_value('key1', 'bar1')
             assert services.count() == 0
 
+            services = Service.query.data_key_contains_value('key1', 'foo')
+            assert services.count() == 0
+
     def test_service_status(self):
         service = Service(status='enabled')
 
@@ -849,6 +892,36 @@ class TestServices(BaseApplicationTest, FixtureMixin):
             assert service.updated_at > updated_at
             assert service.data == {'foo': 'bar', 'serviceName': 'Service 1000000000'}
 
+    def test_serialize_in_a_request_matches_serialize_outside_one(self):
+        with self.app.app_context():
+            self.setup_dummy_services_including_unpublished(2)
+            services = Service.query.order_by(Service.service_id).all()
+
+            with mock.patch('app.models.url_for') as url_for:
+                url_for.side_effect = lambda endpoint, service_id: 'http://localhost/services/{}'.format(service_id)
+                uncached = [service.serialize() for service in services]
+
+            with self.app.test_request_context('/'):
+                cached = [service.serialize() for service in services]
+
+            assert cached == uncached
+
+    def test_related_objects_are_serialized_once_per_request(self):
+        with self.app.app_context():
+            self.setup_dummy_services_including_unpublished(2)
+            first, second = Service.query.order_by(Service.service_id).limit(2).all()
+            framework_name = first.framework.name
+
+            with self.app.test_request_context('/'):
+                first.serialize()
+                first.framework.name = 'Changed framework name'
+                assert second.serialize()['frameworkName'] == framework_name
+
+            with self.app.test_request_context('/'):
+                assert second.serialize()['frameworkName'] == 'Changed framework name'
+
+            db.session.rollback()
+
 
 class TestSupplierFrameworks(BaseApplicationTest, FixtureMixin):
     def test_nulls_are_stripped_from_declaration(self):
@@ -880,6 +953,57 @@ class TestSupplierFrameworks(BaseApplicationTest, FixtureMixin):
                 ).all()
             ) == 1
 
+    def test_serialize_with_users_loads_all_users_in_one_query(self):
+        for user_id in (1, 2, 3, 4):
+            self.setup_dummy_user(id=user_id, role='admin')
+
+        with self.app.app_context():
+            self.setup_dummy_suppliers(1)
+            db.session.add(SupplierFramework(
+                supplier_id=0, framework_id=1,
+                agreed_variations={'banana': {'agreedUserId': 1}, 'toblerone': {'agreedUserId': '2'}},
+            ))
+            db.session.add(FrameworkAgreement(
+                supplier_id=0, framework_id=1,
+                signed_agreement_details={'uploaderUserId': 3},
+                signed_agreement_returned_at=datetime.utcnow(),
+                countersigned_agreement_details={'approvedByUserId': 4},
+                countersigned_agreement_returned_at=datetime.utcnow(),
+            ))
+            db.session.commit()
+
+            supplier_framework = SupplierFramework.query.filter(SupplierFramework.supplier_id == 0).one()
+            with assert_max_queries(1) as statements:
+                serialized = supplier_framework.serialize(with_users=True)
+
+            assert 'users' in statements[0]
+            assert serialized['agreedVariations'] == {
+                'banana': {'agreedUserId': 1, 'agreedUserName': 'my name', 'agreedUserEmail': 'test+1@digital.gov.uk'},
+                'toblerone': {
+                    'agreedUserId': '2', 'agreedUserName': 'my name', 'agreedUserEmail': 'test+2@digital.gov.uk'
+                },
+            }
+            assert serialized['agreementDetails'] == {
+                'uploaderUserId': 3, 'uploaderUserName': 'my name', 'uploaderUserEmail': 'test+3@digital.gov.uk'
+            }
+            assert serialized['countersignedDetails'] == {
+                'approvedByUserId': 4, 'approvedByUserName': 'my name', 'approvedByUserEmail': 'test+4@digital.gov.uk'
+            }
+
+    def test_serialize_without_users_does_not_load_users(self):
+        with self.app.app_context():
+            self.setup_dummy_suppliers(1)
+            db.session.add(SupplierFramework(
+                supplier_id=0, framework_id=1, agreed_variations={'banana': {'agreedUserId': 1}}
+            ))
+            db.session.commit()
+
+            supplier_framework = SupplierFramework.query.filter(SupplierFramework.supplier_id == 0).one()
+            with assert_max_queries(0):
+                serialized = supplier_framework.serialize()
+
+            assert serialized['agreedVariations'] == {'banana': {'agreedUserId': 1}}
+
     def test_prefill_declaration_from_framework(self):
         with self.app.app_context():
             self.setup_dummy_suppliers(2)
@@ -913,6 +1037,112 @@ class TestSupplierFrameworks(BaseApplicationTest, FixtureMixin):
                 db.session.commit()
 
 
+class TestAuditEvents(BaseApplicationTest, FixtureMixin):
+    def _create_event(self, user):
+        event = AuditEvent(AuditTypes.update_service, user, {}, None)
+        db.session.add(event)
+        db.session.commit()
+        return event
+
+    def test_serialize_include_user(self):
+        self.setup_dummy_user(id=1, role='admin')
+
+        with self.app.app_context(), self.app.test_request_context('/'):
+            event = self._create_event('test+1@digital.gov.uk')
+
+            assert event.serialize(include_user=True)['userName'] == 'my name'
+            assert 'userName' not in self._create_event('unknown@digital.gov.uk').serialize(include_user=True)
+
+    def test_serialize_include_user_with_preloaded_users(self):
+        self.setup_dummy_user(id=1, role='admin')
+
+        with self.app.app_context(), self.app.test_request_context('/'):
+            events = [self._create_event('test+1@digital.gov.uk'), self._create_event('someone@digital.gov.uk')]
+            email_addresses = [event.user for event in events]
+
+            with assert_max_queries(1):
+                _, users_by_email = load_users(email_addresses=email_addresses)
+                serialized = [event.serialize(include_user=True, users_by_email=users_by_email) for event in events]
+
+            assert serialized[0]['userName'] == 'my name'
+            assert 'userName' not in serialized[1]
+
+
+class TestAuditEventPayloadDeltas(BaseApplicationTest, FixtureMixin):
+    def setup(self):
+        super(TestAuditEventPayloadDeltas, self).setup()
+        self.setup_dummy_briefs(1)
+
+    @staticmethod
+    def brief_json(title, **kwargs):
+        brief_json = dict(('question{}'.format(i), 'a long answer to question {}'.format(i)) for i in range(10))
+        brief_json.update(title=title, **kwargs)
+        return brief_json
+
+    def _create_event(self, brief_json):
+        event = AuditEvent(AuditTypes.update_brief, 'user', {'briefId': 1, 'briefJson': brief_json}, Brief.query.get(1))
+        event.encode_payload_delta()
+        db.session.add(event)
+        db.session.commit()
+        return event
+
+    def test_payloads_are_stored_as_deltas_against_a_snapshot(self):
+        with self.app.app_context():
+            snapshot = self._create_event(self.brief_json('one'))
+            first = self._create_event(self.brief_json('two'))
+            second = self._create_event(self.brief_json('three', extra='new'))
+
+            assert snapshot.data == {'briefId': 1, 'briefJson': self.brief_json('one')}
+            assert first.data == {'briefId': 1, 'briefJsonDelta': {
+                'snapshotId': snapshot.id, 'sequence': 1, 'set': {'title': 'two'}, 'unset': [],
+            }}
+            assert second.data['briefJsonDelta'] == {
+                'snapshotId': snapshot.id, 'sequence': 2, 'set': {'title': 'three', 'extra': 'new'}, 'unset': [],
+            }
+
+    def test_a_snapshot_is_stored_after_the_snapshot_interval(self):
+        with self.app.app_context():
+            events = [self._create_event(self.brief_json(str(i))) for i in range(5)]
+
+            assert ['briefJson' in event.data for event in events] == [True, False, False, True, False]
+            assert events[4].snapshot_id == events[3].id
+
+    def test_payload_is_stored_in_full_if_delta_is_not_smaller(self):
+        with self.app.app_context():
+            self._create_event({'title': 'one'})
+            event = self._create_event({'summary': 'two'})
+
+            assert event.data == {'briefId': 1, 'briefJson': {'summary': 'two'}}
+
+    def test_a_snapshot_is_stored_in_each_month(self):
+        with self.app.app_context():
+            with freeze_time('2016-01-31 23:59:00'):
+                self._create_event(self.brief_json('one'))
+            with freeze_time('2016-02-01 00:01:00'):
+                event = self._create_event(self.brief_json('two'))
+
+            assert event.data == {'briefId': 1, 'briefJson': self.brief_json('two')}
+
+    def test_events_are_serialized_with_full_payloads(self):
+        payloads = [self.brief_json('one'), self.brief_json('two'), self.brief_json('three', extra='new')]
+        del payloads[2]['question1']
+
+        with self.app.app_context(), self.app.test_request_context('/'):
+            event_ids = [self._create_event(payload).id for payload in payloads]
+            db.session.expire_all()
+            events = AuditEvent.query.filter(AuditEvent.id.in_(event_ids)).order_by(AuditEvent.id).all()
+
+            with assert_max_queries(1):
+                snapshots = load_audit_snapshots(events)
+                serialized = [event.serialize(snapshots=snapshots) for event in events]
+
+            assert [event['data'] for event in serialized] == [
+                {'briefId': 1, 'briefJson': payload} for payload in payloads
+            ]
+            assert events[2].data['briefJsonDelta']['unset'] == ['question1']
+            assert events[2].serialize()['data']['briefJson'] == payloads[2]
+
+
 class TestLot(BaseApplicationTest):
     def test_lot_data_is_serialized(self):
         with self.app.app_context():
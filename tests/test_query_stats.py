@@ -0,0 +1,70 @@
+import mock
+import pytest
+
+from app import db
+from app.models import Supplier
+from tests.bases import BaseApplicationTest
+from tests.helpers import FixtureMixin, assert_max_queries
+
+
+class TestQueryStats(BaseApplicationTest, FixtureMixin):
+    service_id = '1234567890123456'
+
+    def setup(self):
+        super(TestQueryStats, self).setup()
+        with self.app.app_context():
+            db.session.add(Supplier(supplier_id=1, name=u"Supplier 1"))
+            self.setup_dummy_service(self.service_id)
+
+    def _get_service(self):
+        return self.client.get('/services/{}'.format(self.service_id))
+
+    def test_headers_are_not_returned_by_default(self):
+        response = self._get_service()
+
+        assert response.status_code == 200
+        assert 'DM-Query-Count' not in response.headers
+
+    def test_headers_are_returned_if_enabled(self):
+        self.app.config['DM_API_QUERY_STATS_HEADERS'] = True
+
+        response = self._get_service()
+
+        assert int(response.headers['DM-Query-Count']) > 0
+        assert float(response.headers['DM-Query-Time']) > 0
+        assert int(response.headers['DM-Query-Rows']) > 0
+        assert float(response.headers['DM-Serialization-Time']) > 0
+
+    def test_stats_only_include_queries_from_the_current_request(self):
+        self.app.config['DM_API_QUERY_STATS_HEADERS'] = True
+
+        with self.app.app_context():
+            first = self._get_service()
+            second = self._get_service()
+
+        assert first.headers['DM-Query-Count'] == second.headers['DM-Query-Count']
+        assert first.headers['DM-Query-Rows'] == second.headers['DM-Query-Rows']
+
+    def test_stats_are_logged(self):
+        with mock.patch.object(self.app.logger, 'info') as info:
+            self._get_service()
+
+        extra = next(
+            kwargs['extra'] for args, kwargs in info.call_args_list
+            if args[0] == '{method} {path} ran {query_count} queries in {query_time}ms'
+        )
+        assert extra['method'] == 'GET'
+        assert extra['path'] == '/services/{}'.format(self.service_id)
+        assert extra['query_count'] > 0
+        assert set(extra) >= {'query_time', 'query_rows', 'serialization_time'}
+
+    def test_assert_max_queries(self):
+        self.app.config['DM_API_QUERY_STATS_HEADERS'] = True
+        query_count = int(self._get_service().headers['DM-Query-Count'])
+
+        with assert_max_queries(query_count):
+            self._get_service()
+
+        with pytest.raises(AssertionError):
+            with assert_max_queries(query_count - 1):
+                self._get_service()
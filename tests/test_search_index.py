@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta
+
+import mock
+import pytest
+from dmapiclient import HTTPError
+
+from app import db
+from app.models import SearchIndexOutbox, Service, Supplier
+from app.search_index import (
+    index_service_chunk, indexable_service_id_chunks, process_search_index_outbox, queue_search_index_update,
+    reindex_services, retry_delay, run_search_index_worker
+)
+from tests.bases import BaseApplicationTest
+from tests.helpers import FixtureMixin, load_example_listing
+
+
+@mock.patch('app.search_index.search_api_client')
+class TestProcessSearchIndexOutbox(BaseApplicationTest, FixtureMixin):
+    service_ids = ['1234567890123458', '1234567890123459']
+
+    def setup(self):
+        super(TestProcessSearchIndexOutbox, self).setup()
+        payload = load_example_listing("G6-SaaS")
+        with self.app.app_context():
+            db.session.add(
+                Supplier(supplier_id=1, name=u"Supplier 1")
+            )
+            for service_id in self.service_ids:
+                payload['id'] = service_id
+                self.setup_dummy_service(service_id=service_id, **payload)
+
+    def _queue(self, *updates):
+        for service_id, action in updates:
+            service = Service.query.filter(Service.service_id == service_id).first()
+            queue_search_index_update(service, action)
+        db.session.commit()
+
+    def test_sends_queued_updates(self, search_api_client):
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'index'), (self.service_ids[1], 'delete'))
+
+            assert process_search_index_outbox() == 2
+
+            search_api_client.index.assert_called_once_with(self.service_ids[0], mock.ANY)
+            search_api_client.delete.assert_called_once_with(self.service_ids[1])
+            assert SearchIndexOutbox.query.count() == 0
+
+    def test_indexes_current_state_of_service(self, search_api_client):
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'index'))
+            Service.query.filter(Service.service_id == self.service_ids[0]).update({'data': {'serviceName': 'new'}})
+            db.session.commit()
+
+            process_search_index_outbox()
+
+            indexed = search_api_client.index.call_args[0][1]
+            assert indexed['serviceName'] == 'new'
+            assert indexed['links']['self'] == 'http://localhost/services/{}'.format(self.service_ids[0])
+
+    def test_coalesces_repeated_updates_to_the_same_service(self, search_api_client):
+        with self.app.app_context():
+            self._queue(*[(self.service_ids[0], 'index')] * 3)
+
+            assert process_search_index_outbox() == 3
+
+            assert search_api_client.index.call_count == 1
+            assert SearchIndexOutbox.query.count() == 0
+
+    def test_latest_action_for_a_service_is_sent(self, search_api_client):
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'index'), (self.service_ids[0], 'delete'))
+
+            process_search_index_outbox()
+
+            assert not search_api_client.index.called
+            search_api_client.delete.assert_called_once_with(self.service_ids[0])
+
+    def test_services_that_are_no_longer_published_are_not_indexed(self, search_api_client):
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'index'))
+            Service.query.filter(Service.service_id == self.service_ids[0]).update({'status': 'enabled'})
+            db.session.commit()
+
+            process_search_index_outbox()
+
+            assert not search_api_client.index.called
+            assert SearchIndexOutbox.query.count() == 0
+
+    def test_failed_updates_are_retried_later(self, search_api_client):
+        search_api_client.index.side_effect = [HTTPError(), None]
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'index'))
+
+            process_search_index_outbox()
+
+            entry = SearchIndexOutbox.query.one()
+            assert entry.attempts == 1
+            assert entry.last_error
+            assert entry.next_attempt_at > datetime.utcnow() + timedelta(seconds=5)
+
+            # Not due yet
+            assert process_search_index_outbox() == 0
+
+            entry.next_attempt_at = datetime.utcnow()
+            db.session.commit()
+
+            assert process_search_index_outbox() == 1
+            assert search_api_client.index.call_count == 2
+            assert SearchIndexOutbox.query.count() == 0
+
+    def test_later_update_replaces_entry_waiting_to_be_retried(self, search_api_client):
+        search_api_client.index.side_effect = [HTTPError(), None]
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'index'))
+            process_search_index_outbox()
+
+            self._queue((self.service_ids[0], 'index'))
+            process_search_index_outbox()
+
+            assert search_api_client.index.call_count == 2
+            assert SearchIndexOutbox.query.count() == 0
+
+    def test_failed_updates_are_dropped_after_max_attempts(self, search_api_client):
+        search_api_client.delete.side_effect = HTTPError()
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'delete'))
+            SearchIndexOutbox.query.update({'attempts': self.app.config['DM_SEARCH_INDEX_MAX_ATTEMPTS'] - 1})
+            db.session.commit()
+
+            process_search_index_outbox()
+
+            assert search_api_client.delete.called
+            assert SearchIndexOutbox.query.count() == 0
+
+    def test_worker_processes_queue_in_batches_until_empty(self, search_api_client):
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'index'), (self.service_ids[1], 'index'))
+
+            run_search_index_worker(batch_size=1, once=True)
+
+            assert search_api_client.index.call_count == 2
+            assert SearchIndexOutbox.query.count() == 0
+
+    def test_worker_fails_without_api_base_url(self, search_api_client):
+        self.app.config['DM_API_BASE_URL'] = None
+        with self.app.app_context():
+            self._queue((self.service_ids[0], 'index'))
+
+            with pytest.raises(Exception) as e:
+                run_search_index_worker(once=True)
+
+            assert str(e.value) == "No DM_API_BASE_URL provided"
+            assert not search_api_client.index.called
+
+
+class TestRetryDelay(BaseApplicationTest):
+    def test_retry_delay_doubles_after_each_attempt(self):
+        with self.app.app_context():
+            self.app.config['DM_SEARCH_INDEX_RETRY_DELAY'] = 10
+            self.app.config['DM_SEARCH_INDEX_MAX_RETRY_DELAY'] = 3600
+
+            assert [retry_delay(attempts).total_seconds() for attempts in range(1, 5)] == [10, 20, 40, 80]
+
+    def test_retry_delay_is_capped(self):
+        with self.app.app_context():
+            self.app.config['DM_SEARCH_INDEX_RETRY_DELAY'] = 10
+            self.app.config['DM_SEARCH_INDEX_MAX_RETRY_DELAY'] = 60
+
+            assert retry_delay(10).total_seconds() == 60
+
+
+class TestReindexServices(BaseApplicationTest, FixtureMixin):
+    def setup(self):
+        super(TestReindexServices, self).setup()
+        self.setup_dummy_services_including_unpublished(5)
+
+    def _chunks(self, **kwargs):
+        with self.app.app_context():
+            return list(indexable_service_id_chunks(db.get_engine(self.app), **kwargs))
+
+    def test_streams_published_service_ids_in_chunks(self):
+        assert self._chunks(chunk_size=2) == [
+            ['2000000000', '2000000001'], ['2000000002', '2000000003'], ['2000000004']
+        ]
+
+    def test_can_resume_from_a_service_id(self):
+        assert self._chunks(resume_from='2000000002', chunk_size=10) == [['2000000003', '2000000004']]
+
+    @mock.patch('app.search_index.search_api_client')
+    def test_index_service_chunk(self, search_api_client):
+        search_api_client.index.side_effect = [None, HTTPError()]
+
+        with mock.patch('app.search_index._reindex_app', self.app):
+            result = index_service_chunk(['2000000000', '2000000001'])
+
+        assert result == ('2000000001', 1, ['2000000001'])
+        indexed_service_id, indexed_service = search_api_client.index.call_args_list[0][0]
+        assert indexed_service_id == '2000000000'
+        assert indexed_service['links']['self'] == 'http://localhost/services/2000000000'
+
+    def test_reindex_fails_without_api_base_url(self):
+        self.app.config['DM_API_BASE_URL'] = None
+
+        with self.app.app_context(), pytest.raises(Exception) as e:
+            next(reindex_services())
+
+        assert str(e.value) == "No DM_API_BASE_URL provided"
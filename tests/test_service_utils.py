@@ -1,54 +1,60 @@
 import pytest
-import mock
 
 from tests.bases import BaseApplicationTest
-from app.service_utils import index_service
-from app.models import Service, Framework
+from app import db
+from app.service_utils import index_service, delete_service_from_index
+from app.models import Service, Framework, SearchIndexOutbox
 
 
-@mock.patch('app.service_utils.search_api_client')
 class TestIndexServices(BaseApplicationTest):
 
-    def test_live_g_cloud_8_published_service_is_indexed(
-            self, search_api_client, live_g8_framework
-    ):
+    def _queued_updates(self):
+        return [
+            (entry.service_id, entry.action)
+            for entry in db.session.new if isinstance(entry, SearchIndexOutbox)
+        ]
+
+    def test_live_g_cloud_8_published_service_is_queued_for_indexing(self, live_g8_framework):
         with self.app.app_context():
             g8 = Framework.query.filter(Framework.slug == 'g-cloud-8').first()
 
-            with mock.patch.object(Service, "serialize") as serialize_mock:
-                service = Service(status='published', framework=g8)
-                index_service(service)
+            service = Service(service_id='1234567890123456', status='published', framework=g8)
+            index_service(service)
 
-            assert search_api_client.index.called
+            assert self._queued_updates() == [('1234567890123456', 'index')]
 
-    def test_live_g_cloud_8_enabled_service_is_not_indexed(
-            self, search_api_client, live_g8_framework
-    ):
+    def test_live_g_cloud_8_enabled_service_is_not_queued_for_indexing(self, live_g8_framework):
         with self.app.app_context():
             g8 = Framework.query.filter(Framework.slug == 'g-cloud-8').first()
 
-            with mock.patch.object(Service, "serialize") as serialize_mock:
-                service = Service(status='enabled', framework=g8)
-                index_service(service)
+            service = Service(service_id='1234567890123456', status='enabled', framework=g8)
+            index_service(service)
 
-            assert not search_api_client.index.called
+            assert self._queued_updates() == []
 
-    def test_live_dos_published_service_is_not_indexed(self, search_api_client, live_dos_framework):
+    def test_live_dos_published_service_is_not_queued_for_indexing(self, live_dos_framework):
         with self.app.app_context():
             dos = Framework.query.filter(Framework.slug == 'digital-outcomes-and-specialists').first()
 
-            with mock.patch.object(Service, "serialize") as serialize_mock:
-                service = Service(status='published', framework=dos)
-                index_service(service)
+            service = Service(service_id='1234567890123456', status='published', framework=dos)
+            index_service(service)
+
+            assert self._queued_updates() == []
+
+    def test_expired_g_cloud_6_published_service_is_not_queued_for_indexing(self, expired_g6_framework):
+        with self.app.app_context():
+            g6 = Framework.query.filter(Framework.slug == 'g-cloud-6').first()
+
+            service = Service(service_id='1234567890123456', status='published', framework=g6)
+            index_service(service)
 
-            assert not search_api_client.index.called
+            assert self._queued_updates() == []
 
-    def test_expired_g_cloud_6_published_service_is_not_indexed(self, search_api_client, expired_g6_framework):
+    def test_service_is_queued_for_deletion(self, expired_g6_framework):
         with self.app.app_context():
             g6 = Framework.query.filter(Framework.slug == 'g-cloud-6').first()
 
-            with mock.patch.object(Service, "serialize") as serialize_mock:
-                service = Service(status='published', framework=g6)
-                index_service(service)
+            service = Service(service_id='1234567890123456', status='enabled', framework=g6)
+            delete_service_from_index(service)
 
-            assert not search_api_client.index.called
+            assert self._queued_updates() == [('1234567890123456', 'delete')]
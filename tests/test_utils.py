@@ -1,5 +1,9 @@
+from datetime import datetime
+
+import mock
 import pytest
 
+from flask import url_for as flask_url_for
 from nose.tools import assert_equal
 from werkzeug.exceptions import BadRequest, HTTPException
 
@@ -12,13 +16,110 @@ from app.utils import (display_list,
                        json_has_required_keys,
                        link,
                        purge_nulls_from_data,
-                       keyfilter_json)
+                       keyfilter_json,
+                       encode_cursor,
+                       decode_cursor_or_400,
+                       keyset_paginate,
+                       build_link,
+                       url_for)
+from app.models import AuditEvent, Supplier
 
 
 def test_link():
     assert link("self", "/") == {"self": "/"}
 
 
+class Row(object):
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class TestKeysetCursors(object):
+    columns = [AuditEvent.created_at, AuditEvent.id]
+
+    def test_cursor_round_trip(self):
+        created_at = datetime(2017, 2, 1, 12, 30, 45, 123456)
+        cursor = encode_cursor(self.columns, mock.Mock(created_at=created_at, id=1234))
+
+        assert '=' not in cursor
+        assert decode_cursor_or_400(self.columns, cursor) == [created_at, 1234]
+
+    @pytest.mark.parametrize('cursor', [
+        'not-a-cursor',
+        encode_cursor([AuditEvent.id], mock.Mock(id=1)),
+        encode_cursor([AuditEvent.id, AuditEvent.id], mock.Mock(id='1')),
+        u'\u2603',
+    ])
+    def test_invalid_cursors(self, cursor):
+        with pytest.raises(BadRequest):
+            decode_cursor_or_400(self.columns, cursor)
+
+    @pytest.mark.parametrize('columns,values', [
+        ([AuditEvent.created_at, AuditEvent.id], [1486000000, 1]),
+        ([AuditEvent.created_at, AuditEvent.id], ['2017-02-01T12:30:45.123456Z', True]),
+        ([Supplier.name, Supplier.supplier_id], [['Supplier'], 1]),
+        ([Supplier.name, Supplier.supplier_id], [{'name': 'Supplier'}, 1]),
+        ([Supplier.name, Supplier.supplier_id], [1, 1]),
+        ([Supplier.name, Supplier.supplier_id], ['Supplier', '1']),
+    ])
+    def test_cursor_values_of_the_wrong_type(self, columns, values):
+        cursor = encode_cursor(columns, Row(**dict((column.key, value) for column, value in zip(columns, values))))
+
+        with pytest.raises(BadRequest):
+            decode_cursor_or_400(columns, cursor)
+
+    @pytest.mark.parametrize('per_page', [0, -1])
+    def test_keyset_paginate_rejects_page_size_below_one(self, per_page):
+        query = mock.Mock()
+
+        with pytest.raises(BadRequest):
+            keyset_paginate(query, self.columns, '', per_page)
+        assert not query.order_by.called
+
+    def test_string_cursor_values(self):
+        columns = [Supplier.name, Supplier.supplier_id]
+        cursor = encode_cursor(columns, Row(name='Supplier', supplier_id=1))
+
+        assert decode_cursor_or_400(columns, cursor) == ['Supplier', 1]
+
+
+class TestUrlFor(BaseApplicationTest):
+    links = [
+        ('.index', {}),
+        ('.get_service', {'service_id': '1234567890123456'}),
+        ('.get_service', {'service_id': u'caf\xe9 & {tea}/'}),
+        ('.publish_draft_service', {'draft_id': 1234}),
+        ('.get_brief_response', {'brief_response_id': 1}),
+        ('.get_framework', {'framework_slug': 'g-cloud-8'}),
+        ('main.get_supplier', {'supplier_id': 0}),
+    ]
+
+    @pytest.mark.parametrize('base_url', ['http://localhost', 'https://api.example.com:8443/prefix/'])
+    def test_compiled_links_match_flask_url_for(self, base_url):
+        with self.app.test_request_context('/', base_url=base_url):
+            for endpoint, values in self.links:
+                assert build_link(endpoint, values) is not None
+                assert url_for(endpoint, **values) == flask_url_for(endpoint, _external=True, **values)
+
+    def test_links_with_query_string_arguments_are_built_by_flask(self):
+        with self.app.test_request_context('/'):
+            assert build_link('.list_services', {'page': 2}) is None
+            assert url_for('.list_services', page=2) == 'http://localhost/services?page=2'
+
+    def test_links_with_missing_or_none_arguments_are_built_by_flask(self):
+        with self.app.test_request_context('/'):
+            assert build_link('.get_service', {}) is None
+            assert build_link('.get_service', {'service_id': None}) is None
+
+    def test_relative_links_are_built_by_flask(self):
+        with self.app.test_request_context('/'):
+            assert url_for('.get_service', service_id='123', _external=False) == '/services/123'
+
+    def test_links_outside_a_request_are_built_by_flask(self):
+        with self.app.app_context():
+            assert build_link('main.get_service', {'service_id': '123'}) is None
+
+
 class TestJSONHasRequiredKeys(BaseApplicationTest):
     def test_json_has_required_keys(self):
         with self.app.app_context():
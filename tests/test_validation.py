@@ -10,7 +10,8 @@ from jsonschema import validate, SchemaError, ValidationError
 from app.utils import drop_foreign_fields
 from app.validation import validates_against_schema, is_valid_service_id, is_valid_date, \
     is_valid_acknowledged_state, get_validation_errors, is_valid_string, min_price_less_than_max_price, \
-    is_valid_buyer_email, translate_json_schema_errors
+    is_valid_buyer_email, translate_json_schema_errors, get_validator, ValidatorCache, _SCHEMAS, \
+    SchemaRegistry, build_schema_bundle, JSON_SCHEMAS_PATH, BuyerEmailDomains
 from tests.helpers import load_example_listing
 
 
@@ -301,6 +302,101 @@ def test_required_fields_param_requires_specified_fields():
     assert "answer_required" in errs['serviceSummary']
 
 
+def test_get_validator_reuses_validator_instances():
+    assert get_validator("services-g-cloud-7-scs") is get_validator("services-g-cloud-7-scs")
+    assert get_validator("services-g-cloud-7-scs", enforce_required=False, required_fields=['a', 'b']) is \
+        get_validator("services-g-cloud-7-scs", enforce_required=False, required_fields=['b', 'a'])
+
+
+def test_get_validator_caches_strict_and_relaxed_validators_separately():
+    strict = get_validator("services-g-cloud-7-scs")
+    relaxed = get_validator("services-g-cloud-7-scs", enforce_required=False)
+    relaxed_with_fields = get_validator(
+        "services-g-cloud-7-scs", enforce_required=False, required_fields=['serviceSummary'])
+
+    assert strict is not relaxed
+    assert relaxed is not relaxed_with_fields
+    assert relaxed.schema['required'] == []
+    assert relaxed_with_fields.schema['required'] == ['serviceSummary']
+
+
+def test_get_validator_ignores_required_fields_when_enforcing_required():
+    assert get_validator("services-g-cloud-7-scs", required_fields=['serviceSummary']) is \
+        get_validator("services-g-cloud-7-scs")
+
+
+def test_relaxed_validator_does_not_modify_the_loaded_schema():
+    schema_required = list(_SCHEMAS["services-g-cloud-7-scs"]['required'])
+    get_validator("services-g-cloud-7-scs", enforce_required=False, required_fields=['serviceSummary'])
+
+    assert _SCHEMAS["services-g-cloud-7-scs"]['required'] == schema_required
+
+
+class TestSchemaRegistry(object):
+    def test_schemas_are_loaded_on_first_use(self):
+        registry = SchemaRegistry(JSON_SCHEMAS_PATH, ['users', 'users-auth'])
+        assert registry.loaded_schema_names() == set()
+
+        assert registry['users']['title']
+        assert registry.loaded_schema_names() == {'users'}
+
+    def test_unknown_schema_raises_key_error(self):
+        registry = SchemaRegistry(JSON_SCHEMAS_PATH, ['users'])
+        with pytest.raises(KeyError):
+            registry['users-auth']
+
+        assert 'users' in registry
+        assert 'users-auth' not in registry
+
+    def test_preload_loads_all_schemas(self):
+        registry = SchemaRegistry(JSON_SCHEMAS_PATH, ['users', 'users-auth'])
+        registry.preload()
+
+        assert registry.loaded_schema_names() == {'users', 'users-auth'}
+
+    def test_preload_from_bundle_does_not_read_schema_files(self, tmpdir):
+        bundle_path = str(tmpdir.join('schemas.pickle'))
+        build_schema_bundle(bundle_path, schema_names=['users', 'users-auth'])
+
+        registry = SchemaRegistry(str(tmpdir.join('no-schemas-here')), ['users', 'users-auth'])
+        registry.preload(bundle_path)
+
+        assert registry['users'] == _SCHEMAS['users']
+        assert registry['users-auth'] == _SCHEMAS['users-auth']
+
+
+class TestValidatorCache(object):
+    def test_get_only_calls_factory_on_a_miss(self):
+        cache = ValidatorCache(2)
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return object()
+
+        first = cache.get('a', factory)
+        assert cache.get('a', factory) is first
+        assert len(calls) == 1
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ValidatorCache(2)
+        a = cache.get('a', object)
+        cache.get('b', object)
+        cache.get('a', object)
+        cache.get('c', object)
+
+        assert len(cache) == 2
+        assert cache.get('a', object) is a
+        assert cache.get('b', lambda: 'rebuilt') == 'rebuilt'
+
+    def test_clear(self):
+        cache = ValidatorCache(2)
+        cache.get('a', object)
+        cache.clear()
+
+        assert len(cache) == 0
+
+
 def test_additional_properties_has_validation_error():
     data = load_example_listing("G7-SCS")
     data = drop_api_exported_fields_so_that_api_import_will_validate(data)
@@ -739,6 +835,56 @@ def test_is_valid_buyer_email(email, expected):
     assert is_valid_buyer_email(email) == expected
 
 
+class TestBuyerEmailDomains(object):
+    def _domains(self, tmpdir, domains):
+        path = tmpdir.join('buyer-email-domains.txt')
+        path.write('\n'.join(domains) + '\n')
+        return path, BuyerEmailDomains(str(path))
+
+    @pytest.mark.parametrize('email,expected', [
+        ('test@gov.uk', True),
+        ('test@a.b.gov.uk', True),
+        ('test@police.uk', True),
+        ('test@uk', False),
+        ('test@nhs.net', True),
+        ('test@notnhs.net', False),
+        ('test@nhs.net.com', False),
+        ('test@', False),
+    ])
+    def test_is_valid(self, tmpdir, email, expected):
+        path, domains = self._domains(tmpdir, ['gov.uk', 'police.uk', '', 'nhs.net'])
+        assert domains.is_valid(email) == expected
+
+    def test_reloads_when_the_file_changes(self, tmpdir):
+        path, domains = self._domains(tmpdir, ['gov.uk'])
+        assert domains.is_valid('test@gov.uk')
+
+        path.write('nhs.net\n')
+        path.setmtime(path.mtime() + 10)
+        domains._checked_at = 0
+
+        assert domains.is_valid('test@nhs.net')
+        assert not domains.is_valid('test@gov.uk')
+
+    def test_does_not_check_the_file_more_than_once_a_second(self, tmpdir):
+        path, domains = self._domains(tmpdir, ['gov.uk'])
+        assert domains.is_valid('test@gov.uk')
+
+        path.write('nhs.net\n')
+        path.setmtime(path.mtime() + 10)
+
+        assert domains.is_valid('test@gov.uk')
+
+    def test_keeps_the_loaded_domains_if_the_file_is_missing(self, tmpdir):
+        path, domains = self._domains(tmpdir, ['gov.uk'])
+        assert domains.is_valid('test@gov.uk')
+
+        path.remove()
+        domains._checked_at = 0
+
+        assert domains.is_valid('test@gov.uk')
+
+
 def api_error(errors):
     schema_errors = []
     for error_data in errors: